@@ -0,0 +1,6 @@
+"""Code shared by the capstone projects.
+
+Each capstone's ``agents`` package puts ``capstone-projects/`` on the
+import path, so the starter code can import ``capstone_common`` when run
+from its own directory.
+"""
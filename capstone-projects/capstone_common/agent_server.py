@@ -0,0 +1,670 @@
+"""Multi-Session Agent Server.
+
+Serves many users and sessions at once over one shared runner and agent
+graph. Each capstone's ``server.py`` subclasses ``AgentServer`` with its
+own agent, shortcuts and background services; run it with
+``python server.py``. It listens on AGENT_SERVER_HOST and AGENT_SERVER_PORT
+(default 127.0.0.1:8765). ``main.py`` runs the same server in-process, and
+its REPL is just one client of it.
+
+The protocol is line-delimited JSON over TCP, one object per line:
+
+    {"op": "open", "user_id": "alice"}
+        -> {"event": "session", "user_id": "alice", "session_id": "..."}
+    {"op": "send", "id": 1, "user_id": "alice", "session_id": "...",
+     "text": "Hello"}
+        -> {"event": "text", "id": 1, "text": "..."}   (streamed chunks)
+        -> {"event": "done", "id": 1, "metrics": {...}}
+           or {"event": "error", "id": 1, "message": "..."}
+    {"op": "close", "user_id": "alice", "session_id": "..."}
+        -> {"event": "closed", "session_id": "..."}
+    {"op": "stats"}
+        -> {"event": "stats", ...}
+
+Requests on one connection are handled concurrently, so a client can have
+turns in flight on several sessions; replies carry the request's id.
+Turns in the same session run one at a time in the order they arrived.
+At most AGENT_MAX_CONCURRENCY turns (default 8) run at once across all
+sessions; the rest wait their turn. A session opened over a connection is
+closed when the last connection that opened it disconnects.
+
+Replies are streamed: the runner uses SSE streaming mode and partial text
+is forwarded the moment the model produces it (AGENT_STREAMING=0 sends
+each reply whole). Every turn records its queue wait, time to first token,
+total latency, sub-agent transfers and tool calls; ``run_turn`` returns
+them and ``done`` carries them.
+
+Events pushed to a user with ``push()`` go to every connection to this
+process that opened a session for that user.
+
+Clients are not authenticated: the ``user_id`` of every request is taken
+on trust. Any client can open a session as any user, which also
+subscribes it to that user's pushed events, and can use or close a
+session whose id it knows. Keep the server on localhost (the default) or
+behind a proxy that authenticates users and sets ``user_id`` itself.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import new_invocation_context_id
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from .models import CassetteLlm, cassette_session, requires_api_key
+
+logger = logging.getLogger(__name__)
+
+# Longest request line accepted from a client
+MAX_LINE_BYTES = 1 << 20
+
+# Function call the model makes to hand off to a sub-agent
+TRANSFER_TOOL = "transfer_to_agent"
+
+# Turns kept for the latency percentiles in stats()
+RECENT_TURNS = 1000
+
+Emit = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class SessionNotFound(LookupError):
+    """Raised for a (user_id, session_id) that has not been opened."""
+
+
+@dataclass
+class TurnMetrics:
+    """Timings (milliseconds from the message's arrival) and activity of one turn."""
+    queue_ms: float = 0.0
+    first_token_ms: Optional[float] = None
+    total_ms: float = 0.0
+    transfers: int = 0
+    tool_calls: int = 0
+    chunks: int = 0
+    # What answered the turn without running the agent, if anything
+    shortcut: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        metrics = asdict(self)
+        for key in ("queue_ms", "first_token_ms", "total_ms"):
+            if metrics[key] is not None:
+                metrics[key] = round(metrics[key], 1)
+        return metrics
+
+    def summary(self) -> str:
+        """One-line timing footer for the console."""
+        first = "-" if self.first_token_ms is None else f"{self.first_token_ms:.0f} ms"
+        parts = [f"first token {first}", f"total {self.total_ms:.0f} ms"]
+        if self.queue_ms >= 1:
+            parts.append(f"queued {self.queue_ms:.0f} ms")
+        parts.append(f"transfers {self.transfers}")
+        parts.append(f"tool calls {self.tool_calls}")
+        if self.shortcut:
+            parts.append(self.shortcut)
+        return " · ".join(parts)
+
+
+@dataclass
+class AgentTurn:
+    """What the agent did to answer one message."""
+    user_id: str
+    session_id: str
+    text: str
+    reply: str
+    # Tools called, agent transfers excluded
+    tools: Set[str]
+    # Agents that produced events
+    agents: Set[str]
+    # False if the turn failed or was cancelled before the agent finished
+    completed: bool = True
+
+
+def _reply_text(event: Event) -> List[str]:
+    """Get the text parts of an event, leaving out model thoughts."""
+    if not event.content or not event.content.parts:
+        return []
+    return [part.text for part in event.content.parts if part.text and not part.thought]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class AgentServer:
+    """
+    Multiplexes concurrent users and sessions over one agent runner.
+
+    Subclasses add a capstone's behavior by overriding the hooks:
+    ``start``/``close`` for background services, ``answer_directly`` to
+    answer a message without the agent (named by ``SHORTCUT`` in the turn
+    metrics), ``turn_completed`` to see what the agent did, and
+    ``session_closed`` to drop per-session state.
+
+    Args:
+        agent: Root agent shared by every session
+        max_concurrency: Maximum turns running at once
+        streaming: Forward partial text as the model produces it
+    """
+
+    # Name reported in TurnMetrics.shortcut for answer_directly replies
+    SHORTCUT = "shortcut"
+
+    def __init__(
+        self,
+        agent: BaseAgent,
+        max_concurrency: int = 8,
+        streaming: bool = True
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.agent = agent
+        self.runner = InMemoryRunner(agent=agent)
+        self.max_concurrency = max_concurrency
+        self.run_config = RunConfig(
+            streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE
+        )
+
+        # One lock per session: asyncio.Lock wakes waiters in FIFO order,
+        # so a session's turns run in arrival order
+        self._sessions: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # Number of open connections that opened each session
+        self._connections: Dict[Tuple[str, str], int] = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._listeners: Dict[str, List[Emit]] = {}
+        self._background: List[asyncio.Task] = []
+
+        self.turns = 0
+        self.errors = 0
+        self.active = 0
+        self.waiting = 0
+        self.peak_active = 0
+        self._recent: Deque[TurnMetrics] = deque(maxlen=RECENT_TURNS)
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Start background services. Subclasses add theirs to ``_background``."""
+
+    async def close(self) -> None:
+        """Stop background services and close every open session."""
+        for task in self._background:
+            task.cancel()
+        self._background.clear()
+        for user_id, session_id in list(self._sessions):
+            try:
+                await self.close_session(user_id, session_id)
+            except SessionNotFound:
+                pass
+
+    # -------------------------------------------------------------------------
+    # Sessions
+    # -------------------------------------------------------------------------
+
+    async def open_session(self, user_id: str, session_id: Optional[str] = None) -> str:
+        """
+        Open a session for a user, or rejoin an open one.
+
+        Args:
+            user_id: The user's identifier
+            session_id: Existing session to rejoin (default: a new session)
+
+        Returns:
+            The session id
+        """
+        if session_id is not None and (user_id, session_id) in self._sessions:
+            return session_id
+
+        session = await self.runner.session_service.create_session(
+            app_name=self.runner.app_name,
+            user_id=user_id,
+            session_id=session_id
+        )
+        self._sessions[(user_id, session.id)] = asyncio.Lock()
+        return session.id
+
+    async def close_session(self, user_id: str, session_id: str) -> None:
+        """Close a session after its queued turns have finished."""
+        lock = self._lock_for(user_id, session_id)
+        async with lock:
+            if self._sessions.pop((user_id, session_id), None) is None:
+                # Closed by another request while this one waited
+                return
+            self._connections.pop((user_id, session_id), None)
+            if isinstance(self.agent.model, CassetteLlm):
+                self.agent.model.end_session(session_id)
+            self.session_closed(user_id, session_id)
+            await self.runner.session_service.delete_session(
+                app_name=self.runner.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+
+    def session_closed(self, user_id: str, session_id: str) -> None:
+        """Hook: drop any state kept for a closed session."""
+
+    def _lock_for(self, user_id: str, session_id: str) -> asyncio.Lock:
+        try:
+            return self._sessions[(user_id, session_id)]
+        except KeyError:
+            raise SessionNotFound(f"No open session {session_id!r} for user {user_id!r}")
+
+    # -------------------------------------------------------------------------
+    # Turns
+    # -------------------------------------------------------------------------
+
+    async def run_turn(
+        self,
+        user_id: str,
+        session_id: str,
+        text: str,
+        emit: Emit
+    ) -> TurnMetrics:
+        """
+        Run one user message through the agent.
+
+        Waits for the session's earlier turns and for a free concurrency
+        slot, then passes the reply to ``emit`` as it is produced, in
+        ``{"event": "text", "text": ...}`` chunks.
+
+        Args:
+            user_id: The user's identifier
+            session_id: An open session of the user
+            text: The user's message
+            emit: Coroutine called with each reply event
+
+        Returns:
+            The turn's latency and activity metrics
+
+        Raises:
+            SessionNotFound: If the session is not open
+        """
+        arrived = time.perf_counter()
+        metrics = TurnMetrics()
+        lock = self._lock_for(user_id, session_id)
+
+        self.waiting += 1
+        admitted = False
+        try:
+            async with lock:
+                # The session may have been closed while this turn waited
+                self._lock_for(user_id, session_id)
+                async with self._slots:
+                    self.waiting -= 1
+                    admitted = True
+                    self.active += 1
+                    self.peak_active = max(self.peak_active, self.active)
+                    metrics.queue_ms = (time.perf_counter() - arrived) * 1000
+                    try:
+                        with cassette_session(session_id):
+                            await self._run(user_id, session_id, text, emit, metrics, arrived)
+                    except Exception:
+                        self.errors += 1
+                        raise
+                    finally:
+                        self.active -= 1
+                        self.turns += 1
+                        metrics.total_ms = (time.perf_counter() - arrived) * 1000
+                        self._recent.append(metrics)
+        finally:
+            if not admitted:
+                self.waiting -= 1
+        return metrics
+
+    async def answer_directly(self, user_id: str, session_id: str, text: str) -> Optional[str]:
+        """
+        Hook: answer a message without running the agent.
+
+        The message and reply are added to the session's history, so the
+        agent sees them in later turns.
+
+        Returns:
+            The reply, or None to run the agent
+        """
+        return None
+
+    def turn_completed(self, turn: AgentTurn) -> None:
+        """Hook: called after the agent has run for a message (see ``completed``)."""
+
+    async def _run(
+        self,
+        user_id: str,
+        session_id: str,
+        text: str,
+        emit: Emit,
+        metrics: TurnMetrics,
+        arrived: float
+    ) -> None:
+        async def send_text(chunk: str) -> None:
+            if metrics.first_token_ms is None:
+                metrics.first_token_ms = (time.perf_counter() - arrived) * 1000
+            metrics.chunks += 1
+            await emit({"event": "text", "text": chunk})
+
+        reply = await self.answer_directly(user_id, session_id, text)
+        if reply is not None:
+            metrics.shortcut = self.SHORTCUT
+            await send_text(reply)
+            await self._add_to_history(user_id, session_id, text, reply)
+            return
+
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        streamed = False
+        reply_parts: List[str] = []
+        tools: Set[str] = set()
+        agents: Set[str] = set()
+        completed = False
+        try:
+            async for event in self.runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=message,
+                run_config=self.run_config
+            ):
+                if event.author and event.author != "user":
+                    agents.add(event.author)
+                if event.partial:
+                    for chunk in _reply_text(event):
+                        streamed = True
+                        reply_parts.append(chunk)
+                        await send_text(chunk)
+                    continue
+
+                # Agent transfers are function calls too; count them separately
+                for call in event.get_function_calls():
+                    if call.name != TRANSFER_TOOL:
+                        metrics.tool_calls += 1
+                        tools.add(call.name)
+                if event.actions and event.actions.transfer_to_agent:
+                    metrics.transfers += 1
+
+                # A final event after partial ones repeats the text already sent
+                if streamed:
+                    streamed = False
+                    continue
+                for chunk in _reply_text(event):
+                    reply_parts.append(chunk)
+                    await send_text(chunk)
+            completed = True
+        finally:
+            # Also reported for a failed turn: its tools may have run
+            self.turn_completed(AgentTurn(
+                user_id, session_id, text, "".join(reply_parts), tools, agents, completed
+            ))
+
+    async def _add_to_history(self, user_id: str, session_id: str, text: str, reply: str) -> None:
+        """Append a message answered without the agent to the session's events."""
+        session = await self.runner.session_service.get_session(
+            app_name=self.runner.app_name,
+            user_id=user_id,
+            session_id=session_id
+        )
+        if session is None:
+            return
+
+        invocation_id = new_invocation_context_id()
+        for author, role, part in (("user", "user", text), (self.agent.name, "model", reply)):
+            await self.runner.session_service.append_event(session, Event(
+                invocation_id=invocation_id,
+                author=author,
+                content=types.Content(role=role, parts=[types.Part(text=part)])
+            ))
+
+    # -------------------------------------------------------------------------
+    # Push notifications
+    # -------------------------------------------------------------------------
+
+    def add_listener(self, user_id: str, emit: Emit) -> None:
+        """Receive events pushed to a user."""
+        self._listeners.setdefault(user_id, []).append(emit)
+
+    def remove_listener(self, user_id: str, emit: Emit) -> None:
+        """Stop receiving a user's pushed events."""
+        listeners = self._listeners.get(user_id, [])
+        if emit in listeners:
+            listeners.remove(emit)
+        if not listeners:
+            self._listeners.pop(user_id, None)
+
+    async def push(self, user_id: str, event: Dict[str, Any]) -> int:
+        """
+        Send an event to every client listening for a user.
+
+        Only clients connected to this server process are reached.
+
+        Returns:
+            Number of clients the event was sent to
+        """
+        sent = 0
+        for emit in list(self._listeners.get(user_id, [])):
+            try:
+                await emit(event)
+                sent += 1
+            except Exception:
+                logger.exception("Failed to push %s event to %s", event.get("event"), user_id)
+        return sent
+
+    # -------------------------------------------------------------------------
+    # Network protocol
+    # -------------------------------------------------------------------------
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """
+        Start accepting client connections.
+
+        Returns:
+            The listening server (close it to stop accepting)
+        """
+        return await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_LINE_BYTES
+        )
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve one client connection until it disconnects."""
+        write_lock = asyncio.Lock()
+        # Sessions opened over this connection
+        opened: Set[Tuple[str, str]] = set()
+        tasks: Set[asyncio.Task] = set()
+
+        async def send(event: Dict[str, Any]) -> None:
+            async with write_lock:
+                writer.write(json.dumps(event, default=str).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await send({"event": "error", "message": "Request line too long"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    await send({"event": "error", "message": "Requests must be JSON objects"})
+                    continue
+
+                # Tasks start in arrival order and queue on the session lock
+                # before yielding, so per-session order is preserved
+                task = asyncio.get_running_loop().create_task(
+                    self._handle_request(request, send, opened)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            await self._disconnect(opened, send)
+
+    async def _disconnect(self, opened: Set[Tuple[str, str]], send: Emit) -> None:
+        """Release a closed connection's sessions and listeners."""
+        for user_id in {user_id for user_id, _ in opened}:
+            self.remove_listener(user_id, send)
+        for key in opened:
+            remaining = self._connections.get(key, 0) - 1
+            if remaining > 0:
+                self._connections[key] = remaining
+                continue
+            self._connections.pop(key, None)
+            try:
+                await self.close_session(*key)
+            except SessionNotFound:
+                pass
+            except Exception:
+                logger.exception("Failed to close session %s of %s", key[1], key[0])
+
+    async def _handle_request(
+        self,
+        request: Dict[str, Any],
+        send: Emit,
+        opened: Set[Tuple[str, str]]
+    ) -> None:
+        request_id = request.get("id")
+        op = request.get("op")
+
+        async def emit(event: Dict[str, Any]) -> None:
+            await send({**event, "id": request_id})
+
+        try:
+            if op == "stats":
+                await emit({"event": "stats", **self.stats()})
+                return
+
+            user_id = request.get("user_id")
+            if not isinstance(user_id, str) or not user_id:
+                raise ValueError("user_id is required")
+
+            if op == "open":
+                session_id = await self.open_session(user_id, request.get("session_id"))
+                key = (user_id, session_id)
+                if key not in opened:
+                    if not any(user == user_id for user, _ in opened):
+                        self.add_listener(user_id, send)
+                    opened.add(key)
+                    self._connections[key] = self._connections.get(key, 0) + 1
+                await emit({"event": "session", "user_id": user_id, "session_id": session_id})
+            elif op == "send":
+                text = request.get("text")
+                if not isinstance(text, str) or not text.strip():
+                    raise ValueError("text is required")
+                metrics = await self.run_turn(
+                    user_id, request.get("session_id"), text.strip(), emit
+                )
+                await emit({"event": "done", "metrics": metrics.to_dict()})
+            elif op == "close":
+                session_id = request.get("session_id")
+                await self.close_session(user_id, session_id)
+                opened.discard((user_id, session_id))
+                await emit({"event": "closed", "session_id": session_id})
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+        except asyncio.CancelledError:
+            raise
+        except (ValueError, SessionNotFound) as e:
+            await emit({"event": "error", "message": str(e)})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.exception("Request %r failed", request_id)
+            await emit({"event": "error", "message": str(e)})
+
+    def _latency(self) -> Dict[str, Any]:
+        """Summarize the metrics of the last RECENT_TURNS turns."""
+        recent = list(self._recent)
+        if not recent:
+            return {}
+        first_token = sorted(m.first_token_ms for m in recent if m.first_token_ms is not None)
+        total = sorted(m.total_ms for m in recent)
+        latency = {
+            "avg_turn_ms": round(sum(total) / len(total), 1),
+            "p95_turn_ms": round(_percentile(total, 95), 1),
+            "avg_transfers": round(sum(m.transfers for m in recent) / len(recent), 2),
+            "avg_tool_calls": round(sum(m.tool_calls for m in recent) / len(recent), 2),
+        }
+        if first_token:
+            latency["avg_first_token_ms"] = round(sum(first_token) / len(first_token), 1)
+            latency["p95_first_token_ms"] = round(_percentile(first_token, 95), 1)
+        return latency
+
+    def stats(self) -> Dict[str, Any]:
+        """Return session, concurrency and latency counters."""
+        stats = {
+            "sessions": len(self._sessions),
+            "connected_users": len(self._listeners),
+            "max_concurrency": self.max_concurrency,
+            "active_turns": self.active,
+            "waiting_turns": self.waiting,
+            "peak_active_turns": self.peak_active,
+            "turns": self.turns,
+            "errors": self.errors,
+            **self._latency(),
+        }
+        if isinstance(self.agent.model, CassetteLlm):
+            stats["model"] = self.agent.model.stats()
+        return stats
+
+
+def server_options() -> Dict[str, Any]:
+    """Read the AGENT_MAX_CONCURRENCY and AGENT_STREAMING settings."""
+    return {
+        "max_concurrency": int(os.environ.get("AGENT_MAX_CONCURRENCY", 8)),
+        "streaming": os.environ.get("AGENT_STREAMING", "1") != "0",
+    }
+
+
+async def serve_until_interrupted(server: AgentServer) -> None:
+    """Start a server and serve clients until cancelled, then close it."""
+    await server.start()
+
+    host = os.environ.get("AGENT_SERVER_HOST", "127.0.0.1")
+    port = int(os.environ.get("AGENT_SERVER_PORT", 8765))
+    listener = await server.serve(host, port)
+    print(f"✅ '{server.agent.name}' serving on {host}:{port} "
+          f"(max {server.max_concurrency} concurrent turns)")
+
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def run_server(create_server: Callable[[], AgentServer]) -> None:
+    """Command-line entry point: check the API key, then serve until Ctrl+C."""
+    load_dotenv()
+    if requires_api_key() and not os.environ.get("GOOGLE_API_KEY"):
+        raise ValueError(
+            "Please set GOOGLE_API_KEY environment variable "
+            "(or AGENT_MODEL_MODE=replay to run offline)"
+        )
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve_until_interrupted(create_server()))
+    except KeyboardInterrupt:
+        pass
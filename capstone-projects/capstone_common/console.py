@@ -0,0 +1,25 @@
+"""Console Input.
+
+Helpers for the capstones' interactive ``main.py`` REPLs.
+"""
+
+import asyncio
+import threading
+
+
+async def read_input(prompt: str) -> str:
+    """Read a line from stdin without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+
+    def read():
+        try:
+            result = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(lambda: line.done() or line.set_exception(e))
+        else:
+            loop.call_soon_threadsafe(lambda: line.done() or line.set_result(result))
+
+    # A daemon thread, so Ctrl+C can exit while it waits for input
+    threading.Thread(target=read, daemon=True).start()
+    return await line
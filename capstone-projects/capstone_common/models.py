@@ -0,0 +1,421 @@
+"""Model Selection and Record/Replay Cassettes.
+
+Every agent gets its model from ``get_model()``, which is controlled by
+AGENT_MODEL_MODE:
+
+    live    (default) the Gemini model named by AGENT_MODEL
+            (default gemini-2.0-flash)
+    record  the live model, with every request/response pair appended to
+            the cassette file
+    replay  responses served from the cassette; no network access and no
+            GOOGLE_API_KEY needed
+
+The cassette (AGENT_CASSETTE, default ``cassettes/model_cassette.jsonl``)
+is JSON Lines: a version header, then one interaction per line, appended as
+it is recorded. It can be committed and used by CI. Requests are matched on
+their model, system instruction, tools and conversation. Tool results are
+part of the conversation, but tools such as live rates or simulated search
+results return different data on every run, so a request whose tool results
+differ falls back to a match on everything else. Repeated requests replay
+their recorded responses in order, then start over; each session (see
+``cassette_session``) keeps its own position, so concurrent conversations
+don't take each other's responses.
+
+Replay latency is synthetic: REPLAY_LATENCY_MS before the first response
+(or "recorded" to reuse each response's recorded latency), and
+REPLAY_CHUNK_MS between streamed chunks. In streaming mode the recorded
+text is replayed a few words per chunk.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional, Tuple, Union
+
+from google.adk.models import BaseLlm, LLMRegistry, LlmCapabilities, LlmRequest, LlmResponse
+from google.genai import types
+from pydantic import PrivateAttr
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+MODEL_MODES = ("live", "record", "replay")
+
+# Words per synthetic chunk when replaying in streaming mode
+WORDS_PER_CHUNK = 4
+
+CASSETTE_VERSION = 2
+
+# Session whose replay position model requests use (see cassette_session)
+_session: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar(
+    "cassette_session", default=None
+)
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request the cassette has no response for."""
+
+
+def _request_keys(llm_request: LlmRequest) -> Tuple[str, str]:
+    """
+    Fingerprint a model request.
+
+    Returns:
+        Tuple of (exact key, loose key); the loose key leaves out tool
+        results, which may change from run to run
+    """
+    contents = []
+    for content in llm_request.contents or []:
+        parts = []
+        for part in content.parts or []:
+            if part.thought:
+                continue
+            if part.text is not None:
+                parts.append({"text": part.text})
+            elif part.function_call:
+                # Call ids are generated per run, so only name and args count
+                parts.append({"call": part.function_call.name, "args": part.function_call.args})
+            elif part.function_response:
+                parts.append({
+                    "response": part.function_response.name,
+                    "result": part.function_response.response,
+                })
+        contents.append({"role": content.role, "parts": parts})
+
+    config = llm_request.config
+    system = config.system_instruction if config else None
+    if isinstance(system, types.Content):
+        system = [part.text for part in system.parts or []]
+
+    request = {
+        "model": llm_request.model,
+        "system": system,
+        "tools": sorted(llm_request.tools_dict),
+        "contents": contents,
+    }
+    exact = json.dumps(request, sort_keys=True, default=str)
+
+    for content in contents:
+        for part in content["parts"]:
+            part.pop("result", None)
+    loose = json.dumps(request, sort_keys=True, default=str)
+
+    return (
+        hashlib.sha256(exact.encode()).hexdigest()[:24],
+        hashlib.sha256(loose.encode()).hexdigest()[:24],
+    )
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    """Get the latest user text of a request, to make cassettes readable."""
+    for content in reversed(llm_request.contents or []):
+        if content.role == "user":
+            for part in content.parts or []:
+                if part.text:
+                    return part.text[:200]
+    return ""
+
+
+@contextmanager
+def cassette_session(session_id: str) -> Iterator[None]:
+    """
+    Replay the model requests made inside the block at the session's own
+    position in the cassette.
+
+    Args:
+        session_id: The conversation's session id
+    """
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class Cassette:
+    """
+    Recorded model interactions, indexed for replay.
+
+    Args:
+        path: JSON Lines cassette file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.interactions: List[Dict[str, Any]] = []
+        self._exact: Dict[str, List[Dict[str, Any]]] = {}
+        self._loose: Dict[str, List[Dict[str, Any]]] = {}
+        # Session -> next position per request key
+        self._cursors: Dict[Optional[str], Dict[str, int]] = {}
+
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+            header = json.loads(lines[0]) if lines else {"version": CASSETTE_VERSION}
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version in {path}: {header.get('version')}")
+            for number, line in enumerate(lines[1:], start=2):
+                try:
+                    self._index(json.loads(line))
+                except ValueError:
+                    # A recording cut off mid-line leaves a partial last line
+                    if number != len(lines):
+                        raise ValueError(f"Corrupt cassette line {number} in {path}") from None
+
+    def _index(self, interaction: Dict[str, Any]) -> None:
+        self.interactions.append(interaction)
+        self._exact.setdefault(interaction["key"], []).append(interaction)
+        self._loose.setdefault(interaction["loose_key"], []).append(interaction)
+
+    @property
+    def capabilities(self) -> Optional[Dict[str, Any]]:
+        """Capabilities of the model the latest interaction was recorded from."""
+        for interaction in reversed(self.interactions):
+            if "capabilities" in interaction:
+                return interaction["capabilities"]
+        return None
+
+    def find(
+        self,
+        key: str,
+        loose_key: str,
+        session: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the session's next recorded interaction for a request.
+
+        Returns:
+            The interaction, or None if the request was never recorded
+        """
+        cursors = self._cursors.setdefault(session, {})
+        for cursor_key, candidates in (("=" + key, self._exact.get(key)),
+                                       ("~" + loose_key, self._loose.get(loose_key))):
+            if candidates:
+                position = cursors.get(cursor_key, 0)
+                cursors[cursor_key] = position + 1
+                return candidates[position % len(candidates)]
+        return None
+
+    def end_session(self, session: str) -> None:
+        """Forget a session's replay positions."""
+        self._cursors.pop(session, None)
+
+    def add(self, interaction: Dict[str, Any]) -> None:
+        """Record an interaction and append it to the cassette file."""
+        self._index(interaction)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            lines = json.dumps(interaction) + "\n"
+            if f.tell() == 0:
+                lines = json.dumps({"version": CASSETTE_VERSION}) + "\n" + lines
+            # One write per interaction, so appends from concurrent
+            # recorders don't interleave
+            f.write(lines)
+
+
+class CassetteLlm(BaseLlm):
+    """
+    Drop-in model that records live responses or replays recorded ones.
+
+    Args:
+        model: Name of the live model requests are recorded from
+        cassette_path: JSON Lines cassette file
+        mode: "record" or "replay"
+        latency_ms: Delay before the first response, or None for the
+            recorded latency
+        chunk_ms: Delay between streamed chunks
+    """
+
+    cassette_path: str
+    mode: str = "replay"
+    latency_ms: Optional[float] = 0.0
+    chunk_ms: float = 0.0
+
+    _cassette: Optional[Cassette] = PrivateAttr(default=None)
+    _live: Optional[BaseLlm] = PrivateAttr(default=None)
+    _stats: Dict[str, int] = PrivateAttr(default_factory=lambda: {
+        "recorded": 0, "replayed": 0, "loose_matches": 0, "misses": 0,
+    })
+
+    @property
+    def cassette(self) -> Cassette:
+        if self._cassette is None:
+            self._cassette = Cassette(self.cassette_path)
+        return self._cassette
+
+    def _live_model(self) -> BaseLlm:
+        if self._live is None:
+            self._live = LLMRegistry.new_llm(self.model)
+        return self._live
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        # Agents should behave exactly as with the live model. Replay reuses
+        # the recorded capabilities, so it never creates a live client.
+        if self.mode == "record":
+            return self._live_model().capabilities
+        recorded = self.cassette.capabilities
+        return LlmCapabilities(**recorded) if recorded else LlmCapabilities()
+
+    def end_session(self, session_id: str) -> None:
+        """Forget a closed session's replay positions."""
+        if self._cassette is not None:
+            self._cassette.end_session(session_id)
+
+    async def generate_content_async(
+        self,
+        llm_request: LlmRequest,
+        stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.mode == "record":
+            async for response in self._record(llm_request, stream):
+                yield response
+        else:
+            async for response in self._replay(llm_request, stream):
+                yield response
+
+    async def _record(
+        self,
+        llm_request: LlmRequest,
+        stream: bool
+    ) -> AsyncGenerator[LlmResponse, None]:
+        key, loose_key = _request_keys(llm_request)
+        started = time.perf_counter()
+        first_response_ms = None
+        responses = []
+
+        try:
+            async for response in self._live_model().generate_content_async(llm_request, stream):
+                if first_response_ms is None:
+                    first_response_ms = (time.perf_counter() - started) * 1000
+                if not response.partial:
+                    # Serialized before yielding: the runner edits responses
+                    # (e.g. adds function call ids) after receiving them
+                    responses.append(response.model_dump(mode="json", exclude_none=True))
+                yield response
+        finally:
+            # The runner may stop reading once it has the final response, so
+            # the interaction is saved even when the generator is closed early
+            if responses:
+                self.cassette.add({
+                    "key": key,
+                    "loose_key": loose_key,
+                    "model": self.model,
+                    "user_text": _last_user_text(llm_request),
+                    "first_response_ms": round(first_response_ms or 0.0, 1),
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "capabilities": self._live_model().capabilities.model_dump(),
+                    "responses": responses,
+                })
+                self._stats["recorded"] += 1
+
+    async def _replay(
+        self,
+        llm_request: LlmRequest,
+        stream: bool
+    ) -> AsyncGenerator[LlmResponse, None]:
+        key, loose_key = _request_keys(llm_request)
+        interaction = self.cassette.find(key, loose_key, _session.get())
+        if interaction is None:
+            self._stats["misses"] += 1
+            raise CassetteMiss(
+                f"No recorded response in {self.cassette_path} for request "
+                f"{key} ({_last_user_text(llm_request)!r}); record it with "
+                "AGENT_MODEL_MODE=record"
+            )
+        self._stats["replayed"] += 1
+        if interaction["key"] != key:
+            self._stats["loose_matches"] += 1
+
+        if self.latency_ms is None:
+            first_ms = interaction["first_response_ms"]
+            chunk_ms = max(interaction["total_ms"] - first_ms, 0.0)
+        else:
+            first_ms, chunk_ms = self.latency_ms, self.chunk_ms
+        await asyncio.sleep(first_ms / 1000)
+
+        for data in interaction["responses"]:
+            response = LlmResponse.model_validate(data)
+            if stream:
+                chunks = self._chunks(response)
+                # Recorded latency is spread over the turn's chunks
+                delay = chunk_ms / max(len(chunks), 1) if self.latency_ms is None else chunk_ms
+                for index, chunk in enumerate(chunks):
+                    if index:
+                        await asyncio.sleep(delay / 1000)
+                    yield LlmResponse(
+                        content=types.Content(role="model", parts=[types.Part(text=chunk)]),
+                        partial=True
+                    )
+            yield response
+
+    @staticmethod
+    def _chunks(response: LlmResponse) -> List[str]:
+        """Split a response's text into a few words per chunk."""
+        if not response.content or not response.content.parts:
+            return []
+        text = "".join(
+            part.text for part in response.content.parts if part.text and not part.thought
+        )
+        words = re.findall(r"\S+\s*|\s+", text)
+        return [
+            "".join(words[i:i + WORDS_PER_CHUNK])
+            for i in range(0, len(words), WORDS_PER_CHUNK)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return record/replay counters."""
+        return {
+            "mode": self.mode,
+            "cassette": self.cassette_path,
+            "interactions": len(self.cassette.interactions),
+            **self._stats,
+        }
+
+
+_model: Optional[Union[str, CassetteLlm]] = None
+
+
+def model_mode() -> str:
+    """Get the model mode from AGENT_MODEL_MODE."""
+    mode = os.environ.get("AGENT_MODEL_MODE", "live").lower()
+    if mode not in MODEL_MODES:
+        raise ValueError(f"AGENT_MODEL_MODE must be one of {', '.join(MODEL_MODES)}: {mode!r}")
+    return mode
+
+
+def requires_api_key() -> bool:
+    """Whether the selected model mode calls the live API."""
+    return model_mode() != "replay"
+
+
+def get_model() -> Union[str, CassetteLlm]:
+    """
+    Get the model for an agent.
+
+    Returns:
+        The live model name, or the process-wide cassette model when
+        recording or replaying (shared so every agent uses one cassette)
+    """
+    global _model
+    if _model is None:
+        name = os.environ.get("AGENT_MODEL", DEFAULT_MODEL)
+        mode = model_mode()
+        if mode == "live":
+            _model = name
+        else:
+            latency = os.environ.get("REPLAY_LATENCY_MS", "0")
+            _model = CassetteLlm(
+                model=name,
+                cassette_path=os.environ.get(
+                    "AGENT_CASSETTE", os.path.join("cassettes", "model_cassette.jsonl")
+                ),
+                mode=mode,
+                latency_ms=None if latency == "recorded" else float(latency),
+                chunk_ms=float(os.environ.get("REPLAY_CHUNK_MS", 0))
+            )
+    return _model
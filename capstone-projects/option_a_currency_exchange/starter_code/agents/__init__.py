@@ -1,5 +1,13 @@
 """Currency Exchange Agents Package."""
 
+import os
+import sys
+
+# capstone-projects/, home of the shared capstone_common package
+_CAPSTONES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if _CAPSTONES_DIR not in sys.path:
+    sys.path.append(_CAPSTONES_DIR)
+
 from .rate_agent import create_rate_agent
 from .conversion_agent import create_conversion_agent
 from .history_agent import create_history_agent
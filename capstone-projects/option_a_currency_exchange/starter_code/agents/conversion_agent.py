@@ -6,9 +6,22 @@ TODO: Complete the implementation.
 """
 
 from google.adk.agents import Agent
-from google.adk.tools import FunctionTool
-from typing import Dict, Any, Optional
-import httpx
+from google.adk.tools import BaseTool, FunctionTool, ToolContext
+from typing import Dict, Any, List, Optional
+import asyncio
+import os
+
+import numpy as np
+
+from tools import format_amount, get_currency_decimals
+from tools.currency_catalog import check_currencies
+from tools.history_writer import get_history_writer
+from tools.ledger import convert_ledger_file, resolve_ledger_path
+from tools.rate_cache import normalize_pair
+from tools.rate_engine import RateFetchError, check_date, get_rate_engine
+from tools.routing import RoutingTable, get_route_planner
+
+from .models import get_model
 
 
 async def convert_currency(
@@ -32,6 +45,8 @@ async def convert_currency(
         - target_currency: Target currency code
         - converted_amount: The converted amount
         - rate: The exchange rate used
+        - date: Date of the rate snapshot
+        - stale: True if newer rates may exist but couldn't be fetched yet
         - message: Error message if status is 'error'
     """
     # Input validation
@@ -41,43 +56,39 @@ async def convert_currency(
             "message": "Amount must be greater than zero"
         }
     
+    source, target = normalize_pair(source_currency, target_currency)
+    
+    invalid = await check_currencies(source, target)
+    if invalid:
+        return invalid
+    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.frankfurter.app/latest",
-                params={
-                    "from": source_currency.upper(),
-                    "to": target_currency.upper(),
-                    "amount": amount
-                },
-                timeout=10.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                converted = data["rates"].get(target_currency.upper())
-                
-                if converted is not None:
-                    return {
-                        "status": "success",
-                        "original_amount": amount,
-                        "source_currency": source_currency.upper(),
-                        "target_currency": target_currency.upper(),
-                        "converted_amount": round(converted, 2),
-                        "rate": round(converted / amount, 6),
-                        "date": data.get("date")
-                    }
-            
-            return {
-                "status": "error",
-                "message": "Failed to convert currency"
-            }
-            
-    except Exception as e:
+        # Convert locally against the current rate snapshot instead of
+        # asking the API to convert each amount
+        engine = get_rate_engine()
+        snapshot = await engine.get_snapshot()
+        rate = snapshot.rate(source, target)
+    except RateFetchError as e:
         return {
             "status": "error",
             "message": f"Conversion failed: {str(e)}"
         }
+    except KeyError:
+        return {
+            "status": "error",
+            "message": f"Unsupported currency pair: {source}->{target}"
+        }
+    
+    return {
+        "status": "success",
+        "original_amount": amount,
+        "source_currency": source,
+        "target_currency": target,
+        "converted_amount": round(amount * rate, get_currency_decimals(target)),
+        "rate": round(rate, 6),
+        "date": snapshot.date,
+        "stale": engine.is_stale()
+    }
 
 
 def format_currency(
@@ -94,32 +105,424 @@ def format_currency(
     Returns:
         Dictionary with formatted amount
     """
-    symbols = {
-        "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥",
-        "CNY": "¥", "INR": "₹", "KRW": "₩", "BRL": "R$"
+    formatted = format_amount(amount, currency_code)
+    
+    return {
+        "status": "success",
+        "currency": currency_code.upper(),
+        "amount": amount,
+        "formatted": formatted
+    }
+
+
+async def convert_multiple(
+    amounts: List[float],
+    source_currency: str,
+    target_currencies: List[str]
+) -> Dict[str, Any]:
+    """
+    Convert one or more amounts into several currencies in a single call.
+    
+    All conversions use the same rate snapshot. Results are rounded to each
+    currency's minor unit (e.g. 0 decimals for JPY, 2 for EUR).
+    
+    Args:
+        amounts: The amounts to convert (e.g., [100] or [100, 250, 1000])
+        source_currency: The source currency code (e.g., 'USD')
+        target_currencies: The target currency codes (e.g., ['EUR', 'GBP', 'JPY'])
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - source_currency: Source currency code
+        - rates: Dict mapping each target currency to its rate
+        - conversions: List of {original_amount, converted} entries, where
+          converted maps each target currency to the converted amount
+        - date: Date of the rate snapshot
+        - message: Error message if status is 'error'
+    """
+    if not amounts or not target_currencies:
+        return {
+            "status": "error",
+            "message": "Provide at least one amount and one target currency"
+        }
+    
+    if any(amount <= 0 for amount in amounts):
+        return {
+            "status": "error",
+            "message": "Amounts must be greater than zero"
+        }
+    
+    source = source_currency.strip().upper()
+    targets = list(dict.fromkeys(t.strip().upper() for t in target_currencies))
+    
+    invalid = await check_currencies(source, *targets)
+    if invalid:
+        return invalid
+    
+    try:
+        snapshot = await get_rate_engine().get_snapshot()
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": f"Conversion failed: {str(e)}"
+        }
+    
+    unsupported = [c for c in [source] + targets if c not in snapshot]
+    if unsupported:
+        return {
+            "status": "error",
+            "message": f"Unsupported currencies: {', '.join(unsupported)}"
+        }
+    
+    rates = snapshot.rates_to(source, targets)
+    converted = snapshot.convert_many(amounts, source, targets)
+    
+    # Round each target column to that currency's decimal places
+    scale = 10.0 ** np.array([get_currency_decimals(t) for t in targets])
+    converted = np.round(converted * scale) / scale
+    
+    return {
+        "status": "success",
+        "source_currency": source,
+        "rates": dict(zip(targets, np.round(rates, 6).tolist())),
+        "conversions": [
+            {"original_amount": amount, "converted": dict(zip(targets, row))}
+            for amount, row in zip(amounts, converted.tolist())
+        ],
+        "date": snapshot.date
     }
+
+
+async def convert_ledger(
+    input_path: str,
+    output_path: str,
+    target_currency: str,
+    date: Optional[str] = None,
+    overwrite: bool = False
+) -> Dict[str, Any]:
+    """
+    Convert every row of a transaction ledger file into one currency.
     
-    symbol = symbols.get(currency_code.upper(), currency_code.upper() + " ")
+    The ledger is streamed in chunks, so files of any size can be converted.
+    Each row needs an 'amount' and a 'currency' field. All rows are converted
+    with the same rate snapshot. Both files must be in the ledger directory.
     
-    # JPY and KRW typically don't use decimals
-    if currency_code.upper() in ["JPY", "KRW"]:
-        formatted = f"{symbol}{int(amount):,}"
-    else:
-        formatted = f"{symbol}{amount:,.2f}"
+    Args:
+        input_path: Ledger file (.csv, .jsonl or .ndjson), relative to the
+            ledger directory
+        output_path: File to write the converted ledger to (.csv, .jsonl or
+            .ndjson), relative to the ledger directory; must differ from
+            input_path
+        target_currency: The currency to convert all rows into (e.g., 'USD')
+        date: Rate date in YYYY-MM-DD format (default: latest rates)
+        overwrite: Replace output_path if it already exists (only when the
+            user explicitly asks)
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - rows: Number of rows processed
+        - converted: Number of rows converted
+        - errors: Number of rows that could not be converted
+        - rows_per_second: Conversion throughput
+        - rate_date: Date of the rate snapshot used
+        - message: Error message if status is 'error'
+    """
+    try:
+        source = resolve_ledger_path(input_path)
+        destination = resolve_ledger_path(output_path)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    
+    if not os.path.isfile(source):
+        return {
+            "status": "error",
+            "message": f"Ledger file not found: {input_path}"
+        }
+    if destination == source:
+        return {
+            "status": "error",
+            "message": "The output file must not be the input file"
+        }
+    if os.path.exists(destination) and not overwrite:
+        return {
+            "status": "error",
+            "message": f"Output file already exists: {output_path}"
+        }
+    if date is not None:
+        try:
+            date = check_date(date)
+        except ValueError:
+            return {
+                "status": "error",
+                "message": "Dates must be in YYYY-MM-DD format"
+            }
+    
+    invalid = await check_currencies(target_currency.strip().upper())
+    if invalid:
+        return invalid
+    
+    try:
+        snapshot = await get_rate_engine().get_snapshot(date)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # File I/O is blocking, so keep it off the event loop
+        stats = await asyncio.to_thread(
+            convert_ledger_file,
+            source,
+            destination,
+            snapshot,
+            target_currency,
+            overwrite=overwrite
+        )
+    except (RateFetchError, ValueError, OSError) as e:
+        return {
+            "status": "error",
+            "message": f"Ledger conversion failed: {str(e)}"
+        }
+    
+    return {
+        "status": "success",
+        **stats,
+        "input_path": input_path,
+        "output_path": output_path
+    }
+
+
+def _describe_route(
+    table: RoutingTable,
+    path: List[str],
+    amount: float
+) -> Dict[str, Any]:
+    """Summarize a conversion route with per-leg rates, fees and amounts."""
+    legs = table.legs(path, amount)
+    received = legs[-1]["amount_out"] if legs else amount
+    mid_market = amount * table.snapshot.rate(path[0], path[-1])
+    
+    for leg in legs:
+        leg["amount_in"] = round(leg["amount_in"], get_currency_decimals(leg["from"]))
+        leg["fee"] = round(leg["fee"], get_currency_decimals(leg["to"]))
+        leg["amount_out"] = round(leg["amount_out"], get_currency_decimals(leg["to"]))
+    
+    return {
+        "route": path,
+        "legs": legs,
+        "converted_amount": round(received, get_currency_decimals(path[-1])),
+        # Cost of the route compared with converting at the mid-market rate
+        "total_cost_pct": round((1 - received / mid_market) * 100, 4)
+    }
+
+
+async def find_best_route(
+    amount: float,
+    source_currency: str,
+    target_currency: str
+) -> Dict[str, Any]:
+    """
+    Find the conversion route that yields the most money after fees.
+    
+    Every conversion corridor may charge a fee, so converting through an
+    intermediate currency can be cheaper than converting directly. Routes
+    are precomputed for all currency pairs once per rate snapshot.
+    
+    Args:
+        amount: The amount to convert
+        source_currency: The source currency code (e.g., 'USD')
+        target_currency: The target currency code (e.g., 'JPY')
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - best: The best route (route, legs with rate/fee/amounts,
+          converted_amount, total_cost_pct)
+        - direct: The direct conversion for comparison
+        - savings: Extra target currency received via the best route
+        - date: Date of the rate snapshot
+        - message: Error message if status is 'error'
+    """
+    if amount <= 0:
+        return {
+            "status": "error",
+            "message": "Amount must be greater than zero"
+        }
+    
+    source, target = normalize_pair(source_currency, target_currency)
+    
+    invalid = await check_currencies(source, target)
+    if invalid:
+        return invalid
+    
+    try:
+        snapshot = await get_rate_engine().get_snapshot()
+        table = get_route_planner().table(snapshot)
+        path = table.route(source, target)
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": f"Routing failed: {str(e)}"
+        }
+    except KeyError:
+        return {
+            "status": "error",
+            "message": f"Unsupported currency pair: {source}->{target}"
+        }
+    
+    best = _describe_route(table, path, amount)
+    direct = _describe_route(table, [source, target], amount)
+    
+    return {
+        "status": "success",
+        "best": best,
+        "direct": direct,
+        "savings": round(
+            best["converted_amount"] - direct["converted_amount"],
+            get_currency_decimals(target)
+        ),
+        "date": snapshot.date
+    }
+
+
+async def round_trip_convert(
+    amount: float,
+    source_currency: str,
+    via_currency: str,
+    target_currency: str
+) -> Dict[str, Any]:
+    """
+    Convert through an intermediate currency and compare with converting directly.
+    
+    Fees from the conversion fee schedule are applied to each leg.
+    
+    Args:
+        amount: The amount to convert
+        source_currency: The source currency code (e.g., 'USD')
+        via_currency: The intermediate currency code (e.g., 'EUR')
+        target_currency: The target currency code (e.g., 'GBP')
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - via: The route through the intermediate currency
+        - direct: The direct conversion for comparison
+        - difference: Target currency gained (or lost, if negative) by going
+          through the intermediate currency
+        - date: Date of the rate snapshot
+        - message: Error message if status is 'error'
+    """
+    if amount <= 0:
+        return {
+            "status": "error",
+            "message": "Amount must be greater than zero"
+        }
+    
+    source, target = normalize_pair(source_currency, target_currency)
+    via = via_currency.strip().upper()
+    
+    invalid = await check_currencies(source, via, target)
+    if invalid:
+        return invalid
+    
+    try:
+        snapshot = await get_rate_engine().get_snapshot()
+        table = get_route_planner().table(snapshot)
+        through = _describe_route(table, [source, via, target], amount)
+        direct = _describe_route(table, [source, target], amount)
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": f"Conversion failed: {str(e)}"
+        }
+    except KeyError:
+        return {
+            "status": "error",
+            "message": f"Unsupported currency route: {source}->{via}->{target}"
+        }
+    
+    return {
+        "status": "success",
+        "via": through,
+        "direct": direct,
+        "difference": round(
+            through["converted_amount"] - direct["converted_amount"],
+            get_currency_decimals(target)
+        ),
+        "date": snapshot.date
+    }
+
+
+def calculate_fees(
+    amount: float,
+    fee_percentage: float,
+    currency_code: str = "USD"
+) -> Dict[str, Any]:
+    """
+    Calculate a percentage transaction fee on an amount.
+    
+    Args:
+        amount: The amount being converted
+        fee_percentage: The fee in percent (e.g., 1.5 for 1.5%)
+        currency_code: Currency of the amount, used for rounding
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - amount: The input amount
+        - fee: The fee charged
+        - net_amount: What remains after the fee is deducted
+        - gross_amount: What to pay so the fee comes on top of the amount
+        - message: Error message if status is 'error'
+    """
+    if amount <= 0:
+        return {
+            "status": "error",
+            "message": "Amount must be greater than zero"
+        }
+    if not 0 <= fee_percentage < 100:
+        return {
+            "status": "error",
+            "message": "Fee percentage must be between 0 and 100"
+        }
+    
+    decimals = get_currency_decimals(currency_code)
+    fee = amount * fee_percentage / 100.0
     
     return {
         "status": "success",
-        "currency": currency_code.upper(),
         "amount": amount,
-        "formatted": formatted
+        "fee_percentage": fee_percentage,
+        "fee": round(fee, decimals),
+        "net_amount": round(amount - fee, decimals),
+        "gross_amount": round(amount + fee, decimals)
     }
 
 
-# TODO: Add more conversion tools
-# Ideas:
-# - convert_multiple(amount, source, targets): Convert to multiple currencies
-# - round_trip_convert(amount, source, via, target): Convert through intermediate
-# - calculate_fees(amount, fee_percentage): Add transaction fees
+async def record_successful_conversion(
+    tool: BaseTool,
+    args: Dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    After-tool callback that records successful conversions in the history.
+    
+    The record is queued for the write-behind history writer, so the
+    orchestrator doesn't need to transfer to history_agent after every
+    conversion. Returns None to leave the tool response unchanged.
+    """
+    if tool.name != "convert_currency" or tool_response.get("status") != "success":
+        return None
+    
+    await get_history_writer().submit(tool_context.user_id, {
+        "source_currency": tool_response["source_currency"],
+        "target_currency": tool_response["target_currency"],
+        "source_amount": tool_response["original_amount"],
+        "target_amount": tool_response["converted_amount"],
+        "rate": tool_response["rate"],
+    })
+    return None
 
 
 def create_conversion_agent() -> Agent:
@@ -127,7 +530,7 @@ def create_conversion_agent() -> Agent:
     
     agent = Agent(
         name="conversion_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Currency conversion specialist. Handles converting amounts between currencies.
         Delegate to this agent when users want to convert money.
@@ -138,14 +541,28 @@ def create_conversion_agent() -> Agent:
         
         ## Your Capabilities
         - Convert amounts between currencies
+        - Convert one or more amounts into several currencies at once
+        - Convert whole transaction ledger files (CSV or JSONL) in the
+          ledger directory; paths are relative to it
         - Format currency amounts properly
         - Explain conversion calculations
+        - Find the cheapest route after fees (possibly through other
+          currencies), convert through a chosen intermediate currency, and
+          calculate transaction fees
         
         ## Guidelines
         1. Always use the convert_currency tool for conversions
-        2. Round results appropriately (2 decimals for most, 0 for JPY/KRW)
+           (use convert_multiple when there are several amounts or targets)
+        2. Keep the rounding of converted amounts (each currency's minor unit)
         3. Show both the converted amount and the rate used
         4. Mention that rates may vary for actual transactions
+        5. Conversions made with convert_currency are saved to the user's
+           history automatically
+        6. Use find_best_route when the user asks for the cheapest way to
+           convert, and round_trip_convert for a specific intermediate
+           currency
+        7. Only set overwrite on convert_ledger when the user explicitly
+           asks to replace an existing output file
         
         ## Response Format
         For conversions, provide:
@@ -155,8 +572,14 @@ def create_conversion_agent() -> Agent:
         """,
         tools=[
             FunctionTool(convert_currency),
+            FunctionTool(convert_multiple),
+            FunctionTool(convert_ledger),
             FunctionTool(format_currency),
-        ]
+            FunctionTool(find_best_route),
+            FunctionTool(round_trip_convert),
+            FunctionTool(calculate_fees),
+        ],
+        after_tool_callback=record_successful_conversion
     )
     
     return agent
@@ -0,0 +1,126 @@
+"""Deterministic Fast Path.
+
+Well-formed rate and conversion requests ("convert 250 USD to EUR",
+"rate GBP to JPY") are answered directly from the rate tools, skipping the
+orchestrator's model calls and agent transfers. Everything else, including
+requests the tools can't answer, goes to the agent as before.
+
+Fast-path conversions are recorded in the history just like the ones made
+by conversion_agent. Fast-path turns are added to the agent's session, so
+a follow-up such as "and in GBP?" that goes to the agent has the context.
+
+Set FAST_PATH=0 to send every message to the agent.
+"""
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+from tools import format_amount
+from tools.history_writer import get_history_writer
+from tools.intent_parser import CurrencyIntent, parse_intent
+
+from .conversion_agent import convert_currency
+from .rate_agent import get_exchange_rate
+
+
+class FastPathRouter:
+    """
+    Answers recognized currency requests without the LLM.
+
+    Args:
+        enabled: Whether to try the fast path at all
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.messages = 0
+        self.hits = {"rate": 0, "convert": 0}
+        self.fallbacks = 0
+        self._hit_seconds = 0.0
+
+    async def try_answer(self, user_id: str, message: str) -> Optional[str]:
+        """
+        Answer a message on the fast path if possible.
+
+        Args:
+            user_id: The user's identifier (for conversion history)
+            message: The user's message
+
+        Returns:
+            The reply text, or None if the message should go to the agent
+        """
+        if not self.enabled:
+            return None
+
+        self.messages += 1
+        started = time.perf_counter()
+
+        intent = parse_intent(message)
+        if intent is None:
+            return None
+
+        if intent.kind == "convert":
+            reply = await self._convert(user_id, intent)
+        else:
+            reply = await self._rate(intent)
+
+        if reply is None:
+            # Recognized but not answerable (e.g. unknown currency): let the
+            # agent explain
+            self.fallbacks += 1
+            return None
+
+        self.hits[intent.kind] += 1
+        self._hit_seconds += time.perf_counter() - started
+        return reply
+
+    async def _rate(self, intent: CurrencyIntent) -> Optional[str]:
+        result = await get_exchange_rate(intent.source_currency, intent.target_currency)
+        if result["status"] != "success":
+            return None
+        return (
+            f"1 {result['source']} = {result['rate']:.6g} {result['target']} "
+            f"(ECB reference rate, {result['date']})"
+        )
+
+    async def _convert(self, user_id: str, intent: CurrencyIntent) -> Optional[str]:
+        result = await convert_currency(
+            intent.amount, intent.source_currency, intent.target_currency
+        )
+        if result["status"] != "success":
+            return None
+
+        await get_history_writer().submit(user_id, {
+            "source_currency": result["source_currency"],
+            "target_currency": result["target_currency"],
+            "source_amount": result["original_amount"],
+            "target_amount": result["converted_amount"],
+            "rate": result["rate"],
+        })
+
+        source = format_amount(result["original_amount"], result["source_currency"])
+        target = format_amount(result["converted_amount"], result["target_currency"])
+        return (
+            f"{source} {result['source_currency']} = {target} "
+            f"{result['target_currency']} "
+            f"(rate {result['rate']:.6g}, {result['date']})"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return fast-path hit metrics."""
+        hits = sum(self.hits.values())
+        return {
+            "messages": self.messages,
+            "hits": hits,
+            "rate_hits": self.hits["rate"],
+            "conversion_hits": self.hits["convert"],
+            "fallbacks": self.fallbacks,
+            "hit_ratio": round(hits / self.messages, 4) if self.messages else 0.0,
+            "avg_hit_ms": round(self._hit_seconds / hits * 1000, 2) if hits else 0.0,
+        }
+
+
+def create_fast_path() -> FastPathRouter:
+    """Create the fast-path router (disabled when FAST_PATH=0)."""
+    return FastPathRouter(enabled=os.environ.get("FAST_PATH", "1") != "0")
@@ -2,20 +2,37 @@
 
 This agent tracks and manages conversion history.
 
-TODO: Complete the implementation with persistent storage.
+History is stored persistently in SQLite (see tools/history_store.py).
+Every tool acts on the signed-in user of the session, never on a user id
+chosen by the model. Store calls can wait on the database lock (another
+worker's write, or the write-behind flush), so they run in a worker thread
+rather than on the event loop that serves every session.
 """
 
 from google.adk.agents import Agent
-from google.adk.tools import FunctionTool
+from google.adk.tools import FunctionTool, ToolContext
 from typing import Dict, Any, List, Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import asyncio
+import os
+import re
 
-# In-memory storage (replace with database/MCP in production)
-_conversion_history: Dict[str, List[Dict[str, Any]]] = {}
+from tools.history_store import HistoryStore, export_to_file, get_history_store
+from tools.history_writer import get_history_writer
 
+from .models import get_model
 
-def record_conversion(
-    user_id: str,
+
+async def _current_history() -> HistoryStore:
+    """Get the history store once queued conversions have been written to it."""
+    # conversion_agent records conversions write-behind, so the latest
+    # ones may still be queued
+    await get_history_writer().flush()
+    return await asyncio.to_thread(get_history_store)
+
+
+async def record_conversion(
+    tool_context: ToolContext,
     source_currency: str,
     target_currency: str,
     source_amount: float,
@@ -26,7 +43,6 @@ def record_conversion(
     Record a currency conversion in the history.
     
     Args:
-        user_id: The user's identifier
         source_currency: Source currency code
         target_currency: Target currency code
         source_amount: Original amount
@@ -36,20 +52,16 @@ def record_conversion(
     Returns:
         Confirmation of recorded conversion
     """
-    if user_id not in _conversion_history:
-        _conversion_history[user_id] = []
-    
-    record = {
-        "id": len(_conversion_history[user_id]) + 1,
-        "timestamp": datetime.now().isoformat(),
-        "source_currency": source_currency.upper(),
-        "target_currency": target_currency.upper(),
-        "source_amount": source_amount,
-        "target_amount": target_amount,
-        "rate": rate
-    }
-    
-    _conversion_history[user_id].append(record)
+    store = await asyncio.to_thread(get_history_store)
+    record = await asyncio.to_thread(
+        store.append,
+        tool_context.user_id,
+        source_currency,
+        target_currency,
+        source_amount,
+        target_amount,
+        rate
+    )
     
     return {
         "status": "success",
@@ -58,101 +70,234 @@ def record_conversion(
     }
 
 
-def get_conversion_history(
-    user_id: str,
-    limit: int = 10
+async def get_conversion_history(
+    tool_context: ToolContext,
+    limit: int = 10,
+    cursor: Optional[int] = None
 ) -> Dict[str, Any]:
     """
-    Get the user's conversion history.
+    Get the user's conversion history, most recent first.
     
     Args:
-        user_id: The user's identifier
-        limit: Maximum number of records to return (default 10)
+        limit: Maximum number of records to return (1-100, default 10)
+        cursor: next_cursor from a previous call, to get the next (older) page
     
     Returns:
-        Dictionary containing conversion history
+        Dictionary containing conversion history and, if more records
+        exist, a next_cursor for the following page
     """
-    history = _conversion_history.get(user_id, [])
+    user_id = tool_context.user_id
+    limit = min(max(1, limit), 100)
+    store = await _current_history()
+    
+    def read():
+        return store.page(user_id, limit=limit, before=cursor), store.count(user_id)
     
-    # Get most recent first
-    recent = list(reversed(history))[:limit]
+    (recent, next_cursor), total = await asyncio.to_thread(read)
     
     return {
         "status": "success",
         "user_id": user_id,
-        "total_conversions": len(history),
+        "total_conversions": total,
         "showing": len(recent),
-        "history": recent
+        "history": recent,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
     }
 
 
-def get_history_stats(user_id: str) -> Dict[str, Any]:
+async def get_history_stats(tool_context: ToolContext) -> Dict[str, Any]:
     """
     Get statistics about the user's conversion history.
     
-    Args:
-        user_id: The user's identifier
-    
     Returns:
-        Dictionary containing history statistics
+        Dictionary containing history statistics: total conversions, most
+        used pairs, volume sent/received per currency and the dates of the
+        first and last conversion
     """
-    history = _conversion_history.get(user_id, [])
+    user_id = tool_context.user_id
+    # Aggregates are maintained on every record_conversion, so this
+    # doesn't rescan the history
+    stats = await asyncio.to_thread((await _current_history()).stats, user_id)
     
-    if not history:
+    if stats is None:
         return {
             "status": "success",
             "message": "No conversion history found",
             "total_conversions": 0
         }
     
-    # Calculate statistics
-    currency_pairs = {}
-    total_usd_equivalent = 0
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "total_conversions": stats["total_conversions"],
+        "unique_pairs": len(stats["currency_pairs"]),
+        "most_used_pair": stats["top_pairs"][0],
+        "top_pairs": stats["top_pairs"],
+        "currency_pairs": stats["currency_pairs"],
+        "volume_by_currency": stats["volume_by_currency"],
+        "first_conversion": stats["first_conversion"],
+        "last_conversion": stats["last_conversion"]
+    }
+
+
+async def clear_history(tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    Clear the user's conversion history.
     
-    for record in history:
-        pair = f"{record['source_currency']}->{record['target_currency']}"
-        currency_pairs[pair] = currency_pairs.get(pair, 0) + 1
+    Returns:
+        Confirmation of cleared history
+    """
+    # Queued conversions are written first, so they are cleared too
+    count = await asyncio.to_thread(
+        (await _current_history()).clear, tool_context.user_id
+    )
+    
+    return {
+        "status": "success",
+        "message": f"Cleared {count} conversion records"
+    }
+
+
+async def search_history(
+    tool_context: ToolContext,
+    currency: str,
+    limit: int = 10,
+    cursor: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Find conversions involving a currency (as source or target), most recent first.
+    
+    Args:
+        currency: Currency code to search for (e.g., 'EUR')
+        limit: Maximum number of records to return (1-100, default 10)
+        cursor: next_cursor from a previous call, to get the next page
     
-    # Find most used pair
-    most_used = max(currency_pairs.items(), key=lambda x: x[1])
+    Returns:
+        Dictionary containing matching conversions and pagination info
+    """
+    user_id = tool_context.user_id
+    limit = min(max(1, limit), 100)
+    records, next_cursor = await asyncio.to_thread(
+        (await _current_history()).search_currency,
+        user_id, currency.strip(), limit=limit, before=cursor
+    )
     
     return {
         "status": "success",
         "user_id": user_id,
-        "total_conversions": len(history),
-        "unique_pairs": len(currency_pairs),
-        "most_used_pair": {
-            "pair": most_used[0],
-            "count": most_used[1]
-        },
-        "currency_pairs": currency_pairs
+        "currency": currency.strip().upper(),
+        "showing": len(records),
+        "history": records,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
     }
 
 
-def clear_history(user_id: str) -> Dict[str, Any]:
+async def get_history_by_date(
+    tool_context: ToolContext,
+    start_date: str,
+    end_date: str,
+    limit: int = 10,
+    cursor: Optional[int] = None
+) -> Dict[str, Any]:
     """
-    Clear the user's conversion history.
+    Get conversions made between two dates (inclusive), most recent first.
     
     Args:
-        user_id: The user's identifier
+        start_date: First day in YYYY-MM-DD format
+        end_date: Last day in YYYY-MM-DD format
+        limit: Maximum number of records to return (1-100, default 10)
+        cursor: next_cursor from a previous call, to get the next page
     
     Returns:
-        Confirmation of cleared history
+        Dictionary containing matching conversions and pagination info
     """
-    count = len(_conversion_history.get(user_id, []))
-    _conversion_history[user_id] = []
+    try:
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": "Dates must be in YYYY-MM-DD format"
+        }
+    
+    if end < start:
+        return {
+            "status": "error",
+            "message": "end_date must not be before start_date"
+        }
+    
+    user_id = tool_context.user_id
+    limit = min(max(1, limit), 100)
+    records, next_cursor = await asyncio.to_thread(
+        (await _current_history()).search_dates,
+        user_id,
+        start.isoformat(),
+        (end + timedelta(days=1)).isoformat(),
+        limit=limit,
+        before=cursor
+    )
     
     return {
         "status": "success",
-        "message": f"Cleared {count} conversion records"
+        "user_id": user_id,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "showing": len(records),
+        "history": records,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
     }
 
 
-# TODO: Add more history tools
-# Ideas:
-# - search_history(user_id, currency): Find conversions involving a currency
-# - export_history(user_id, format): Export history as CSV/JSON
-# - get_history_by_date(user_id, start_date, end_date): Filter by date range
+async def export_history(
+    tool_context: ToolContext,
+    format: str = "csv"
+) -> Dict[str, Any]:
+    """
+    Export the user's full conversion history to a file.
+    
+    Args:
+        format: Export format, 'csv' or 'jsonl' (default 'csv')
+    
+    Returns:
+        Dictionary containing the path of the export file and the number
+        of records written
+    """
+    export_format = format.strip().lower()
+    if export_format not in ("csv", "jsonl"):
+        return {
+            "status": "error",
+            "message": "Format must be 'csv' or 'jsonl'"
+        }
+    
+    user_id = tool_context.user_id
+    safe_user = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(
+        os.environ.get("HISTORY_EXPORT_DIR", os.path.join("data", "exports")),
+        f"{safe_user}_history_{stamp}.{export_format}"
+    )
+    
+    try:
+        # Streaming the file is blocking I/O, so keep it off the event loop
+        count = await asyncio.to_thread(
+            export_to_file, await _current_history(), user_id, path, export_format
+        )
+    except OSError as e:
+        return {
+            "status": "error",
+            "message": f"Export failed: {str(e)}"
+        }
+    
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "format": export_format,
+        "path": path,
+        "records": count
+    }
 
 
 def create_history_agent() -> Agent:
@@ -160,7 +305,7 @@ def create_history_agent() -> Agent:
     
     agent = Agent(
         name="history_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Conversion history specialist. Tracks and reports on currency conversions.
         Delegate to this agent when users ask about their conversion history.
@@ -170,8 +315,11 @@ def create_history_agent() -> Agent:
         track and understand their currency conversion history.
         
         ## Your Capabilities
-        - Record new conversions (called by other agents)
+        - Record conversions manually (conversions made by conversion_agent
+          are recorded automatically)
         - Retrieve conversion history
+        - Search history by currency or date range
+        - Export history as CSV or JSONL files
         - Provide statistics and insights
         - Clear history when requested
         
@@ -191,6 +339,9 @@ def create_history_agent() -> Agent:
             FunctionTool(record_conversion),
             FunctionTool(get_conversion_history),
             FunctionTool(get_history_stats),
+            FunctionTool(search_history),
+            FunctionTool(get_history_by_date),
+            FunctionTool(export_history),
             FunctionTool(clear_history),
         ]
     )
@@ -0,0 +1,19 @@
+"""Model selection and record/replay cassettes (see ``capstone_common.models``)."""
+
+from capstone_common.models import (
+    CassetteLlm,
+    CassetteMiss,
+    cassette_session,
+    get_model,
+    model_mode,
+    requires_api_key,
+)
+
+__all__ = [
+    "CassetteLlm",
+    "CassetteMiss",
+    "cassette_session",
+    "get_model",
+    "model_mode",
+    "requires_api_key",
+]
@@ -7,6 +7,7 @@ from google.adk.agents import Agent
 from .rate_agent import create_rate_agent
 from .conversion_agent import create_conversion_agent
 from .history_agent import create_history_agent
+from .models import get_model
 
 
 def create_orchestrator() -> Agent:
@@ -24,7 +25,7 @@ def create_orchestrator() -> Agent:
     # Create orchestrator with sub-agents
     orchestrator = Agent(
         name="currency_exchange_orchestrator",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="Main currency exchange assistant that coordinates specialist agents.",
         instruction="""
         You are a helpful currency exchange assistant. You coordinate a team of
@@ -36,10 +37,12 @@ def create_orchestrator() -> Agent:
         1. **exchange_rate_agent**: Handles exchange rate queries
            - Use for: "What's the rate for USD to EUR?"
            - Use for: "What currencies are supported?"
+           - Use for: "Tell me when EUR/USD goes above 1.10"
         
         2. **conversion_agent**: Handles currency conversions
            - Use for: "Convert 100 USD to EUR"
            - Use for: "How much is 50 pounds in yen?"
+           - Conversions are saved to the user's history automatically
         
         3. **history_agent**: Tracks conversion history
            - Use for: "Show my history"
@@ -47,8 +50,8 @@ def create_orchestrator() -> Agent:
         
         ## Routing Guidelines
         
-        - For rate inquiries → exchange_rate_agent
-        - For conversions → conversion_agent (then log with history_agent)
+        - For rate inquiries and rate alerts → exchange_rate_agent
+        - For conversions → conversion_agent (no need to log with history_agent)
         - For history questions → history_agent
         - For complex queries → combine multiple agents
         
@@ -64,8 +67,7 @@ def create_orchestrator() -> Agent:
         → Delegate to exchange_rate_agent
         
         User: "Convert 500 dollars to euros"
-        → Delegate to conversion_agent
-        → Then record with history_agent
+        → Delegate to conversion_agent (the conversion is recorded automatically)
         
         User: "What have I converted recently?"
         → Delegate to history_agent
@@ -7,9 +7,19 @@ TODO: Complete the implementation following the instructions.
 """
 
 from google.adk.agents import Agent
-from google.adk.tools import FunctionTool
-from typing import Dict, Any, Optional
-import httpx
+from google.adk.tools import FunctionTool, ToolContext
+from typing import Dict, Any, List, Optional
+from datetime import date, timedelta
+import asyncio
+
+from tools.currency_catalog import check_currencies, get_currency_catalog
+from tools.rate_alerts import DIRECTIONS, get_alert_engine
+from tools.rate_cache import normalize_pair
+from tools.rate_engine import RateFetchError, get_rate_engine
+from tools.rate_analytics import summarize
+from tools.rate_history import get_rate_history_store
+
+from .models import get_model
 
 
 # =============================================================================
@@ -23,7 +33,9 @@ async def get_exchange_rate(
     """
     Get the current exchange rate between two currencies.
     
-    Uses the free Frankfurter API (https://www.frankfurter.app/).
+    Uses the free Frankfurter API (https://www.frankfurter.app/). The rate is
+    read from the local cross-rate snapshot, which is refreshed with a single
+    API call after each ECB publication.
     
     Args:
         source_currency: The source currency code (e.g., 'USD', 'EUR')
@@ -36,93 +48,390 @@ async def get_exchange_rate(
         - target: Target currency code
         - rate: Exchange rate (1 source = rate target)
         - date: Date of the rate
+        - age_seconds: Seconds since the rates were fetched from the API
+        - stale: True if newer rates may exist but couldn't be fetched yet
         - message: Error message if status is 'error'
     """
+    source, target = normalize_pair(source_currency, target_currency)
+    
+    invalid = await check_currencies(source, target)
+    if invalid:
+        return invalid
+    
+    engine = get_rate_engine()
+    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.frankfurter.app/latest",
-                params={
-                    "from": source_currency.upper(),
-                    "to": target_currency.upper()
-                },
-                timeout=10.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                rate = data["rates"].get(target_currency.upper())
-                
-                if rate is not None:
-                    return {
-                        "status": "success",
-                        "source": source_currency.upper(),
-                        "target": target_currency.upper(),
-                        "rate": rate,
-                        "date": data.get("date")
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Rate not found for {target_currency}"
-                    }
-            else:
-                return {
-                    "status": "error",
-                    "message": f"API error: {response.status_code}"
-                }
-                
-    except httpx.TimeoutException:
+        snapshot = await engine.get_snapshot()
+        rate = snapshot.rate(source, target)
+    except RateFetchError as e:
         return {
             "status": "error",
-            "message": "Request timed out. Please try again."
+            "message": str(e)
         }
-    except Exception as e:
+    except KeyError:
         return {
             "status": "error",
-            "message": f"Failed to fetch rate: {str(e)}"
+            "message": f"Rate not found for {source}->{target}"
         }
+    
+    return {
+        "status": "success",
+        "source": source,
+        "target": target,
+        "rate": rate,
+        "date": snapshot.date,
+        "age_seconds": round(engine.snapshot_age(), 1),
+        "stale": engine.is_stale()
+    }
 
 
-def list_supported_currencies() -> Dict[str, Any]:
+async def list_supported_currencies() -> Dict[str, Any]:
     """
     List all currencies supported by the exchange rate service.
     
+    The list comes from the API's currencies endpoint and is cached on disk,
+    so this rarely makes a network request.
+    
     Returns:
         Dictionary containing:
         - status: 'success'
         - currencies: Dict mapping currency codes to names
+        - count: Number of supported currencies
+    """
+    currencies = await get_currency_catalog().load()
+    
+    return {
+        "status": "success",
+        "currencies": {code: info.name for code, info in currencies.items()},
+        "count": len(currencies)
+    }
+
+
+async def get_rate_history(
+    source_currency: str,
+    target_currency: str,
+    days: int = 30
+) -> Dict[str, Any]:
+    """
+    Get daily historical exchange rates for a currency pair.
+    
+    History is kept in a local store; only days that have never been loaded
+    are fetched from the API.
+    
+    Args:
+        source_currency: The source currency code (e.g., 'USD')
+        target_currency: The target currency code (e.g., 'EUR')
+        days: Number of calendar days to look back (1-3650, default 30)
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - source: Source currency code
+        - target: Target currency code
+        - start_date: First day of the requested range
+        - end_date: Last day of the requested range
+        - count: Number of daily rates returned
+        - rates: List of {date, rate} entries, oldest first
+        - message: Error message if status is 'error'
+    """
+    source, target = normalize_pair(source_currency, target_currency)
+    
+    invalid = await check_currencies(source, target)
+    if invalid:
+        return invalid
+    
+    days = min(max(1, days), 3650)
+    end = date.today()
+    start = end - timedelta(days=days)
+    
+    store = get_rate_history_store()
+    
+    try:
+        await store.backfill(start, end)
+        dates, rates = store.pair_series(source, target, start, end)
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except KeyError:
+        return {
+            "status": "error",
+            "message": f"No rate history for {source}->{target}"
+        }
+    
+    return {
+        "status": "success",
+        "source": source,
+        "target": target,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "count": len(rates),
+        "rates": [
+            {"date": d, "rate": r}
+            for d, r in zip(dates.astype(str).tolist(), rates.round(6).tolist())
+        ]
+    }
+
+
+async def analyze_rate_history(
+    source_currency: str,
+    target_currencies: List[str],
+    days: int = 365,
+    window: int = 7
+) -> Dict[str, Any]:
+    """
+    Analyze historical exchange rates for one or more currency pairs.
+    
+    Computes the statistics for all pairs at once from locally stored daily
+    rates.
+    
+    Args:
+        source_currency: The source currency code (e.g., 'USD')
+        target_currencies: The target currency codes (e.g., ['EUR', 'GBP'])
+        days: Number of calendar days to analyze (2-3650, default 365)
+        window: Rolling window in trading days for mean and volatility (default 7)
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - source: Source currency code
+        - analysis: One entry per pair with first/latest rate, period change,
+          day-over-day change, rolling mean and volatility, min/max with
+          dates, percentiles and annualized volatility
+        - message: Error message if status is 'error'
+    """
+    source = source_currency.strip().upper()
+    targets = list(dict.fromkeys(t.strip().upper() for t in target_currencies))
+    if not targets:
+        return {
+            "status": "error",
+            "message": "Provide at least one target currency"
+        }
+    
+    invalid = await check_currencies(source, *targets)
+    if invalid:
+        return invalid
+    
+    days = min(max(2, days), 3650)
+    end = date.today()
+    start = end - timedelta(days=days)
+    
+    store = get_rate_history_store()
+    
+    try:
+        await store.backfill(start, end)
+        dates, base_rates = store.series([source] + targets, start, end)
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": str(e.args[0])
+        }
+    
+    if len(dates) == 0:
+        return {
+            "status": "error",
+            "message": "No rates published in the requested period"
+        }
+    
+    # Cross rates for every pair: (days, targets)
+    pair_rates = base_rates[:, 1:] / base_rates[:, :1]
+    
+    return {
+        "status": "success",
+        "source": source,
+        "analysis": summarize(
+            dates,
+            pair_rates,
+            [f"{source}->{t}" for t in targets],
+            window=max(2, window)
+        )
+    }
+
+
+async def check_rate_change(
+    source_currency: str,
+    target_currency: str
+) -> Dict[str, Any]:
+    """
+    Compare the latest exchange rate with the previous trading day.
+    
+    Args:
+        source_currency: The source currency code (e.g., 'USD')
+        target_currency: The target currency code (e.g., 'EUR')
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - pair: The currency pair
+        - latest: Latest rate and its date
+        - change: Absolute change since the previous trading day
+        - change_pct: Percentage change since the previous trading day
+        - message: Error message if status is 'error'
     """
-    # TODO: You could fetch this dynamically from the API
-    # For now, we'll use a static list of major currencies
+    result = await analyze_rate_history(
+        source_currency, [target_currency], days=10, window=2
+    )
+    if result["status"] != "success":
+        return result
+    
+    summary = result["analysis"][0]
+    if "day_over_day" not in summary:
+        return {
+            "status": "error",
+            "message": "Not enough recent rates to compare"
+        }
     
     return {
         "status": "success",
-        "currencies": {
-            "USD": "United States Dollar",
-            "EUR": "Euro",
-            "GBP": "British Pound Sterling",
-            "JPY": "Japanese Yen",
-            "AUD": "Australian Dollar",
-            "CAD": "Canadian Dollar",
-            "CHF": "Swiss Franc",
-            "CNY": "Chinese Yuan",
-            "INR": "Indian Rupee",
-            "MXN": "Mexican Peso",
-            "BRL": "Brazilian Real",
-            "KRW": "South Korean Won",
-            "SGD": "Singapore Dollar",
-            "HKD": "Hong Kong Dollar",
-            "NZD": "New Zealand Dollar",
+        "pair": summary["pair"],
+        "latest": {"rate": summary["latest"], "date": summary["end_date"]},
+        "change": summary["day_over_day"]["change"],
+        "change_pct": summary["day_over_day"]["change_pct"]
+    }
+
+
+async def create_rate_alert(
+    tool_context: ToolContext,
+    source_currency: str,
+    target_currency: str,
+    direction: str,
+    threshold: float
+) -> Dict[str, Any]:
+    """
+    Create an alert that fires when a rate crosses a threshold.
+    
+    Alerts are checked every time new rates are published.
+    
+    Args:
+        source_currency: The source currency code (e.g., 'EUR')
+        target_currency: The target currency code (e.g., 'USD')
+        direction: 'above' (rate rises to the threshold) or 'below'
+            (rate falls to the threshold)
+        threshold: The rate to watch for (1 source = threshold target)
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - alert: The created alert (id, pair, direction, threshold)
+        - current_rate: The rate when the alert was created
+        - message: Error message if status is 'error'
+    """
+    source, target = normalize_pair(source_currency, target_currency)
+    direction = direction.strip().lower()
+    
+    if direction not in DIRECTIONS:
+        return {
+            "status": "error",
+            "message": "Direction must be 'above' or 'below'"
+        }
+    if threshold <= 0:
+        return {
+            "status": "error",
+            "message": "Threshold must be greater than zero"
+        }
+    
+    invalid = await check_currencies(source, target)
+    if invalid:
+        return invalid
+    
+    try:
+        snapshot = await get_rate_engine().get_snapshot()
+        rate = snapshot.rate(source, target)
+    except RateFetchError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except KeyError:
+        return {
+            "status": "error",
+            "message": f"Rate not found for {source}->{target}"
         }
+    
+    # An alert that would fire immediately isn't useful
+    if (direction == "above" and rate >= threshold) or (direction == "below" and rate <= threshold):
+        return {
+            "status": "error",
+            "message": (
+                f"{source}/{target} is already {direction} {threshold} "
+                f"(current rate {rate:.6g})"
+            )
+        }
+    
+    alert = await get_alert_engine().create_alert(
+        tool_context.user_id, source, target, direction, threshold
+    )
+    
+    return {
+        "status": "success",
+        "alert": alert,
+        "current_rate": round(rate, 6)
+    }
+
+
+async def list_rate_alerts(
+    tool_context: ToolContext,
+    include_inactive: bool = False
+) -> Dict[str, Any]:
+    """
+    List a user's rate alerts, newest first.
+    
+    Args:
+        include_inactive: Also include triggered and cancelled alerts
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success'
+        - alerts: List of alerts (triggered alerts include triggered_rate
+          and rate_date)
+        - count: Number of alerts returned
+    """
+    alerts = await asyncio.to_thread(
+        get_alert_engine().store.list_for_user, tool_context.user_id, include_inactive
+    )
+    
+    return {
+        "status": "success",
+        "alerts": alerts,
+        "count": len(alerts)
+    }
+
+
+async def cancel_rate_alert(tool_context: ToolContext, alert_id: int) -> Dict[str, Any]:
+    """
+    Cancel one of a user's active rate alerts.
+    
+    Args:
+        alert_id: The alert's id (from list_rate_alerts)
+    
+    Returns:
+        Dictionary containing:
+        - status: 'success' or 'error'
+        - alert: The cancelled alert
+        - message: Error message if status is 'error'
+    """
+    alert = await get_alert_engine().cancel_alert(tool_context.user_id, alert_id)
+    if alert is None:
+        return {
+            "status": "error",
+            "message": f"No active alert with id {alert_id}"
+        }
+    
+    return {
+        "status": "success",
+        "alert": alert
     }
 
 
 # TODO: Add more tools as needed
 # Ideas:
-# - get_rate_history(source, target, days): Get historical rates
 # - get_multiple_rates(source, targets): Get rates to multiple currencies
-# - check_rate_change(source, target): Compare today vs yesterday
 
 
 # =============================================================================
@@ -138,10 +447,11 @@ def create_rate_agent() -> Agent:
     
     agent = Agent(
         name="exchange_rate_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Exchange rate specialist agent. Handles queries about currency exchange rates.
-        Can fetch real-time rates and list supported currencies.
+        Can fetch real-time and historical rates, list supported currencies
+        and manage rate alerts.
         Delegate to this agent when users ask about exchange rates.
         """,
         instruction="""
@@ -151,6 +461,10 @@ def create_rate_agent() -> Agent:
         ## Your Capabilities
         - Fetch current exchange rates between any two supported currencies
         - List all supported currencies
+        - Show historical rates for a currency pair
+        - Analyze trends: daily changes, moving averages, volatility, ranges
+        - Create, list and cancel rate alerts ("tell me when EUR/USD goes
+          above 1.10")
         - Explain exchange rate concepts
         
         ## Guidelines
@@ -159,6 +473,13 @@ def create_rate_agent() -> Agent:
         3. If a currency isn't supported, let the user know
         4. Format rates clearly (e.g., "1 USD = 0.92 EUR")
         5. Include the date of the rate for accuracy
+        6. Use analyze_rate_history for trend questions instead of
+           computing statistics from raw history yourself
+        7. If a rate comes back with stale=true, say that the rates service
+           is currently slow or unavailable and give the rate's date
+        8. For alerts, "rises to / goes above" means direction='above' and
+           "drops to / falls below" means direction='below'. Alerts
+           always belong to the current user; never ask for a user id
         
         ## Response Format
         When providing rates, always include:
@@ -169,6 +490,12 @@ def create_rate_agent() -> Agent:
         tools=[
             FunctionTool(get_exchange_rate),
             FunctionTool(list_supported_currencies),
+            FunctionTool(get_rate_history),
+            FunctionTool(analyze_rate_history),
+            FunctionTool(check_rate_change),
+            FunctionTool(create_rate_alert),
+            FunctionTool(list_rate_alerts),
+            FunctionTool(cancel_rate_alert),
             # TODO: Add more tools here
         ]
     )
@@ -11,12 +11,17 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Verify API key is set
-if not os.environ.get("GOOGLE_API_KEY"):
-    raise ValueError("Please set GOOGLE_API_KEY environment variable")
+from agents.models import requires_api_key
 
-from agents.orchestrator import create_orchestrator
-from google.adk.runners import InMemoryRunner
+# Verify API key is set (not needed when replaying a model cassette)
+if requires_api_key() and not os.environ.get("GOOGLE_API_KEY"):
+    raise ValueError(
+        "Please set GOOGLE_API_KEY environment variable "
+        "(or AGENT_MODEL_MODE=replay to run offline)"
+    )
+
+from capstone_common.console import read_input
+from server import create_server
 
 
 async def main():
@@ -27,20 +32,34 @@ async def main():
     print("=" * 60)
     print("\nInitializing agents...")
     
-    # Create the orchestrator (which manages sub-agents)
-    orchestrator = create_orchestrator()
+    # The REPL is one client of the multi-session server (see server.py)
+    server = create_server()
+    orchestrator = server.agent
     
     print(f"✅ Orchestrator '{orchestrator.name}' ready!")
     print(f"   Sub-agents: {[a.name for a in orchestrator.sub_agents]}")
     
-    # Create runner
-    runner = InMemoryRunner(agent=orchestrator)
+    await server.start()
     
-    # Create session
-    session = await runner.session_service.create_session(
-        app_name=orchestrator.name,
-        user_id="demo_user"
-    )
+    user_id = os.environ.get("AGENT_USER_ID", "demo_user")
+    session_id = await server.open_session(user_id)
+    
+    # Per-turn latency footer (toggle with 'timing')
+    show_timing = os.environ.get("SHOW_TIMING", "0") == "1"
+    
+    async def show_event(event):
+        if event["event"] == "text":
+            print(event["text"], end="", flush=True)
+        elif event["event"] == "alert":
+            alert = event["alert"]
+            print(
+                f"\n🔔 Alert #{alert['id']}: {alert['source_currency']}/"
+                f"{alert['target_currency']} is {alert['direction']} "
+                f"{alert['threshold']} (now {alert['triggered_rate']:.6g})\n"
+            )
+    
+    # Triggered rate alerts are pushed to the user's clients
+    server.add_listener(user_id, show_event)
     
     print("\n" + "=" * 60)
     print("Chat started! Type 'quit' to exit.")
@@ -50,41 +69,50 @@ async def main():
     print("  - Convert 100 dollars to yen")
     print("  - What currencies can you help with?")
     print("  - Show my conversion history")
+    print("  (type 'stats' for server and fast-path metrics, 'timing' to")
+    print("   toggle the per-turn latency footer)")
     print()
     
-    while True:
-        try:
-            user_input = input("You: ").strip()
-            
-            if user_input.lower() in ['quit', 'exit', 'q']:
-                print("\nGoodbye! 👋")
+    try:
+        while True:
+            try:
+                user_input = (await read_input("You: ")).strip()
+                
+                if user_input.lower() in ['quit', 'exit', 'q']:
+                    print("\nGoodbye! 👋")
+                    break
+                
+                if not user_input:
+                    continue
+                
+                if user_input.lower() == 'stats':
+                    print(f"\nServer: {server.stats()}\n")
+                    continue
+                
+                if user_input.lower() == 'timing':
+                    show_timing = not show_timing
+                    print(f"\nTiming footer {'on' if show_timing else 'off'}\n")
+                    continue
+                
+                # Run the agent and print the response as it streams in
+                print("\nAgent: ", end="")
+                metrics = await server.run_turn(user_id, session_id, user_input, show_event)
+                print()
+                if show_timing:
+                    print(f"   ⏱  {metrics.summary()}")
+                print()
+                
+            except (KeyboardInterrupt, EOFError):
+                print("\n\nGoodbye! 👋")
                 break
-            
-            if not user_input:
-                continue
-            
-            # Run the agent
-            response = await runner.run(
-                user_id="demo_user",
-                session_id=session.id,
-                new_message=user_input
-            )
-            
-            # Collect and print response
-            print("\nAgent: ", end="")
-            async for event in response:
-                if hasattr(event, 'content') and event.content:
-                    for part in event.content.parts:
-                        if hasattr(part, 'text'):
-                            print(part.text, end="")
-            print("\n")
-            
-        except KeyboardInterrupt:
-            print("\n\nGoodbye! 👋")
-            break
-        except Exception as e:
-            print(f"\n❌ Error: {e}\n")
+            except Exception as e:
+                print(f"\n❌ Error: {e}\n")
+    finally:
+        await server.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,117 @@
+"""Currency Exchange Multi-Session Server.
+
+The currency exchange agents served over the shared multi-session server
+(see ``capstone_common.agent_server`` for the protocol). Run it with
+``python server.py``; ``main.py`` runs the same server in-process.
+
+Simple conversions and rate lookups are answered by the fast path (see
+``agents.fast_path``) without running the agent; FAST_PATH=0 turns it off.
+
+Triggered rate alerts are pushed to every connection that opened a session
+for the alert's user as ``{"event": "alert", "alert": {...}}``. An alert
+counts as delivered only once a connection received it. When several
+server processes share the alert store, the process that triggers an alert
+may not hold the user's connection; the alert then stays pending and the
+process the user is connected to delivers it (see ``tools.rate_alerts``).
+Pending alerts are also delivered when the user next connects.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from google.adk.agents import BaseAgent
+
+from agents.fast_path import FastPathRouter, create_fast_path
+from agents.orchestrator import create_orchestrator
+from capstone_common.agent_server import AgentServer, Emit, run_server, server_options
+from tools.currency_catalog import get_currency_catalog
+from tools.history_writer import close_history_writer
+from tools.http_client import close_http_client
+from tools.rate_alerts import get_alert_engine, start_alert_monitor
+from tools.rate_engine import start_shared_refresher
+
+
+class CurrencyServer(AgentServer):
+    """
+    Agent server for the currency exchange agents.
+
+    Args:
+        agent: Root agent shared by every session
+        fast_path: Router that answers simple requests without the LLM
+        **options: AgentServer options
+    """
+
+    SHORTCUT = "fast path"
+
+    def __init__(
+        self,
+        agent: BaseAgent,
+        fast_path: Optional[FastPathRouter] = None,
+        **options: Any
+    ):
+        super().__init__(agent, **options)
+        self.fast_path = fast_path
+
+    async def start(self) -> None:
+        """Start the background services the tools rely on."""
+        # Keep the cross-process rate snapshot current (RATE_SHARED_SNAPSHOT=1)
+        refresher = start_shared_refresher()
+        if refresher is not None:
+            self._background.append(refresher)
+
+        # Load the currency catalog in the background; tools wait for it on
+        # first use
+        self._background.append(
+            asyncio.get_running_loop().create_task(get_currency_catalog().load())
+        )
+
+        # Check rate alerts whenever new rates are fetched, and deliver
+        # alerts left pending for users connected here
+        engine = get_alert_engine()
+        engine.add_delivery_handler(self._push_alert)
+        self._background.append(start_alert_monitor())
+        self._background.append(
+            asyncio.get_running_loop().create_task(engine.watch_pending(self.connected_users))
+        )
+
+    async def close(self) -> None:
+        """Stop background services and flush pending writes."""
+        await super().close()
+        await get_alert_engine().close()
+        # Write queued conversion records and release pooled connections
+        await close_history_writer()
+        await close_http_client()
+
+    async def answer_directly(self, user_id: str, session_id: str, text: str) -> Optional[str]:
+        if self.fast_path is None:
+            return None
+        return await self.fast_path.try_answer(user_id, text)
+
+    def add_listener(self, user_id: str, emit: Emit) -> None:
+        """Receive events pushed to a user, starting with pending alerts."""
+        super().add_listener(user_id, emit)
+        get_alert_engine().user_connected(user_id)
+
+    def connected_users(self) -> List[str]:
+        """Users with a listening client on this server."""
+        return list(self._listeners)
+
+    async def _push_alert(self, alert: Dict[str, Any]) -> bool:
+        """Alert delivery handler: forward the alert to the user's clients."""
+        return await self.push(alert["user_id"], {"event": "alert", "alert": alert}) > 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return server counters and fast-path metrics."""
+        stats = super().stats()
+        if self.fast_path is not None:
+            stats["fast_path"] = self.fast_path.stats()
+        return stats
+
+
+def create_server() -> CurrencyServer:
+    """Create the server (AGENT_MAX_CONCURRENCY, AGENT_STREAMING and FAST_PATH)."""
+    return CurrencyServer(create_orchestrator(), fast_path=create_fast_path(), **server_options())
+
+
+if __name__ == "__main__":
+    run_server(create_server)
@@ -0,0 +1,146 @@
+"""Tests for the shared rate snapshot file (tools/shared_snapshot.py).
+
+Run from starter_code/ with ``python -m pytest tests``.
+"""
+
+import threading
+
+import pytest
+
+from tools import shared_snapshot
+from tools.rate_engine import RateSnapshot
+from tools.shared_snapshot import VERSION, VERSION_OFFSET, SharedSnapshot
+
+CODES = ["USD", "GBP", "JPY", "CHF", "SEK"]
+
+
+def make_snapshot(day):
+    """A snapshot whose rates all equal its day, so torn reads show."""
+    return RateSnapshot(f"2026-01-{day:02d}", "EUR", {code: float(day) for code in CODES})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "rate_snapshot.bin")
+
+
+@pytest.fixture
+def writer(path):
+    snapshot = SharedSnapshot(path)
+    yield snapshot
+    snapshot.close()
+
+
+@pytest.fixture
+def reader(path):
+    snapshot = SharedSnapshot(path)
+    yield snapshot
+    snapshot.close()
+
+
+def test_nothing_published(reader):
+    assert reader.read() is None
+
+
+def test_round_trip(writer, reader):
+    writer.publish(make_snapshot(3), fetched_at=100.0, expires_at=200.0)
+
+    entry = reader.read()
+
+    assert entry.date == "2026-01-03"
+    assert entry.base == "EUR"
+    assert entry.rates == {code: 3.0 for code in CODES}
+    assert (entry.fetched_at, entry.expires_at) == (100.0, 200.0)
+    assert entry.version % 2 == 0
+
+
+def test_unchanged_version_reuses_entry(writer, reader):
+    writer.publish(make_snapshot(1), 0.0, 0.0)
+    first = reader.read()
+
+    assert reader.read() is first
+    assert reader.decodes == 1
+
+    writer.publish(make_snapshot(2), 0.0, 0.0)
+    assert reader.read().date == "2026-01-02"
+    assert reader.decodes == 2
+
+
+def test_read_retries_when_a_publish_overlaps(writer, reader, monkeypatch):
+    writer.publish(make_snapshot(1), 0.0, 0.0)
+
+    class PublishDuringRead:
+        """Publishes a new snapshot when the reader re-checks the version."""
+
+        def __init__(self):
+            self.calls = 0
+
+        def unpack_from(self, buffer, offset=0):
+            self.calls += 1
+            if self.calls == 2:
+                writer.publish(make_snapshot(2), 0.0, 0.0)
+            return VERSION.unpack_from(buffer, offset)
+
+        def pack_into(self, buffer, offset, *values):
+            VERSION.pack_into(buffer, offset, *values)
+
+    monkeypatch.setattr(shared_snapshot, "VERSION", PublishDuringRead())
+    entry = reader.read()
+
+    # The copy of snapshot 1 was discarded, not returned
+    assert entry.date == "2026-01-02"
+    assert entry.rates == {code: 2.0 for code in CODES}
+    assert reader.decodes == 1
+
+
+def test_publish_in_progress(writer, reader):
+    writer.publish(make_snapshot(1), 0.0, 0.0)
+    version = VERSION.unpack_from(writer._map, VERSION_OFFSET)[0]
+
+    # A writer that died mid-publish leaves the version odd
+    VERSION.pack_into(writer._map, VERSION_OFFSET, version + 1)
+    assert reader.read() is None
+
+    # The next publish recovers
+    writer.publish(make_snapshot(2), 0.0, 0.0)
+    entry = reader.read()
+    assert entry.version == version + 4
+    assert entry.date == "2026-01-02"
+
+
+def test_concurrent_reads_are_never_torn(writer, reader):
+    writer.publish(make_snapshot(1), 0.0, 0.0)
+    done = threading.Event()
+
+    def publish():
+        day = 1
+        while not done.is_set():
+            day = day % 28 + 1
+            writer.publish(make_snapshot(day), 0.0, 0.0)
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    try:
+        for _ in range(20_000):
+            entry = reader.read()
+            if entry is None:
+                continue
+            day = float(entry.date[-2:])
+            assert entry.rates == {code: day for code in CODES}
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_one_leader(path):
+    first, second = SharedSnapshot(path), SharedSnapshot(path)
+    try:
+        assert first.try_acquire_leadership()
+        assert not second.try_acquire_leadership()
+
+        first.close()
+        assert second.try_acquire_leadership()
+        assert second.is_leader
+    finally:
+        first.close()
+        second.close()
@@ -6,39 +6,23 @@ This package contains shared tools for currency operations.
 # Tools are defined in the individual agent files.
 # This file can be used for shared utility functions.
 
-from typing import Dict
-
-# Currency symbols mapping
-CURRENCY_SYMBOLS: Dict[str, str] = {
-    "USD": "$",
-    "EUR": "€",
-    "GBP": "£",
-    "JPY": "¥",
-    "CNY": "¥",
-    "INR": "₹",
-    "KRW": "₩",
-    "BRL": "R$",
-    "AUD": "A$",
-    "CAD": "C$",
-    "CHF": "CHF",
-    "HKD": "HK$",
-    "SGD": "S$",
-    "MXN": "MX$",
-    "NZD": "NZ$",
-}
+from .currency_catalog import currency_info
 
 
 def get_currency_symbol(currency_code: str) -> str:
-    """Get the symbol for a currency code."""
-    return CURRENCY_SYMBOLS.get(currency_code.upper(), currency_code.upper())
+    """Get the symbol for a currency code (see ``currency_catalog``)."""
+    return currency_info(currency_code).symbol
+
+
+def get_currency_decimals(currency_code: str) -> int:
+    """Get the number of decimal places used for a currency."""
+    return currency_info(currency_code).decimals
 
 
 def format_amount(amount: float, currency_code: str) -> str:
-    """Format an amount with its currency symbol."""
-    symbol = get_currency_symbol(currency_code)
-    
-    # No decimals for JPY and KRW
-    if currency_code.upper() in ["JPY", "KRW"]:
-        return f"{symbol}{int(amount):,}"
+    """Format an amount with its currency symbol and decimal places."""
+    info = currency_info(currency_code)
     
-    return f"{symbol}{amount:,.2f}"
+    # Currencies without a symbol are written as e.g. "SEK 1,250.00"
+    symbol = info.symbol + " " if info.symbol == info.code else info.symbol
+    return f"{symbol}{amount:,.{info.decimals}f}"
@@ -0,0 +1,322 @@
+"""Rate Alert Store.
+
+Durable storage for users' rate alerts, backed by SQLite in WAL mode
+(RATE_ALERTS_DB, default ``data/rate_alerts.db``).
+
+An alert moves from ``active`` to either ``triggered`` or ``cancelled``
+exactly once. ``claim_triggered`` performs that move inside a
+``BEGIN IMMEDIATE`` transaction and returns only the alerts it actually
+changed, so an alert is delivered once even if several processes evaluate
+the same rates.
+
+A triggered alert stays pending until a client has received it:
+``pending_for_users`` finds the undelivered alerts of the users a process
+has connections for, and ``mark_delivered`` records the delivery. The
+process that triggers an alert is not necessarily the one the user is
+connected to.
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .sqlite_store import LazyStore, SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    source_currency TEXT NOT NULL,
+    target_currency TEXT NOT NULL,
+    direction TEXT NOT NULL CHECK (direction IN ('above', 'below')),
+    threshold REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at TEXT NOT NULL,
+    triggered_at TEXT,
+    triggered_rate REAL,
+    rate_date TEXT,
+    delivered_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS alerts_by_user ON alerts (user_id, id);
+CREATE INDEX IF NOT EXISTS active_alerts ON alerts (id) WHERE status = 'active';
+"""
+
+ALERT_COLUMNS = (
+    "id", "user_id", "source_currency", "target_currency", "direction",
+    "threshold", "status", "created_at", "triggered_at", "triggered_rate",
+    "rate_date", "delivered_at"
+)
+
+# Created after the delivered_at column, which older databases lack
+PENDING_INDEX = (
+    "CREATE INDEX IF NOT EXISTS pending_alerts ON alerts (user_id, id)"
+    " WHERE status = 'triggered' AND delivered_at IS NULL"
+)
+
+# Maximum ids bound into one IN (...) clause
+MAX_PARAMS = 500
+
+
+def _to_alert(row: Tuple[Any, ...]) -> Dict[str, Any]:
+    """Convert a row selected with ALERT_COLUMNS into an alert dict."""
+    return dict(zip(ALERT_COLUMNS, row))
+
+
+class AlertStore(SQLiteStore):
+    """
+    SQLite-backed rate alerts.
+
+    Args:
+        path: Database file path (default: RATE_ALERTS_DB or
+            data/rate_alerts.db)
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path or os.environ.get(
+            "RATE_ALERTS_DB", os.path.join("data", "rate_alerts.db")
+        ))
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Add the delivered_at column to databases created without it."""
+        with self._write() as cursor:
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(alerts)")}
+            if "delivered_at" not in columns:
+                cursor.execute("ALTER TABLE alerts ADD COLUMN delivered_at TEXT")
+                # Alerts triggered before delivery was tracked are not resent
+                cursor.execute(
+                    "UPDATE alerts SET delivered_at = triggered_at"
+                    " WHERE status = 'triggered'"
+                )
+            cursor.execute(PENDING_INDEX)
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+
+    def create(
+        self,
+        user_id: str,
+        source_currency: str,
+        target_currency: str,
+        direction: str,
+        threshold: float
+    ) -> Dict[str, Any]:
+        """
+        Create an active alert.
+
+        Returns:
+            The stored alert, including its id
+        """
+        return self.create_many([{
+            "user_id": user_id,
+            "source_currency": source_currency,
+            "target_currency": target_currency,
+            "direction": direction,
+            "threshold": threshold,
+        }])[0]
+
+    def create_many(self, alerts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create several alerts in a single transaction.
+
+        Args:
+            alerts: Dicts with user_id, source_currency, target_currency,
+                direction and threshold
+
+        Returns:
+            The stored alerts, in order
+        """
+        created_at = datetime.now().isoformat()
+        stored = []
+
+        with self._write() as cursor:
+            for alert in alerts:
+                values = (
+                    alert["user_id"],
+                    alert["source_currency"].upper(),
+                    alert["target_currency"].upper(),
+                    alert["direction"],
+                    float(alert["threshold"]),
+                    created_at,
+                )
+                cursor.execute(
+                    "INSERT INTO alerts (user_id, source_currency, target_currency,"
+                    " direction, threshold, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    values
+                )
+                stored.append(_to_alert(
+                    (cursor.lastrowid, *values[:5], "active", created_at, None, None, None, None)
+                ))
+
+        return stored
+
+    def cancel(self, user_id: str, alert_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cancel one of a user's active alerts.
+
+        Returns:
+            The cancelled alert, or None if the user has no such active alert
+        """
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE alerts SET status = 'cancelled'"
+                " WHERE id = ? AND user_id = ? AND status = 'active'",
+                (alert_id, user_id)
+            )
+            changed = cursor.rowcount
+            row = cursor.execute(
+                f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts WHERE id = ?",
+                (alert_id,)
+            ).fetchone()
+
+        return _to_alert(row) if changed else None
+
+    def claim_triggered(
+        self,
+        triggered: Sequence[Tuple[float, Sequence[int]]],
+        rate_date: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Mark alerts as triggered if they are still active.
+
+        Args:
+            triggered: (rate, alert ids) groups, one per crossed rate
+            rate_date: Date of the rates
+
+        Returns:
+            The alerts that were moved from active to triggered (alerts
+            already triggered or cancelled elsewhere are left out)
+        """
+        triggered_at = datetime.now().isoformat()
+        claimed = []
+
+        with self._write() as cursor:
+            for rate, alert_ids in triggered:
+                for start in range(0, len(alert_ids), MAX_PARAMS):
+                    chunk = list(alert_ids[start:start + MAX_PARAMS])
+                    placeholders = ", ".join("?" * len(chunk))
+                    rows = cursor.execute(
+                        f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts"
+                        f" WHERE status = 'active' AND id IN ({placeholders})",
+                        chunk
+                    ).fetchall()
+                    cursor.execute(
+                        "UPDATE alerts SET status = 'triggered', triggered_at = ?,"
+                        " triggered_rate = ?, rate_date = ?"
+                        f" WHERE status = 'active' AND id IN ({placeholders})",
+                        [triggered_at, rate, rate_date, *chunk]
+                    )
+                    for row in rows:
+                        alert = _to_alert(row)
+                        alert.update(
+                            status="triggered",
+                            triggered_at=triggered_at,
+                            triggered_rate=rate,
+                            rate_date=rate_date
+                        )
+                        claimed.append(alert)
+
+        return claimed
+
+    def mark_delivered(self, alert_ids: Sequence[int]) -> int:
+        """
+        Record that triggered alerts have reached the user.
+
+        Returns:
+            Number of alerts that were still pending
+        """
+        delivered_at = datetime.now().isoformat()
+        changed = 0
+
+        with self._write() as cursor:
+            for start in range(0, len(alert_ids), MAX_PARAMS):
+                chunk = list(alert_ids[start:start + MAX_PARAMS])
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(
+                    "UPDATE alerts SET delivered_at = ?"
+                    " WHERE status = 'triggered' AND delivered_at IS NULL"
+                    f" AND id IN ({placeholders})",
+                    [delivered_at, *chunk]
+                )
+                changed += cursor.rowcount
+
+        return changed
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+
+    def list_for_user(
+        self,
+        user_id: str,
+        include_inactive: bool = False,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Get a user's alerts, newest first."""
+        status_filter = "" if include_inactive else " AND status = 'active'"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts"
+                f" WHERE user_id = ?{status_filter} ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [_to_alert(row) for row in rows]
+
+    def pending_for_users(
+        self,
+        user_ids: Sequence[str],
+        limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Get triggered alerts not yet delivered to the given users, oldest first."""
+        pending = []
+        with self._lock:
+            for start in range(0, len(user_ids), MAX_PARAMS):
+                chunk = list(user_ids[start:start + MAX_PARAMS])
+                placeholders = ", ".join("?" * len(chunk))
+                pending.extend(self._conn.execute(
+                    f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts"
+                    " WHERE status = 'triggered' AND delivered_at IS NULL"
+                    f" AND user_id IN ({placeholders}) ORDER BY id LIMIT ?",
+                    [*chunk, limit]
+                ).fetchall())
+        pending.sort()
+        return [_to_alert(row) for row in pending[:limit]]
+
+    def iter_active(self, batch_size: int = 50_000) -> Iterator[Tuple[int, str, str, str, float]]:
+        """
+        Stream every active alert as (id, source, target, direction, threshold).
+
+        Reads in id order with a keyset cursor, so memory stays bounded.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, source_currency, target_currency, direction, threshold"
+                    " FROM alerts WHERE status = 'active' AND id > ?"
+                    " ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def count_active(self) -> int:
+        """Get the number of active alerts."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM alerts WHERE status = 'active'"
+            ).fetchone()[0]
+
+
+_store = LazyStore(AlertStore)
+
+
+def get_alert_store() -> AlertStore:
+    """Get the process-wide alert store, opening the database on first use."""
+    return _store.get()
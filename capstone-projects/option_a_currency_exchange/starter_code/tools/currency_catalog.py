@@ -0,0 +1,341 @@
+"""Currency Catalog.
+
+The single source of currency metadata for every tool: which codes are
+supported, their names, symbols and minor units. Tools check codes against
+the catalog before doing anything else, so an invalid code is rejected
+locally instead of costing an API request.
+
+The list of codes and names comes from the Frankfurter ``/currencies``
+endpoint and is cached on disk (CURRENCY_CATALOG_FILE, default
+``data/currencies.json``). Once the cache is older than
+CURRENCY_CATALOG_TTL seconds (default one day) it is revalidated with a
+conditional request (If-None-Match / If-Modified-Since), which costs a
+304 with no body when nothing changed. Revalidation runs in the background
+while callers keep getting the stale catalog, so only the very first load
+(with no cache on disk) waits for the API. The API only names currencies;
+symbols and minor units come from ``CURRENCY_METADATA``, and
+``currency_info`` (behind ``tools.format_amount``) reads them for any code,
+loaded or not.
+
+If the API has never been reached and there is no cache, a built-in list
+of major currencies is used. Validation is then limited to the code format,
+so valid currencies outside the built-in list are not rejected.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from .http_client import FRANKFURTER_API_URL, get_http_client
+from .resilience import RETRY_ATTEMPTS, fetch_with_retry
+
+# Used until the catalog has been loaded from the API once
+DEFAULT_CURRENCIES: Dict[str, str] = {
+    "USD": "United States Dollar",
+    "EUR": "Euro",
+    "GBP": "British Pound Sterling",
+    "JPY": "Japanese Yen",
+    "AUD": "Australian Dollar",
+    "CAD": "Canadian Dollar",
+    "CHF": "Swiss Franc",
+    "CNY": "Chinese Yuan",
+    "INR": "Indian Rupee",
+    "MXN": "Mexican Peso",
+    "BRL": "Brazilian Real",
+    "KRW": "South Korean Won",
+    "SGD": "Singapore Dollar",
+    "HKD": "Hong Kong Dollar",
+    "NZD": "New Zealand Dollar",
+}
+
+# Symbol and minor units (ISO 4217) per currency; others are written with
+# their code and two decimals
+CURRENCY_METADATA: Dict[str, Tuple[str, int]] = {
+    "USD": ("$", 2),
+    "EUR": ("€", 2),
+    "GBP": ("£", 2),
+    "JPY": ("¥", 0),
+    "CNY": ("¥", 2),
+    "INR": ("₹", 2),
+    "KRW": ("₩", 0),
+    "BRL": ("R$", 2),
+    "AUD": ("A$", 2),
+    "CAD": ("C$", 2),
+    "CHF": ("CHF", 2),
+    "HKD": ("HK$", 2),
+    "SGD": ("S$", 2),
+    "MXN": ("MX$", 2),
+    "NZD": ("NZ$", 2),
+    "ISK": ("ISK", 0),
+}
+
+# Seconds before retrying the API after a failed load
+RETRY_INTERVAL = 60.0
+
+CODE_PATTERN = re.compile(r"^[A-Z]{3}$")
+
+
+class CurrencyInfo(NamedTuple):
+    """Metadata for one currency."""
+    code: str
+    name: str
+    symbol: str
+    decimals: int
+
+
+def _describe(code: str, name: str) -> CurrencyInfo:
+    """Build a currency's metadata from ``CURRENCY_METADATA``."""
+    symbol, decimals = CURRENCY_METADATA.get(code, (code, 2))
+    return CurrencyInfo(code, name, symbol, decimals)
+
+
+class CurrencyCatalog:
+    """
+    Lazily loaded, disk-cached catalog of supported currencies.
+
+    Args:
+        path: JSON cache file
+        ttl: Seconds before the cached list is revalidated
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 86400.0):
+        self.path = path or os.environ.get(
+            "CURRENCY_CATALOG_FILE", os.path.join("data", "currencies.json")
+        )
+        self.ttl = ttl
+
+        self._currencies: Dict[str, CurrencyInfo] = {}
+        self.source = "none"
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._revalidation: Optional[asyncio.Task] = None
+
+        self.fetches = 0
+        self.not_modified = 0
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    def _is_fresh(self) -> bool:
+        return time.time() - self._fetched_at < self.ttl
+
+    async def load(self) -> Dict[str, CurrencyInfo]:
+        """
+        Get the catalog, loading or revalidating it if needed.
+
+        Returns immediately once a catalog is loaded: a stale one is
+        returned as is and revalidated in the background. Only the first
+        load, with no disk cache, waits for the API; concurrent callers
+        share it.
+
+        Returns:
+            Dict mapping currency codes to their metadata
+        """
+        if not self._currencies:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if not self._currencies:
+                    self._read_cache()
+                if not self._currencies:
+                    await self._revalidate()
+                    return self._currencies
+
+        if not self._is_fresh() and time.time() >= self._retry_at:
+            self._revalidate_in_background()
+        return self._currencies
+
+    def _revalidate_in_background(self) -> None:
+        """Start a revalidation task unless one is running."""
+        if self._revalidation is not None and not self._revalidation.done():
+            return
+        self._revalidation = asyncio.get_running_loop().create_task(self._revalidate())
+
+    async def _revalidate(self) -> None:
+        """Load or revalidate the catalog from the API."""
+        result = await fetch_with_retry(self._fetch, attempts=RETRY_ATTEMPTS)
+        if result["status"] == "success":
+            self._fetched_at = time.time()
+            self._retry_at = 0.0
+            if result["names"] is not None:
+                self._set(result["names"], "api")
+            self._write_cache()
+        else:
+            self._retry_at = time.time() + RETRY_INTERVAL
+            if not self._currencies:
+                self._set(DEFAULT_CURRENCIES, "builtin")
+
+    async def _fetch(self) -> Dict[str, Any]:
+        """Conditionally fetch the currency list from the API."""
+        headers = {}
+        if self._currencies and self.source != "builtin":
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+        try:
+            client = await get_http_client()
+            response = await client.get(
+                f"{FRANKFURTER_API_URL}/currencies", headers=headers
+            )
+        except httpx.HTTPError as e:
+            return {
+                "status": "error",
+                "message": f"Failed to fetch currencies: {str(e)}"
+            }
+
+        self.fetches += 1
+        if response.status_code == 304:
+            self.not_modified += 1
+            return {"status": "success", "names": None}
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "message": f"API error: {response.status_code}",
+                "retryable": response.status_code >= 500 or response.status_code == 429
+            }
+
+        try:
+            names = response.json()
+        except ValueError:
+            names = None
+        # Expected: {"USD": "United States Dollar", ...}
+        if not isinstance(names, dict) or not all(
+            isinstance(code, str) and isinstance(name, str) for code, name in names.items()
+        ):
+            return {
+                "status": "error",
+                "message": "API returned a malformed currency list"
+            }
+
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        return {"status": "success", "names": names}
+
+    def _set(self, names: Dict[str, str], source: str) -> None:
+        self._currencies = {
+            code: _describe(code, name) for code, name in sorted(names.items())
+        }
+        self.source = source
+
+    def _read_cache(self) -> None:
+        """Load the catalog from the disk cache, if there is one."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cached = json.load(f)
+            names = cached["currencies"]
+            etag = cached.get("etag")
+            last_modified = cached.get("last_modified")
+            fetched_at = float(cached.get("fetched_at", 0.0))
+            self._set(names, "disk")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # Missing, corrupt or from an older layout: load from the API
+            self._currencies = {}
+            return
+
+        self._etag = etag
+        self._last_modified = last_modified
+        self._fetched_at = fetched_at
+
+    def _write_cache(self) -> None:
+        """Save the catalog and its validators to disk."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "etag": self._etag,
+                "last_modified": self._last_modified,
+                "fetched_at": self._fetched_at,
+                "currencies": {c: info.name for c, info in self._currencies.items()},
+            }, f, indent=2)
+        # Atomic so other processes never read a half-written cache
+        os.replace(temp_path, self.path)
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def get(self, currency_code: str) -> Optional[CurrencyInfo]:
+        """Get the metadata for a loaded currency code."""
+        return self._currencies.get(currency_code.strip().upper())
+
+    async def find_unsupported(self, currency_codes: List[str]) -> List[str]:
+        """
+        Find the codes that are not supported currencies.
+
+        Args:
+            currency_codes: Normalized (upper-case) currency codes
+
+        Returns:
+            The unsupported codes, in order
+        """
+        currencies = await self.load()
+        return [
+            code for code in currency_codes
+            if not CODE_PATTERN.match(code)
+            or (self.source != "builtin" and code not in currencies)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return catalog source, size and revalidation counters."""
+        return {
+            "source": self.source,
+            "currencies": len(self._currencies),
+            "age_seconds": round(time.time() - self._fetched_at, 1) if self._fetched_at else None,
+            "fetches": self.fetches,
+            "not_modified": self.not_modified,
+        }
+
+
+_catalog = CurrencyCatalog(
+    ttl=float(os.environ.get("CURRENCY_CATALOG_TTL", 86400))
+)
+
+
+def get_currency_catalog() -> CurrencyCatalog:
+    """Get the process-wide currency catalog."""
+    return _catalog
+
+
+def currency_info(currency_code: str) -> CurrencyInfo:
+    """
+    Get a currency's metadata, from the catalog once it is loaded.
+
+    Codes the catalog doesn't know (or before it is loaded) get their
+    symbol and minor units from ``CURRENCY_METADATA``, named by their code.
+    """
+    code = currency_code.strip().upper()
+    info = _catalog.get(code)
+    return info if info is not None else _describe(code, code)
+
+
+async def check_currencies(*currency_codes: str) -> Optional[Dict[str, Any]]:
+    """
+    Validate currency codes against the catalog.
+
+    Args:
+        currency_codes: Normalized (upper-case) currency codes
+
+    Returns:
+        An error result naming the unsupported codes, or None if all are valid
+    """
+    unsupported = await _catalog.find_unsupported(list(currency_codes))
+    if not unsupported:
+        return None
+    return {
+        "status": "error",
+        "message": (
+            f"Unsupported currency code(s): {', '.join(unsupported)}. "
+            "Use list_supported_currencies to see valid codes."
+        )
+    }
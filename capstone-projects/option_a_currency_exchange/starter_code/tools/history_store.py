@@ -0,0 +1,645 @@
+"""Conversion History Store.
+
+Durable storage for users' conversion history, backed by SQLite in WAL mode
+(CONVERSION_HISTORY_DB, default ``data/conversion_history.db``).
+
+Each user's records are numbered 1, 2, 3, ... in the order they were
+written. The (user_id, seq) primary key is the per-user, time-ordered
+index: appends, "newest N" reads and cursor pagination are all B-tree
+lookups that never scan the user's full history. WAL mode plus
+``BEGIN IMMEDIATE`` transactions let several worker processes write to the
+same database safely.
+
+Per-user aggregates (record count, first/last timestamps, pair counts and
+volume by currency) are updated in the same transaction as each append,
+so statistics never rescan the raw log. Secondary indexes on
+(user_id, timestamp) and (user_id, currency) serve date-range and currency
+searches with index range scans. To check the aggregates against
+the log, or rebuild them from it:
+
+    python -m tools.history_store verify [--user USER_ID] [--rebuild]
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .sqlite_store import LazyStore, SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversions (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    source_currency TEXT NOT NULL,
+    target_currency TEXT NOT NULL,
+    source_amount REAL NOT NULL,
+    target_amount REAL NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL,
+    total_conversions INTEGER NOT NULL,
+    first_timestamp TEXT NOT NULL,
+    last_timestamp TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS pair_stats (
+    user_id TEXT NOT NULL,
+    source_currency TEXT NOT NULL,
+    target_currency TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, source_currency, target_currency)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS conversions_by_time
+    ON conversions (user_id, timestamp, seq);
+CREATE INDEX IF NOT EXISTS conversions_by_source
+    ON conversions (user_id, source_currency, seq);
+CREATE INDEX IF NOT EXISTS conversions_by_target
+    ON conversions (user_id, target_currency, seq);
+
+CREATE INDEX IF NOT EXISTS pair_stats_by_count ON pair_stats (user_id, count DESC);
+
+CREATE TABLE IF NOT EXISTS currency_volume (
+    user_id TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    sent REAL NOT NULL,
+    received REAL NOT NULL,
+    PRIMARY KEY (user_id, currency)
+) WITHOUT ROWID;
+"""
+
+# Aggregates recomputed from the raw log, used by rebuild and verify.
+# Each query takes one parameter: a user_id, or NULL for all users.
+AGGREGATE_QUERIES = {
+    "user_stats": """
+        SELECT user_id, MAX(seq), COUNT(*), MIN(timestamp), MAX(timestamp)
+        FROM conversions WHERE ?1 IS NULL OR user_id = ?1
+        GROUP BY user_id
+    """,
+    "pair_stats": """
+        SELECT user_id, source_currency, target_currency, COUNT(*)
+        FROM conversions WHERE ?1 IS NULL OR user_id = ?1
+        GROUP BY user_id, source_currency, target_currency
+    """,
+    "currency_volume": """
+        SELECT user_id, currency, SUM(sent), SUM(received) FROM (
+            SELECT user_id, source_currency AS currency,
+                   source_amount AS sent, 0.0 AS received
+            FROM conversions WHERE ?1 IS NULL OR user_id = ?1
+            UNION ALL
+            SELECT user_id, target_currency, 0.0, target_amount
+            FROM conversions WHERE ?1 IS NULL OR user_id = ?1
+        )
+        GROUP BY user_id, currency
+    """,
+}
+
+# Primary key width of each aggregate table (leading columns)
+AGGREGATE_KEYS = {"user_stats": 1, "pair_stats": 3, "currency_volume": 2}
+
+RECORD_COLUMNS = (
+    "seq", "timestamp", "source_currency", "target_currency",
+    "source_amount", "target_amount", "rate"
+)
+
+
+def _to_record(row: Tuple[Any, ...]) -> Dict[str, Any]:
+    """Convert a row selected with RECORD_COLUMNS into a history record."""
+    return {"id": row[0], **dict(zip(RECORD_COLUMNS[1:], row[1:]))}
+
+
+class HistoryStore(SQLiteStore):
+    """
+    SQLite-backed conversion history.
+
+    Args:
+        path: Database file path (default: CONVERSION_HISTORY_DB or
+            data/conversion_history.db)
+    """
+
+    SCHEMA = SCHEMA
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path or os.environ.get(
+            "CONVERSION_HISTORY_DB", os.path.join("data", "conversion_history.db")
+        ))
+
+        with self._lock:
+            needs_rebuild = (
+                self._conn.execute("SELECT 1 FROM conversions LIMIT 1").fetchone()
+                and not self._conn.execute("SELECT 1 FROM user_stats LIMIT 1").fetchone()
+            )
+
+        # Databases written before aggregates existed
+        if needs_rebuild:
+            self.rebuild_stats()
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+
+    def append(
+        self,
+        user_id: str,
+        source_currency: str,
+        target_currency: str,
+        source_amount: float,
+        target_amount: float,
+        rate: float,
+        timestamp: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Append a conversion to a user's history.
+
+        Returns:
+            The stored record, including its per-user id
+        """
+        return self.append_many(user_id, [{
+            "timestamp": timestamp,
+            "source_currency": source_currency,
+            "target_currency": target_currency,
+            "source_amount": source_amount,
+            "target_amount": target_amount,
+            "rate": rate,
+        }])[0]
+
+    def append_many(
+        self,
+        user_id: str,
+        conversions: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Append several conversions for one user in a single transaction.
+
+        Args:
+            user_id: The user's identifier
+            conversions: Dicts with source_currency, target_currency,
+                source_amount, target_amount, rate and optional timestamp
+
+        Returns:
+            The stored records, in order
+        """
+        # Take the write lock up front so concurrent writers in other
+        # processes cannot be handed the same sequence number
+        with self._write() as cursor:
+            row = cursor.execute(
+                "SELECT last_seq FROM user_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            seq = row[0] if row else 0
+
+            records = []
+            for conversion in conversions:
+                seq += 1
+                record = {
+                    "id": seq,
+                    "timestamp": conversion.get("timestamp") or datetime.now().isoformat(),
+                    "source_currency": conversion["source_currency"].upper(),
+                    "target_currency": conversion["target_currency"].upper(),
+                    "source_amount": conversion["source_amount"],
+                    "target_amount": conversion["target_amount"],
+                    "rate": conversion["rate"],
+                }
+                self._insert(cursor, user_id, record)
+                records.append(record)
+
+            if records:
+                self._update_stats(cursor, user_id, records)
+
+        return records
+
+    def _insert(self, cursor: sqlite3.Cursor, user_id: str, record: Dict[str, Any]) -> None:
+        """Insert one record inside an open transaction."""
+        cursor.execute(
+            "INSERT INTO conversions (user_id, seq, timestamp, source_currency,"
+            " target_currency, source_amount, target_amount, rate)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id, record["id"], record["timestamp"],
+                record["source_currency"], record["target_currency"],
+                record["source_amount"], record["target_amount"], record["rate"],
+            )
+        )
+
+    def _update_stats(
+        self,
+        cursor: sqlite3.Cursor,
+        user_id: str,
+        records: List[Dict[str, Any]]
+    ) -> None:
+        """Fold newly appended records into the user's aggregates."""
+        pairs: Dict[Tuple[str, str], int] = {}
+        volume: Dict[str, List[float]] = {}
+        for record in records:
+            pair = (record["source_currency"], record["target_currency"])
+            pairs[pair] = pairs.get(pair, 0) + 1
+            volume.setdefault(record["source_currency"], [0.0, 0.0])[0] += record["source_amount"]
+            volume.setdefault(record["target_currency"], [0.0, 0.0])[1] += record["target_amount"]
+
+        cursor.execute(
+            "INSERT INTO user_stats VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (user_id) DO UPDATE SET"
+            " last_seq = excluded.last_seq,"
+            " total_conversions = total_conversions + excluded.total_conversions,"
+            " last_timestamp = excluded.last_timestamp",
+            (
+                user_id, records[-1]["id"], len(records),
+                records[0]["timestamp"], records[-1]["timestamp"],
+            )
+        )
+        cursor.executemany(
+            "INSERT INTO pair_stats VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (user_id, source_currency, target_currency)"
+            " DO UPDATE SET count = count + excluded.count",
+            [(user_id, s, t, n) for (s, t), n in pairs.items()]
+        )
+        cursor.executemany(
+            "INSERT INTO currency_volume VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (user_id, currency) DO UPDATE SET"
+            " sent = sent + excluded.sent, received = received + excluded.received",
+            [(user_id, c, sent, received) for c, (sent, received) in volume.items()]
+        )
+
+    def clear(self, user_id: str) -> int:
+        """
+        Delete a user's history.
+
+        Returns:
+            Number of deleted records
+        """
+        with self._write() as cursor:
+            deleted = cursor.execute(
+                "DELETE FROM conversions WHERE user_id = ?", (user_id,)
+            ).rowcount
+            for table in AGGREGATE_QUERIES:
+                cursor.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+        return deleted
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+
+    def count(self, user_id: str) -> int:
+        """Get the number of records in a user's history."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total_conversions FROM user_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def stats(self, user_id: str, top_k: int = 5) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's aggregate statistics without scanning their history.
+
+        Args:
+            user_id: The user's identifier
+            top_k: Number of most used pairs to return
+
+        Returns:
+            Statistics dict, or None if the user has no history
+        """
+        with self._lock:
+            summary = self._conn.execute(
+                "SELECT total_conversions, first_timestamp, last_timestamp"
+                " FROM user_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if summary is None:
+                return None
+
+            pairs = self._conn.execute(
+                "SELECT source_currency, target_currency, count FROM pair_stats"
+                " WHERE user_id = ? ORDER BY count DESC", (user_id,)
+            ).fetchall()
+            volume = self._conn.execute(
+                "SELECT currency, sent, received FROM currency_volume"
+                " WHERE user_id = ? ORDER BY currency", (user_id,)
+            ).fetchall()
+
+        return {
+            "total_conversions": summary[0],
+            "first_conversion": summary[1],
+            "last_conversion": summary[2],
+            "currency_pairs": {f"{s}->{t}": n for s, t, n in pairs},
+            "top_pairs": [
+                {"pair": f"{s}->{t}", "count": n} for s, t, n in pairs[:top_k]
+            ],
+            "volume_by_currency": {
+                currency: {"sent": round(sent, 2), "received": round(received, 2)}
+                for currency, sent, received in volume
+            },
+        }
+
+    def page(
+        self,
+        user_id: str,
+        limit: int = 10,
+        before: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Get one page of a user's history, newest first.
+
+        Args:
+            user_id: The user's identifier
+            limit: Maximum number of records to return
+            before: Cursor from a previous page (only older records are returned)
+
+        Returns:
+            Tuple of (records, next_cursor); next_cursor is None on the last page
+        """
+        query = f"SELECT {', '.join(RECORD_COLUMNS)} FROM conversions WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC LIMIT ?"
+        # Fetch one extra row to learn whether another page exists
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return self._paginate(rows, limit)
+
+    @staticmethod
+    def _paginate(
+        rows: List[Tuple[Any, ...]],
+        limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Turn up to limit + 1 newest-first rows into (records, next_cursor)."""
+        records = [_to_record(row) for row in rows[:limit]]
+        next_cursor = records[-1]["id"] if len(rows) > limit else None
+        return records, next_cursor
+
+    def search_currency(
+        self,
+        user_id: str,
+        currency: str,
+        limit: int = 10,
+        before: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Get conversions from or to a currency, newest first.
+
+        Each side is an index range scan on (user_id, currency, seq).
+
+        Returns:
+            Tuple of (records, next_cursor); next_cursor is None on the last page
+        """
+        columns = ", ".join(RECORD_COLUMNS)
+        params = {
+            "user_id": user_id,
+            "currency": currency.upper(),
+            "before": before,
+            "limit": limit + 1,
+        }
+        query = (
+            f"SELECT {columns} FROM conversions"
+            " WHERE user_id = :user_id AND source_currency = :currency"
+            " AND (:before IS NULL OR seq < :before)"
+            " UNION"
+            f" SELECT {columns} FROM conversions"
+            " WHERE user_id = :user_id AND target_currency = :currency"
+            " AND (:before IS NULL OR seq < :before)"
+            " ORDER BY seq DESC LIMIT :limit"
+        )
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return self._paginate(rows, limit)
+
+    def search_dates(
+        self,
+        user_id: str,
+        start: str,
+        end: str,
+        limit: int = 10,
+        before: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Get conversions with start <= timestamp < end, newest first.
+
+        Args:
+            user_id: The user's identifier
+            start: Inclusive lower bound (ISO date or timestamp)
+            end: Exclusive upper bound (ISO date or timestamp)
+            limit: Maximum number of records to return
+            before: Cursor from a previous page
+
+        Returns:
+            Tuple of (records, next_cursor); next_cursor is None on the last page
+        """
+        query = (
+            f"SELECT {', '.join(RECORD_COLUMNS)} FROM conversions"
+            " WHERE user_id = ? AND timestamp >= ? AND timestamp < ?"
+        )
+        params: List[Any] = [user_id, start, end]
+        if before is not None:
+            # Resume after the cursor record in (timestamp, seq) order
+            query += (
+                " AND (timestamp, seq) < (SELECT timestamp, seq FROM conversions"
+                " WHERE user_id = ? AND seq = ?)"
+            )
+            params.extend([user_id, before])
+        query += " ORDER BY timestamp DESC, seq DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return self._paginate(rows, limit)
+
+    def iter_records(self, user_id: str, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Iterate over a user's full history, oldest first, in batches."""
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(RECORD_COLUMNS)} FROM conversions"
+                    " WHERE user_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (user_id, last_seq, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _to_record(row)
+            last_seq = rows[-1][0]
+
+
+    # -------------------------------------------------------------------------
+    # Aggregate maintenance
+    # -------------------------------------------------------------------------
+
+    def rebuild_stats(self, user_id: Optional[str] = None) -> None:
+        """Recompute aggregates from the raw log for one user, or for everyone."""
+        with self._write() as cursor:
+            for table, query in AGGREGATE_QUERIES.items():
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE ?1 IS NULL OR user_id = ?1",
+                    (user_id,)
+                )
+                cursor.execute(f"INSERT INTO {table} {query}", (user_id,))
+
+    def verify_stats(self, user_id: Optional[str] = None) -> List[str]:
+        """
+        Check stored aggregates against the raw log.
+
+        Args:
+            user_id: Only check this user (default: all users)
+
+        Returns:
+            Human-readable descriptions of every mismatch (empty if consistent)
+        """
+        problems = []
+        with self._lock:
+            for table, query in AGGREGATE_QUERIES.items():
+                width = AGGREGATE_KEYS[table]
+                expected = {
+                    row[:width]: row[width:]
+                    for row in self._conn.execute(query, (user_id,))
+                }
+                stored = {
+                    row[:width]: row[width:]
+                    for row in self._conn.execute(
+                        f"SELECT * FROM {table} WHERE ?1 IS NULL OR user_id = ?1",
+                        (user_id,)
+                    )
+                }
+
+                for key in expected.keys() | stored.keys():
+                    want, have = expected.get(key), stored.get(key)
+                    if want is None or have is None or not all(
+                        a == b or (
+                            isinstance(a, float) and math.isclose(a, b, rel_tol=1e-9)
+                        )
+                        for a, b in zip(want, have)
+                    ):
+                        problems.append(
+                            f"{table}{list(key)}: expected {want}, stored {have}"
+                        )
+
+        return problems
+
+
+# =============================================================================
+# EXPORT
+# =============================================================================
+
+EXPORT_FIELDS = ("id",) + RECORD_COLUMNS[1:]
+
+
+def iter_export_lines(
+    records: Iterator[Dict[str, Any]],
+    export_format: str = "csv"
+) -> Iterator[str]:
+    """
+    Serialize records lazily, one output line at a time.
+
+    Args:
+        records: Record iterator (e.g. HistoryStore.iter_records)
+        export_format: 'csv' or 'jsonl'
+
+    Yields:
+        Lines of the export, each ending with a newline
+    """
+    if export_format == "jsonl":
+        for record in records:
+            yield json.dumps(record) + "\n"
+        return
+
+    if export_format != "csv":
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for empty histories
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def export_to_file(
+    store: HistoryStore,
+    user_id: str,
+    path: str,
+    export_format: str = "csv"
+) -> int:
+    """
+    Stream a user's full history to a file with constant memory.
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+
+    def counted(records: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        handle.writelines(
+            iter_export_lines(counted(store.iter_records(user_id)), export_format)
+        )
+
+    return count
+
+
+_store = LazyStore(HistoryStore)
+
+
+def get_history_store() -> HistoryStore:
+    """Get the process-wide history store, opening the database on first use."""
+    return _store.get()
+
+
+def main() -> None:
+    """Command-line entry point for checking and rebuilding aggregates."""
+    parser = argparse.ArgumentParser(description="Conversion history maintenance")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--user", help="Only check this user")
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Rebuild the aggregates from the raw log if they do not match"
+    )
+    args = parser.parse_args()
+
+    store = get_history_store()
+    problems = store.verify_stats(args.user)
+
+    if not problems:
+        print("✅ Aggregates match the conversion log")
+        return
+
+    print(f"❌ {len(problems)} aggregate mismatches:")
+    for problem in problems:
+        print(f"   {problem}")
+
+    if args.rebuild:
+        store.rebuild_stats(args.user)
+        print("✅ Aggregates rebuilt from the conversion log")
+
+
+if __name__ == "__main__":
+    main()
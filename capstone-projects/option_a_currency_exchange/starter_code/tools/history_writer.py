@@ -0,0 +1,216 @@
+"""Write-Behind History Recorder.
+
+Conversions are recorded automatically after ``convert_currency`` succeeds,
+without an extra agent transfer or model round trip. The tool callback only
+puts the record on an in-memory queue; a background task writes queued
+records to the history store in batches (one transaction per user per
+batch).
+
+- The queue is bounded (HISTORY_QUEUE_SIZE, default 10000). When it is
+  full, submitters wait for the writer to catch up instead of dropping
+  records.
+- Batches are written every HISTORY_FLUSH_INTERVAL seconds (default 1.0)
+  or as soon as HISTORY_BATCH_SIZE records (default 500) are waiting.
+- ``flush()`` returns once everything submitted before it is in the
+  store; history reads call it first, so a conversion is visible as soon
+  as it has been made.
+- ``close_history_writer()`` flushes everything that is still queued;
+  call it on shutdown.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .history_store import HistoryStore, get_history_store
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriteBehind:
+    """
+    Async write-behind batcher in front of the history store.
+
+    Args:
+        store: History store to write to (default: shared store)
+        max_queue: Maximum number of queued records
+        flush_interval: Seconds between periodic flushes
+        batch_size: Maximum records written per flush
+    """
+
+    def __init__(
+        self,
+        store: Optional[HistoryStore] = None,
+        max_queue: int = 10_000,
+        flush_interval: float = 1.0,
+        batch_size: int = 500
+    ):
+        self._store = store
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._queue: Optional["asyncio.Queue[Tuple[str, Dict[str, Any]]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        # Set when a full batch is waiting
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        # Batches the worker is writing right now
+        self._writing: Set[asyncio.Task] = set()
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    @property
+    def store(self) -> HistoryStore:
+        if self._store is None:
+            self._store = get_history_store()
+        return self._store
+
+    def _ensure_started(self) -> None:
+        """Start the background writer on the running event loop."""
+        if self._worker is not None and not self._worker.done():
+            return
+        # The worker is new or has stopped (e.g. its event loop ended):
+        # records it left queued or collected are carried over to the new
+        # one, which writes them first
+        carried = self._drain()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._write_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+        self._pending = carried
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, user_id: str, conversion: Dict[str, Any]) -> None:
+        """
+        Queue a conversion for recording.
+
+        Args:
+            user_id: The user's identifier
+            conversion: Dict with source_currency, target_currency,
+                source_amount, target_amount and rate
+        """
+        self._ensure_started()
+        await self._queue.put((user_id, conversion))
+        self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size - 1:
+            self._batch_ready.set()
+
+    async def _run(self) -> None:
+        """Flush periodically, or early once a full batch is waiting."""
+        if self._pending:
+            batch, self._pending = self._pending, []
+            await self._write_batch(batch)
+
+        while True:
+            # Collected records live on self._pending so flush() and close()
+            # can still write them while the worker waits
+            self._pending = [await self._queue.get()]
+
+            # Give other submitters until the next interval to fill the
+            # batch. Records stay on the queue until they are taken below:
+            # wait_for(queue.get()) could time out holding one that
+            # flush() would then miss.
+            self._batch_ready.clear()
+            if self._queue.qsize() < self.batch_size - 1:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            while len(self._pending) < self.batch_size and not self._queue.empty():
+                self._pending.append(self._queue.get_nowait())
+
+            batch, self._pending = self._pending, []
+            if batch:
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Write a batch from the worker, tracked so ``flush()`` can wait for it."""
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self._writing.add(task)
+        task.add_done_callback(self._writing.discard)
+        # Shielded so a cancel during shutdown never abandons a batch
+        # half-written
+        await asyncio.shield(task)
+
+    def _drain(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Take everything collected or queued but not yet written."""
+        items, self._pending = self._pending, []
+        while self._queue is not None and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Write a batch, one transaction per user."""
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for user_id, conversion in batch:
+            by_user.setdefault(user_id, []).append(conversion)
+
+        async with self._write_lock:
+            for user_id, conversions in by_user.items():
+                try:
+                    # SQLite calls block, so run them in a worker thread
+                    await asyncio.to_thread(self.store.append_many, user_id, conversions)
+                    self.written += len(conversions)
+                except Exception:
+                    self.failed += len(conversions)
+                    logger.exception(
+                        "Failed to record %d conversions for %s", len(conversions), user_id
+                    )
+            self.batches += 1
+
+    async def flush(self) -> None:
+        """Write every queued record now, and wait for batches being written."""
+        items = self._drain()
+        for start in range(0, len(items), self.batch_size):
+            await self._write(items[start:start + self.batch_size])
+
+        loop = asyncio.get_running_loop()
+        writing = {task for task in self._writing if task.get_loop() is loop}
+        if writing:
+            # wait() rather than gather(): cancelling a flush must not
+            # cancel the worker's writes
+            await asyncio.wait(writing)
+
+    async def close(self) -> None:
+        """Stop the background writer after flushing the queue."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue and write counters."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+
+_writer = HistoryWriteBehind(
+    max_queue=int(os.environ.get("HISTORY_QUEUE_SIZE", 10_000)),
+    flush_interval=float(os.environ.get("HISTORY_FLUSH_INTERVAL", 1.0)),
+    batch_size=int(os.environ.get("HISTORY_BATCH_SIZE", 500))
+)
+
+
+def get_history_writer() -> HistoryWriteBehind:
+    """Get the process-wide write-behind history recorder."""
+    return _writer
+
+
+async def close_history_writer() -> None:
+    """Flush queued conversions and stop the writer. Call on shutdown."""
+    await _writer.close()
@@ -0,0 +1,221 @@
+"""Shared HTTP Client Pool.
+
+Every rate-fetching tool in this project shares one process-wide
+``httpx.AsyncClient``. Reusing the client keeps connections to the exchange
+rate API alive between tool calls, so only the first call pays the TCP+TLS
+handshake.
+
+Configuration is read from environment variables (or set programmatically
+with ``configure_http_pool``):
+
+- RATE_HTTP_MAX_CONNECTIONS: Maximum open connections (default 20)
+- RATE_HTTP_MAX_KEEPALIVE: Maximum idle keep-alive connections (default 10)
+- RATE_HTTP_KEEPALIVE_EXPIRY: Seconds an idle connection is kept (default 30)
+- RATE_HTTP_TIMEOUT: Total request timeout in seconds (default 10)
+- RATE_HTTP_CONNECT_TIMEOUT: Connect timeout in seconds (default 5)
+- RATE_HTTP2: "1" to use HTTP/2, "0" to disable (default: auto-detect);
+  falls back to HTTP/1.1 when the optional ``h2`` package is missing
+
+``get_pool_stats`` reports how many requests were sent and how many new
+connections had to be opened for them, so the connection reuse ratio shows
+whether keep-alive is working.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+FRANKFURTER_API_URL = os.environ.get(
+    "FRANKFURTER_API_URL", "https://api.frankfurter.app"
+).rstrip("/")
+
+
+def _http2_available() -> bool:
+    """Check whether the optional `h2` package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpClientPool:
+    """
+    Lifecycle manager for a shared ``httpx.AsyncClient``.
+
+    The client is created lazily on first use and recreated if it was closed
+    or if it is requested from a different event loop (e.g. a new
+    ``asyncio.run`` call); a replaced client is closed. Every request sent
+    through the client is counted, along with every new connection opened
+    for one, as reported by the connection pool's trace events.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        http2: Optional[bool] = None
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = _http2_available() if http2 is None else http2
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Keeps close tasks started outside a coroutine alive until they finish
+        self._closing: Set[asyncio.Task] = set()
+        self.clients_opened = 0
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _is_usable(self) -> bool:
+        """Check whether the current client can serve the running event loop."""
+        return (
+            self._client is not None
+            and not self._client.is_closed
+            and self._loop is asyncio.get_running_loop()
+        )
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """Return the shared client, opening it if necessary."""
+        if self._is_usable():
+            return self._client
+
+        # No await between the check and the assignment, so concurrent
+        # callers on the same loop cannot open two clients.
+        stale, stale_loop = self._client, self._loop
+        self.clients_opened += 1
+        self._client = client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks={"request": [self._on_request]}
+        )
+        self._loop = asyncio.get_running_loop()
+        await _close_client(stale, stale_loop)
+        return client
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self.requests += 1
+        request.extensions.setdefault("trace", self._on_trace)
+
+    async def _on_trace(self, event: str, info: Dict[str, Any]) -> None:
+        # Emitted by the connection pool only when it opens a new connection
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def aclose(self) -> None:
+        """Close the shared client and release its connections."""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        await _close_client(client, loop)
+
+    def close_soon(self) -> None:
+        """Close the shared client without waiting (usable outside a coroutine)."""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        if client is None or client.is_closed:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(_close_client(client, loop))
+            return
+        task = running.create_task(_close_client(client, loop))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request and connection counters and the configuration."""
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_ratio": (
+                round(reused / self.requests, 4) if self.requests else 0.0
+            ),
+            "clients_opened": self.clients_opened,
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        }
+
+
+async def _close_client(
+    client: Optional[httpx.AsyncClient],
+    loop: Optional[asyncio.AbstractEventLoop]
+) -> None:
+    """Close a client that is being replaced, on the loop that opened it."""
+    if client is None or client.is_closed:
+        return
+    if loop is not None and loop is not asyncio.get_running_loop() and loop.is_running():
+        # Still running in another thread, which owns its connections
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop))
+        return
+    try:
+        await client.aclose()
+    except RuntimeError:
+        # The client's event loop is already closed: the pool has dropped
+        # its connections, and their sockets close when they are collected
+        pass
+
+
+def _pool_from_env() -> HttpClientPool:
+    """Build a pool using the RATE_HTTP_* environment variables."""
+    http2_env = os.environ.get("RATE_HTTP2")
+    return HttpClientPool(
+        max_connections=int(os.environ.get("RATE_HTTP_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(os.environ.get("RATE_HTTP_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=float(os.environ.get("RATE_HTTP_KEEPALIVE_EXPIRY", 30.0)),
+        timeout=float(os.environ.get("RATE_HTTP_TIMEOUT", 10.0)),
+        connect_timeout=float(os.environ.get("RATE_HTTP_CONNECT_TIMEOUT", 5.0)),
+        http2=None if http2_env is None else http2_env == "1"
+    )
+
+
+_pool: HttpClientPool = _pool_from_env()
+
+
+def configure_http_pool(**kwargs: Any) -> HttpClientPool:
+    """
+    Replace the shared pool with one using the given settings.
+
+    Call this at startup, before any tool runs. Accepts the same keyword
+    arguments as ``HttpClientPool``. The previous pool's client is closed.
+    """
+    global _pool
+    previous, _pool = _pool, HttpClientPool(**kwargs)
+    previous.close_soon()
+    return _pool
+
+
+async def get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client used by all rate-fetching tools."""
+    return await _pool.get_client()
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client. Call this on application shutdown."""
+    await _pool.aclose()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get request and connection counters for the shared HTTP client pool."""
+    return _pool.stats()
@@ -0,0 +1,123 @@
+"""Currency Intent Parser.
+
+Recognizes unambiguous exchange rate and conversion requests such as
+"convert 250 USD to EUR", "$100 in yen" or "rate GBP to JPY" without a
+model call. Currencies can be given as codes or symbols from
+``CURRENCY_METADATA`` or as common names. Anything that doesn't match
+exactly, or that names a currency ambiguously (e.g. "¥", used for both JPY
+and CNY), is left for the agent.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .currency_catalog import CURRENCY_METADATA
+
+CURRENCY_NAMES: Dict[str, str] = {
+    "dollar": "USD", "dollars": "USD", "us dollar": "USD", "us dollars": "USD",
+    "euro": "EUR", "euros": "EUR",
+    "pound": "GBP", "pounds": "GBP", "sterling": "GBP", "british pound": "GBP",
+    "british pounds": "GBP",
+    "yen": "JPY", "japanese yen": "JPY",
+    "yuan": "CNY", "renminbi": "CNY", "chinese yuan": "CNY",
+    "rupee": "INR", "rupees": "INR", "indian rupee": "INR", "indian rupees": "INR",
+    "won": "KRW", "korean won": "KRW", "south korean won": "KRW",
+    "real": "BRL", "reais": "BRL", "brazilian real": "BRL", "brazilian reais": "BRL",
+    "australian dollar": "AUD", "australian dollars": "AUD",
+    "canadian dollar": "CAD", "canadian dollars": "CAD",
+    "swiss franc": "CHF", "swiss francs": "CHF", "franc": "CHF", "francs": "CHF",
+    "hong kong dollar": "HKD", "hong kong dollars": "HKD",
+    "singapore dollar": "SGD", "singapore dollars": "SGD",
+    "mexican peso": "MXN", "mexican pesos": "MXN", "peso": "MXN", "pesos": "MXN",
+    "new zealand dollar": "NZD", "new zealand dollars": "NZD",
+}
+
+
+def _build_aliases() -> Dict[str, str]:
+    """Map every accepted currency spelling (lowercase) to its code."""
+    aliases = {code.lower(): code for code in CURRENCY_METADATA}
+    aliases.update(CURRENCY_NAMES)
+
+    # Only symbols that identify exactly one currency
+    by_symbol: Dict[str, set] = {}
+    for code, (symbol, _) in CURRENCY_METADATA.items():
+        by_symbol.setdefault(symbol.lower(), set()).add(code)
+    for symbol, codes in by_symbol.items():
+        if len(codes) == 1:
+            aliases.setdefault(symbol, next(iter(codes)))
+
+    return aliases
+
+
+ALIASES = _build_aliases()
+
+# Longest spellings first so "hong kong dollars" wins over "dollars"
+_CURRENCY = "(?:{})".format(
+    "|".join(re.escape(a) for a in sorted(ALIASES, key=len, reverse=True))
+)
+_CUR = r"(?<![a-z]){}(?![a-z])".format(_CURRENCY)
+_AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+
+_CONVERSION = re.compile(
+    r"^(?:(?:please\s+)?(?:convert|change|exchange)\s+|how\s+much\s+is\s+|what\s+is\s+)?"
+    rf"(?P<prefix>{_CUR})?\s*(?P<amount>{_AMOUNT})\s*(?P<source>{_CUR})?"
+    rf"\s+(?:to|into|in)\s+(?P<target>{_CUR})$"
+)
+
+_RATE = re.compile(
+    r"^(?:what(?:'s|\s+is)\s+)?(?:the\s+)?(?:current\s+|latest\s+)?"
+    r"(?:exchange\s+)?rate\s+(?:for\s+|from\s+|of\s+)?"
+    rf"(?P<source>{_CUR})\s*(?:to|/|->|in)\s*(?P<target>{_CUR})(?:\s+today)?$"
+    r"|"
+    rf"^(?P<source2>{_CUR})\s*(?:to|/|->)\s*(?P<target2>{_CUR})\s+(?:exchange\s+)?rate$"
+)
+
+
+@dataclass(frozen=True)
+class CurrencyIntent:
+    """A recognized request: kind is 'rate' or 'convert'."""
+    kind: str
+    source_currency: str
+    target_currency: str
+    amount: Optional[float] = None
+
+
+def _normalize(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip("?.! ")
+
+
+def parse_intent(text: str) -> Optional[CurrencyIntent]:
+    """
+    Parse a message into a rate or conversion intent.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        The recognized intent, or None if the message isn't an unambiguous
+        rate or conversion request
+    """
+    message = _normalize(text)
+
+    match = _CONVERSION.match(message)
+    if match:
+        prefix, source = match.group("prefix"), match.group("source")
+        codes = {ALIASES[c] for c in (prefix, source) if c}
+        if len(codes) != 1:
+            return None
+        amount = float(match.group("amount").replace(",", ""))
+        if amount <= 0:
+            return None
+        return CurrencyIntent(
+            "convert", codes.pop(), ALIASES[match.group("target")], amount
+        )
+
+    match = _RATE.match(message)
+    if match:
+        source = match.group("source") or match.group("source2")
+        target = match.group("target") or match.group("target2")
+        return CurrencyIntent("rate", ALIASES[source], ALIASES[target])
+
+    return None
@@ -0,0 +1,247 @@
+"""Streaming Ledger Conversion.
+
+Converts transaction ledgers (CSV or JSON Lines) with mixed-currency rows
+into a single target currency. The input is read and written in fixed-size
+chunks, so memory use stays bounded regardless of file size, and each chunk
+is converted with one vectorized lookup into the rate snapshot's
+cross-rate matrix.
+
+Every output row keeps the original fields and adds:
+
+- converted_amount: Amount in the target currency, rounded per currency
+- converted_currency: The target currency code
+- rate: Rate applied to the row
+- formatted_amount: Converted amount formatted with the currency symbol
+- error: Why the row could not be converted (empty on success)
+
+The conversion tool only reads and writes ledgers inside one directory
+(LEDGER_DIR, default ``data/ledgers``); ``resolve_ledger_path`` rejects
+paths that lead anywhere else.
+"""
+
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from . import format_amount, get_currency_decimals
+from .rate_engine import RateSnapshot
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+OUTPUT_FIELDS = [
+    "converted_amount", "converted_currency", "rate", "formatted_amount", "error"
+]
+
+
+def ledger_dir() -> str:
+    """Get the directory ledgers are read from and written to (LEDGER_DIR)."""
+    return os.environ.get("LEDGER_DIR", os.path.join("data", "ledgers"))
+
+
+def resolve_ledger_path(path: str, directory: Optional[str] = None) -> str:
+    """
+    Resolve a ledger path given relative to the ledger directory.
+
+    Symlinks are followed before checking, so neither ``..`` nor a link can
+    lead outside the directory.
+
+    Args:
+        path: Path relative to the ledger directory
+        directory: Ledger directory (default: ``ledger_dir()``)
+
+    Returns:
+        The real absolute path
+
+    Raises:
+        ValueError: If the path is absolute or resolves outside the directory
+    """
+    if not path or os.path.isabs(path):
+        raise ValueError(f"Ledger paths must be relative to the ledger directory: {path!r}")
+    root = os.path.realpath(directory or ledger_dir())
+    resolved = os.path.realpath(os.path.join(root, path))
+    if resolved == root or os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Ledger path is outside the ledger directory: {path!r}")
+    return resolved
+
+
+def _ledger_format(path: str) -> str:
+    """Detect the ledger format ('csv' or 'jsonl') from the file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Unsupported ledger format: {extension or path}")
+
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Split a row stream into lists of at most `size` rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_jsonl(handle) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per non-empty line of a JSON Lines file."""
+    for line in handle:
+        if line.strip():
+            yield json.loads(line)
+
+
+def convert_chunk(
+    rows: List[Dict[str, Any]],
+    snapshot: RateSnapshot,
+    target_currency: str,
+    amount_field: str = "amount",
+    currency_field: str = "currency"
+) -> int:
+    """
+    Convert a chunk of rows in place.
+
+    Args:
+        rows: Ledger rows; the output fields are added to each row
+        snapshot: Rate snapshot to convert against
+        target_currency: Currency to convert every row into
+        amount_field: Name of the field holding the amount
+        currency_field: Name of the field holding the row's currency code
+
+    Returns:
+        Number of rows that could not be converted
+    """
+    target_index = snapshot.index[target_currency]
+    decimals = get_currency_decimals(target_currency)
+
+    amounts = np.zeros(len(rows), dtype=np.float64)
+    sources = np.full(len(rows), -1, dtype=np.intp)
+    errors: List[str] = [""] * len(rows)
+
+    for i, row in enumerate(rows):
+        code = str(row.get(currency_field) or "").strip().upper()
+        if code not in snapshot.index:
+            errors[i] = f"Unsupported currency: {code or '(missing)'}"
+            continue
+        try:
+            amounts[i] = float(row.get(amount_field))
+        except (TypeError, ValueError):
+            errors[i] = f"Invalid amount: {row.get(amount_field)!r}"
+            continue
+        sources[i] = snapshot.index[code]
+
+    valid = sources >= 0
+    rates = np.where(valid, snapshot.matrix[sources, target_index], np.nan)
+    converted = np.round(amounts * rates, decimals)
+
+    for row, ok, rate, value, error in zip(
+        rows, valid.tolist(), rates.tolist(), converted.tolist(), errors
+    ):
+        if ok:
+            row["converted_amount"] = value
+            row["converted_currency"] = target_currency
+            row["rate"] = round(rate, 6)
+            row["formatted_amount"] = format_amount(value, target_currency)
+            row["error"] = ""
+        else:
+            row.update(dict.fromkeys(OUTPUT_FIELDS, ""))
+            row["error"] = error
+
+    return len(rows) - int(valid.sum())
+
+
+def convert_ledger_file(
+    input_path: str,
+    output_path: str,
+    snapshot: RateSnapshot,
+    target_currency: str,
+    amount_field: str = "amount",
+    currency_field: str = "currency",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overwrite: bool = False
+) -> Dict[str, Any]:
+    """
+    Stream a ledger file through the converter and write the result.
+
+    The input and output formats are chosen from the file extensions
+    (.csv, .jsonl or .ndjson), so a CSV ledger can be written out as JSONL
+    and vice versa.
+
+    Args:
+        input_path: Ledger to read
+        output_path: File to write the converted ledger to
+        snapshot: Rate snapshot pinned for the whole file
+        target_currency: Currency to convert every row into
+        amount_field: Name of the field holding the amount
+        currency_field: Name of the field holding the row's currency code
+        chunk_size: Rows converted per vectorized step
+        overwrite: Replace ``output_path`` if it already exists
+
+    Returns:
+        Conversion statistics (rows, errors, elapsed time, rows/sec)
+
+    Raises:
+        ValueError: For an unsupported format or currency, or if the output
+            is the input file
+        FileExistsError: If the output exists and ``overwrite`` is False
+    """
+    target_currency = target_currency.strip().upper()
+    if target_currency not in snapshot:
+        raise ValueError(f"Unsupported currency: {target_currency}")
+
+    input_format = _ledger_format(input_path)
+    output_format = _ledger_format(output_path)
+    if os.path.exists(output_path) and os.path.samefile(input_path, output_path):
+        raise ValueError("The output file must not be the input file")
+
+    started = time.perf_counter()
+    rows_total = 0
+    errors_total = 0
+
+    with open(input_path, newline="", encoding="utf-8") as source, \
+            open(output_path, "w" if overwrite else "x", newline="", encoding="utf-8") as sink:
+        if input_format == "csv":
+            reader = csv.DictReader(source)
+            input_fields = list(reader.fieldnames or [])
+            rows: Iterable[Dict[str, Any]] = reader
+        else:
+            input_fields = []
+            rows = _read_jsonl(source)
+
+        writer = None
+        for chunk in _chunks(rows, chunk_size):
+            errors_total += convert_chunk(
+                chunk, snapshot, target_currency, amount_field, currency_field
+            )
+            rows_total += len(chunk)
+
+            if output_format == "jsonl":
+                sink.writelines(json.dumps(row) + "\n" for row in chunk)
+                continue
+
+            if writer is None:
+                fields = input_fields or [k for k in chunk[0] if k not in OUTPUT_FIELDS]
+                writer = csv.DictWriter(
+                    sink, fieldnames=fields + OUTPUT_FIELDS, extrasaction="ignore"
+                )
+                writer.writeheader()
+            writer.writerows(chunk)
+
+    elapsed = time.perf_counter() - started
+
+    return {
+        "input_path": input_path,
+        "output_path": output_path,
+        "target_currency": target_currency,
+        "rate_date": snapshot.date,
+        "rows": rows_total,
+        "converted": rows_total - errors_total,
+        "errors": errors_total,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_total / elapsed) if elapsed > 0 else rows_total,
+    }
@@ -0,0 +1,527 @@
+"""Rate Alert Engine.
+
+Evaluates users' "tell me when EUR/USD goes above 1.10" alerts whenever a
+new latest-rate snapshot is fetched.
+
+Active alerts are held in memory in per-pair indexes: one list of "above"
+thresholds and one of "below" thresholds, each kept sorted, with the alert
+ids in parallel lists. For a new rate, the triggered "above" alerts are the
+prefix with threshold <= rate and the triggered "below" alerts are the
+suffix with threshold >= rate, so each pair costs one bisect and one slice
+no matter how many alerts it has. Triggered alerts are removed from the
+index, marked in the alert store, and handed to an async delivery queue so
+slow notification handlers never hold up evaluation.
+
+The index is built from the store on first use. Alerts this process
+creates or cancels update it in place; before each evaluation it is
+rebuilt if another worker process has changed the store since (detected
+through SQLite's ``data_version``), so alerts created elsewhere fire here
+too. ``start_alert_monitor()``
+also refreshes the rates after every ECB publication, so alerts fire even
+when nobody is asking for rates.
+
+Delivery handlers report whether a client received the alert; only then is
+it marked delivered in the store. With several worker processes the one
+that triggers an alert may not hold the user's connection, so the alert
+stays pending there and ``watch_pending()`` delivers it from the process
+that does: when the user connects, and whenever another process has
+written to the store.
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Optional, Set, Tuple
+
+from .alert_store import AlertStore, get_alert_store
+from .rate_cache import next_ecb_publication
+from .rate_engine import RateFetchError, RateSnapshot, get_rate_engine
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ("above", "below")
+
+# Seconds between monitor attempts after a failed rate refresh
+RETRY_INTERVAL = 300.0
+
+# Seconds between checks for alerts triggered by other processes
+PENDING_INTERVAL = 2.0
+
+# Maximum alerts handed to the handlers before marking them delivered
+DELIVERY_BATCH = 500
+
+# Returns True if a client received the alert
+DeliveryHandler = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+
+class _PairIndex:
+    """Sorted thresholds (and parallel alert ids) for one currency pair."""
+
+    __slots__ = ("above", "above_ids", "below", "below_ids")
+
+    def __init__(self):
+        self.above: List[float] = []
+        self.above_ids: List[int] = []
+        self.below: List[float] = []
+        self.below_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below)
+
+
+class RateAlertEngine:
+    """
+    In-memory alert index with persistent state and async delivery.
+
+    Args:
+        store: Alert store (default: shared store)
+        max_queue: Maximum notifications waiting for delivery
+    """
+
+    def __init__(self, store: Optional[AlertStore] = None, max_queue: int = 100_000):
+        self._store = store
+        self.max_queue = max_queue
+
+        self._index: Dict[Tuple[str, str], _PairIndex] = {}
+        self._loaded = False
+        # Store data_version the index was built at
+        self._data_version: Optional[int] = None
+        # Held while the index is rebuilt or changed with a store write
+        self._index_lock: Optional[asyncio.Lock] = None
+        self._evaluate_lock: Optional[asyncio.Lock] = None
+
+        self._queue: Optional["asyncio.Queue[Dict[str, Any]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._handlers: List[DeliveryHandler] = []
+        # Held while alerts are handed to the handlers
+        self._delivery_lock: Optional[asyncio.Lock] = None
+        # Claimed alerts waiting in the queue
+        self._queued: Set[int] = set()
+        # Users who connected since the last pending delivery
+        self._joined: Set[str] = set()
+        self._wake: Optional[asyncio.Event] = None
+
+        self.evaluations = 0
+        self.triggered = 0
+        self.delivered = 0
+        self.delivery_errors = 0
+        self.last_evaluation_ms = 0.0
+
+    @property
+    def store(self) -> AlertStore:
+        if self._store is None:
+            self._store = get_alert_store()
+        return self._store
+
+    # -------------------------------------------------------------------------
+    # Index
+    # -------------------------------------------------------------------------
+
+    def _get_index_lock(self) -> asyncio.Lock:
+        if self._index_lock is None:
+            self._index_lock = asyncio.Lock()
+        return self._index_lock
+
+    def _get_evaluate_lock(self) -> asyncio.Lock:
+        if self._evaluate_lock is None:
+            self._evaluate_lock = asyncio.Lock()
+        return self._evaluate_lock
+
+    def _get_delivery_lock(self) -> asyncio.Lock:
+        if self._delivery_lock is None:
+            self._delivery_lock = asyncio.Lock()
+        return self._delivery_lock
+
+    def _get_wake(self) -> asyncio.Event:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        return self._wake
+
+    async def ensure_loaded(self) -> None:
+        """Build the index from the store's active alerts on first use."""
+        if self._loaded:
+            return
+        async with self._get_index_lock():
+            if not self._loaded:
+                await self._load()
+
+    async def reload_if_changed(self) -> None:
+        """Rebuild the index if another process has changed the alerts."""
+        async with self._get_index_lock():
+            version = await asyncio.to_thread(self.store.data_version)
+            if not self._loaded or version != self._data_version:
+                await self._load()
+
+    async def _load(self) -> None:
+        """Rebuild the index; call with the index lock held."""
+        # Read the version first, so changes made during the build are
+        # picked up by the next reload
+        self._data_version = await asyncio.to_thread(self.store.data_version)
+        self._index = await asyncio.to_thread(self._build_index)
+        self._loaded = True
+
+    def _build_index(self) -> Dict[Tuple[str, str], _PairIndex]:
+        """Group active alerts by pair and direction, sorting each group once."""
+        groups: Dict[Tuple[str, str, str], List[Tuple[float, int]]] = {}
+        for alert_id, source, target, direction, threshold in self.store.iter_active():
+            groups.setdefault((source, target, direction), []).append((threshold, alert_id))
+
+        index: Dict[Tuple[str, str], _PairIndex] = {}
+        for (source, target, direction), entries in groups.items():
+            entries.sort()
+            pair = index.setdefault((source, target), _PairIndex())
+            thresholds = [t for t, _ in entries]
+            ids = [i for _, i in entries]
+            if direction == "above":
+                pair.above, pair.above_ids = thresholds, ids
+            else:
+                pair.below, pair.below_ids = thresholds, ids
+        return index
+
+    def _add(self, alert: Dict[str, Any]) -> None:
+        """Insert an alert into its pair's sorted thresholds."""
+        pair = self._index.setdefault(
+            (alert["source_currency"], alert["target_currency"]), _PairIndex()
+        )
+        if alert["direction"] == "above":
+            thresholds, ids = pair.above, pair.above_ids
+        else:
+            thresholds, ids = pair.below, pair.below_ids
+
+        # Equal thresholds stay in id order
+        position = bisect_right(thresholds, alert["threshold"])
+        thresholds.insert(position, alert["threshold"])
+        ids.insert(position, alert["id"])
+
+    def _remove(self, alert: Dict[str, Any]) -> None:
+        """Remove an alert from the index if present."""
+        pair = self._index.get((alert["source_currency"], alert["target_currency"]))
+        if pair is None:
+            return
+        if alert["direction"] == "above":
+            thresholds, ids = pair.above, pair.above_ids
+        else:
+            thresholds, ids = pair.below, pair.below_ids
+
+        # Only the run of equal thresholds has to be searched
+        start = bisect_left(thresholds, alert["threshold"])
+        end = bisect_right(thresholds, alert["threshold"])
+        for position in range(start, end):
+            if ids[position] == alert["id"]:
+                del thresholds[position]
+                del ids[position]
+                break
+
+    @property
+    def active_count(self) -> int:
+        return sum(len(pair) for pair in self._index.values())
+
+    # -------------------------------------------------------------------------
+    # Alerts
+    # -------------------------------------------------------------------------
+
+    async def create_alert(
+        self,
+        user_id: str,
+        source_currency: str,
+        target_currency: str,
+        direction: str,
+        threshold: float
+    ) -> Dict[str, Any]:
+        """
+        Store a new alert and add it to the index.
+
+        Returns:
+            The stored alert
+        """
+        await self.ensure_loaded()
+        # Under the index lock, so a concurrent rebuild can't drop the alert
+        async with self._get_index_lock():
+            alert = await asyncio.to_thread(
+                self.store.create, user_id, source_currency, target_currency,
+                direction, threshold
+            )
+            self._add(alert)
+        return alert
+
+    async def cancel_alert(self, user_id: str, alert_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a user's active alert.
+
+        Returns:
+            The cancelled alert, or None if the user has no such active alert
+        """
+        await self.ensure_loaded()
+        async with self._get_index_lock():
+            alert = await asyncio.to_thread(self.store.cancel, user_id, alert_id)
+            if alert is not None:
+                self._remove(alert)
+        return alert
+
+    # -------------------------------------------------------------------------
+    # Evaluation
+    # -------------------------------------------------------------------------
+
+    def find_triggered(self, snapshot: RateSnapshot) -> List[Tuple[float, List[int]]]:
+        """
+        Remove and return every alert whose threshold the snapshot crosses.
+
+        Returns:
+            (rate, alert ids) groups, one per pair and direction with
+            triggered alerts
+        """
+        triggered: List[Tuple[float, List[int]]] = []
+
+        for (source, target), pair in self._index.items():
+            if source not in snapshot or target not in snapshot:
+                continue
+            rate = snapshot.rate(source, target)
+
+            # "above" alerts with threshold <= rate: a prefix
+            count = bisect_right(pair.above, rate)
+            if count:
+                triggered.append((rate, pair.above_ids[:count]))
+                del pair.above[:count]
+                del pair.above_ids[:count]
+
+            # "below" alerts with threshold >= rate: a suffix
+            start = bisect_left(pair.below, rate)
+            if start < len(pair.below):
+                triggered.append((rate, pair.below_ids[start:]))
+                del pair.below[start:]
+                del pair.below_ids[start:]
+
+        return triggered
+
+    async def evaluate(self, snapshot: RateSnapshot) -> int:
+        """
+        Trigger and queue delivery of every alert the snapshot crosses.
+
+        Alerts created or cancelled by other processes are picked up first.
+
+        Returns:
+            Number of alerts triggered
+        """
+        await self.reload_if_changed()
+
+        async with self._get_evaluate_lock():
+            started = time.perf_counter()
+            triggered = self.find_triggered(snapshot)
+            self.last_evaluation_ms = (time.perf_counter() - started) * 1000
+            self.evaluations += 1
+            if not triggered:
+                return 0
+
+            # Only alerts still active in the store are delivered, so one
+            # alert never fires twice
+            claimed = await asyncio.to_thread(
+                self.store.claim_triggered, triggered, snapshot.date
+            )
+            # Before releasing the lock, so deliver_pending() never sends
+            # an alert that is still queued
+            self._queued.update(alert["id"] for alert in claimed)
+
+        self._ensure_started()
+        for alert in claimed:
+            await self._queue.put(alert)
+        self.triggered += len(claimed)
+        return len(claimed)
+
+    async def on_snapshot(self, snapshot: RateSnapshot) -> None:
+        """Rate engine refresh listener."""
+        try:
+            await self.evaluate(snapshot)
+        except Exception:
+            logger.exception("Rate alert evaluation failed")
+
+    # -------------------------------------------------------------------------
+    # Delivery
+    # -------------------------------------------------------------------------
+
+    def add_delivery_handler(self, handler: DeliveryHandler) -> None:
+        """
+        Register a coroutine called with each triggered alert.
+
+        Handlers run on the delivery task, one alert at a time, and return
+        whether a client received the alert. Alerts no handler delivered
+        stay pending in the store.
+        """
+        self._handlers.append(handler)
+
+    def _ensure_started(self) -> None:
+        """Start the delivery task on the running event loop."""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.get_running_loop().create_task(self._deliver())
+
+    async def _deliver(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < DELIVERY_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            async with self._get_delivery_lock():
+                try:
+                    await self._send(batch)
+                finally:
+                    self._queued.difference_update(alert["id"] for alert in batch)
+
+    async def _send(self, alerts: List[Dict[str, Any]]) -> int:
+        """
+        Hand alerts to the handlers and mark the received ones delivered.
+
+        Call with the delivery lock held.
+
+        Returns:
+            Number of alerts a client received
+        """
+        received = []
+        for alert in alerts:
+            if not self._handlers:
+                logger.info(
+                    "Alert %s for %s: %s/%s %s %s (rate %s)",
+                    alert["id"], alert["user_id"], alert["source_currency"],
+                    alert["target_currency"], alert["direction"],
+                    alert["threshold"], alert["triggered_rate"]
+                )
+            delivered = False
+            for handler in self._handlers:
+                try:
+                    delivered = bool(await handler(alert)) or delivered
+                except Exception:
+                    self.delivery_errors += 1
+                    logger.exception("Failed to deliver alert %s", alert["id"])
+            if delivered:
+                received.append(alert["id"])
+
+        if received:
+            try:
+                await asyncio.to_thread(self.store.mark_delivered, received)
+            except Exception:
+                # Sent again on the next pending delivery
+                logger.exception("Failed to mark %d alerts delivered", len(received))
+        self.delivered += len(received)
+        return len(received)
+
+    async def deliver_pending(self, user_ids: Collection[str]) -> int:
+        """
+        Deliver alerts triggered for the users but not yet received.
+
+        Returns:
+            Number of alerts a client received
+        """
+        if not user_ids:
+            return 0
+        async with self._get_delivery_lock():
+            # Alerts claimed by this process stay queued until delivered
+            async with self._get_evaluate_lock():
+                pending = await asyncio.to_thread(
+                    self.store.pending_for_users, list(user_ids)
+                )
+            pending = [alert for alert in pending if alert["id"] not in self._queued]
+            if not pending:
+                return 0
+            return await self._send(pending)
+
+    def user_connected(self, user_id: str) -> None:
+        """Deliver the user's pending alerts on the next watch_pending() pass."""
+        self._joined.add(user_id)
+        self._get_wake().set()
+
+    async def watch_pending(
+        self,
+        connected_users: Callable[[], Collection[str]],
+        interval: float = PENDING_INTERVAL
+    ) -> None:
+        """
+        Deliver pending alerts to users connected to this process.
+
+        Runs until cancelled. A user's pending alerts are delivered when
+        ``user_connected()`` is called for them; every connected user's are
+        checked whenever another process has written to the store.
+
+        Args:
+            connected_users: Returns the users with a connection here
+            interval: Seconds between checks of the store
+        """
+        wake = self._get_wake()
+        version = None
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+            try:
+                users, self._joined = set(self._joined), set()
+                current = await asyncio.to_thread(self.store.data_version)
+                if current != version:
+                    version = current
+                    users.update(connected_users())
+                await self.deliver_pending(users)
+            except Exception:
+                logger.exception("Pending alert delivery failed")
+
+    async def close(self) -> None:
+        """Deliver queued notifications, then stop the delivery task."""
+        if self._worker is None:
+            return
+        while (
+            (not self._queue.empty() or self._get_delivery_lock().locked())
+            and not self._worker.done()
+        ):
+            await asyncio.sleep(0.01)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size, evaluation and delivery counters."""
+        return {
+            "active_alerts": self.active_count,
+            "pairs": len(self._index),
+            "evaluations": self.evaluations,
+            "last_evaluation_ms": round(self.last_evaluation_ms, 3),
+            "triggered": self.triggered,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "delivered": self.delivered,
+            "delivery_errors": self.delivery_errors,
+        }
+
+
+_alerts = RateAlertEngine()
+
+
+def get_alert_engine() -> RateAlertEngine:
+    """Get the process-wide rate alert engine."""
+    return _alerts
+
+
+async def _monitor() -> None:
+    """Refresh the latest rates after every ECB publication."""
+    engine = get_rate_engine()
+    await _alerts.ensure_loaded()
+    while True:
+        try:
+            await _alerts.evaluate(await engine.get_snapshot())
+        except RateFetchError as e:
+            logger.warning("Alert monitor could not load rates: %s", e)
+            await asyncio.sleep(RETRY_INTERVAL)
+            continue
+        await asyncio.sleep(max(next_ecb_publication().timestamp() - time.time(), 1.0))
+
+
+def start_alert_monitor() -> asyncio.Task:
+    """
+    Evaluate alerts on every rate refresh. Call once at startup.
+
+    Returns:
+        The monitor task (cancel it on shutdown)
+    """
+    get_rate_engine().add_refresh_listener(_alerts.on_snapshot)
+    return asyncio.get_running_loop().create_task(_monitor())
@@ -0,0 +1,150 @@
+"""Exchange Rate Analytics.
+
+Vectorized statistics over daily rate series. Every function takes a 2-D
+array of shape (days, pairs), so any number of currency pairs is analysed
+in a single pass with no Python loop over days.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Trading days per year, used to annualize daily volatility
+TRADING_DAYS = 252
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def day_over_day(rates: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute the change between consecutive days.
+
+    Returns:
+        Dict with 'change' and 'change_pct', each of shape (days - 1, pairs)
+    """
+    change = np.diff(rates, axis=0)
+    return {
+        "change": change,
+        "change_pct": change / rates[:-1] * 100.0,
+    }
+
+
+def rolling_mean(rates: np.ndarray, window: int) -> np.ndarray:
+    """
+    Compute the rolling mean over `window` days using cumulative sums.
+
+    Returns:
+        Array of shape (days - window + 1, pairs)
+    """
+    sums = np.cumsum(np.vstack([np.zeros((1, rates.shape[1])), rates]), axis=0)
+    return (sums[window:] - sums[:-window]) / window
+
+
+def log_returns(rates: np.ndarray) -> np.ndarray:
+    """Daily log returns, shape (days - 1, pairs)."""
+    return np.diff(np.log(rates), axis=0)
+
+
+def rolling_volatility(rates: np.ndarray, window: int) -> np.ndarray:
+    """
+    Compute the rolling standard deviation of daily log returns.
+
+    Uses cumulative sums of returns and squared returns, so the cost does
+    not depend on the window size.
+
+    Returns:
+        Array of shape (days - window, pairs) with the sample standard
+        deviation of the `window` returns ending on each day
+    """
+    returns = log_returns(rates)
+    zeros = np.zeros((1, returns.shape[1]))
+    sums = np.cumsum(np.vstack([zeros, returns]), axis=0)
+    squares = np.cumsum(np.vstack([zeros, returns ** 2]), axis=0)
+
+    total = sums[window:] - sums[:-window]
+    total_sq = squares[window:] - squares[:-window]
+    variance = (total_sq - total ** 2 / window) / (window - 1)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def summarize(
+    dates: np.ndarray,
+    rates: np.ndarray,
+    labels: Sequence[str],
+    window: int = 7,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> List[Dict[str, Any]]:
+    """
+    Summarize daily rate series for several pairs.
+
+    Args:
+        dates: Dates of the rows (datetime64[D])
+        rates: Rates of shape (days, pairs)
+        labels: One label per pair (e.g. 'USD->EUR')
+        window: Rolling window in days for mean and volatility
+        percentiles: Percentiles of the rate distribution to report
+
+    Returns:
+        One summary dict per pair
+    """
+    days = rates.shape[0]
+    date_strings = dates.astype(str).tolist()
+
+    first, last = rates[0], rates[-1]
+    low_index = np.argmin(rates, axis=0)
+    high_index = np.argmax(rates, axis=0)
+    quantiles = np.percentile(rates, percentiles, axis=0)
+
+    has_change = days >= 2
+    if has_change:
+        daily = day_over_day(rates)
+        returns = log_returns(rates)
+        period_volatility = np.std(returns, axis=0, ddof=1) if days >= 3 else None
+
+    has_window = 2 <= window <= days - 1
+    if has_window:
+        mean = rolling_mean(rates, window)[-1]
+        volatility = rolling_volatility(rates, window)[-1]
+
+    summaries = []
+    for j, label in enumerate(labels):
+        summary: Dict[str, Any] = {
+            "pair": label,
+            "start_date": date_strings[0],
+            "end_date": date_strings[-1],
+            "days": days,
+            "first": round(float(first[j]), 6),
+            "latest": round(float(last[j]), 6),
+            "period_change": round(float(last[j] - first[j]), 6),
+            "period_change_pct": round(float((last[j] / first[j] - 1) * 100), 4),
+            "min": {
+                "rate": round(float(rates[low_index[j], j]), 6),
+                "date": date_strings[low_index[j]],
+            },
+            "max": {
+                "rate": round(float(rates[high_index[j], j]), 6),
+                "date": date_strings[high_index[j]],
+            },
+            "percentiles": {
+                f"p{p:g}": round(float(q), 6)
+                for p, q in zip(percentiles, quantiles[:, j])
+            },
+        }
+
+        if has_change:
+            summary["day_over_day"] = {
+                "change": round(float(daily["change"][-1, j]), 6),
+                "change_pct": round(float(daily["change_pct"][-1, j]), 4),
+            }
+        if has_change and period_volatility is not None:
+            summary["annualized_volatility_pct"] = round(
+                float(period_volatility[j] * np.sqrt(TRADING_DAYS) * 100), 4
+            )
+        if has_window:
+            summary["rolling_window_days"] = window
+            summary["rolling_mean"] = round(float(mean[j]), 6)
+            summary["rolling_volatility_pct"] = round(float(volatility[j] * 100), 4)
+
+        summaries.append(summary)
+
+    return summaries
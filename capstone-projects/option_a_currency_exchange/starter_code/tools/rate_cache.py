@@ -0,0 +1,206 @@
+"""Exchange Rate Cache.
+
+An async TTL cache for exchange rate lookups with single-flight request
+coalescing: when many callers miss on the same key at once, only the first
+one fetches from the upstream API and the rest await its result. The fetch
+runs as its own task, so a caller that is cancelled (say, because its
+client disconnected) leaves it running for the others.
+
+Entries expire at the next ECB publication. The European Central Bank
+publishes its reference rates once per working day at around 16:00 CET, so
+a rate fetched after that stays valid until the next working day's release.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+    ECB_TIMEZONE: tzinfo = ZoneInfo("Europe/Berlin")
+except Exception:  # zoneinfo or tzdata unavailable
+    ECB_TIMEZONE = timezone(timedelta(hours=1), "CET")
+
+# Publication time plus a grace period for the API to pick up new rates
+ECB_PUBLICATION_HOUR = 16
+ECB_PUBLICATION_GRACE = timedelta(minutes=15)
+
+
+def next_ecb_publication(now: Optional[datetime] = None) -> datetime:
+    """
+    Get the next time new ECB reference rates become available.
+
+    Args:
+        now: Reference time (default: current time)
+
+    Returns:
+        Timezone-aware datetime of the next publication (plus grace period)
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(ECB_TIMEZONE)
+    release = now.replace(
+        hour=ECB_PUBLICATION_HOUR, minute=0, second=0, microsecond=0
+    ) + ECB_PUBLICATION_GRACE
+
+    if release <= now:
+        release += timedelta(days=1)
+    # No publications on weekends
+    while release.weekday() >= 5:
+        release += timedelta(days=1)
+
+    return release
+
+
+def normalize_pair(source_currency: str, target_currency: str) -> Tuple[str, str]:
+    """Normalize a currency pair into a cache key."""
+    return (source_currency.strip().upper(), target_currency.strip().upper())
+
+
+class RateCache:
+    """
+    Async TTL cache with single-flight coalescing of concurrent misses.
+
+    Values are only cached when they are successful tool results
+    (``status == 'success'``); errors are returned to every waiter but not
+    stored, so the next call retries the upstream.
+    """
+
+    def __init__(
+        self,
+        expires_at: Callable[[], datetime] = next_ecb_publication,
+        max_entries: int = 10_000
+    ):
+        self._expires_at = expires_at
+        self.max_entries = max_entries
+
+        # key -> (value, fetched_at, expires_at) as epoch seconds
+        self._entries: Dict[Hashable, Tuple[Dict[str, Any], float, float]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def peek(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Return the cached value for a key if present and fresh."""
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[0]
+
+    def peek_stale(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Return the cached value for a key even if it has expired."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def is_expired(self, key: Hashable) -> bool:
+        """Check whether the entry for a key is missing or past its expiry."""
+        entry = self._entries.get(key)
+        return entry is None or entry[2] <= time.time()
+
+    def is_inflight(self, key: Hashable) -> bool:
+        """Check whether a fetch for a key is currently running."""
+        return key in self._inflight
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Return seconds since the entry for a key was fetched."""
+        entry = self._entries.get(key)
+        return None if entry is None else time.time() - entry[1]
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Get a value from the cache, fetching it on a miss.
+
+        Args:
+            key: Normalized cache key
+            fetch: Coroutine factory that loads the value from upstream
+
+        Returns:
+            The cached or freshly fetched value
+        """
+        value = self.peek(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            inflight = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+            # Mark the outcome retrieved when every waiter has gone
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._inflight[key] = inflight
+        # The fetch is shared: a cancelled caller stops waiting for it but
+        # does not cancel it for the others
+        return await asyncio.shield(inflight)
+
+    async def _fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Fetch a value for every waiter on a key (runs as its own task)."""
+        try:
+            value = await fetch()
+        finally:
+            del self._inflight[key]
+
+        if value.get("status") == "success":
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Dict[str, Any]) -> None:
+        """Store a value, evicting expired or oldest entries when full."""
+        now = time.time()
+        if len(self._entries) >= self.max_entries:
+            self._entries = {
+                k: e for k, e in self._entries.items() if e[2] > now
+            }
+            if len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+
+        self._entries[key] = (value, now, self._expires_at().timestamp())
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one entry, or the whole cache when no key is given."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit ratio, coalescing and staleness counters."""
+        now = time.time()
+        lookups = self.hits + self.misses + self.coalesced
+        ages = [now - e[1] for e in self._entries.values()]
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced_waiters": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "expired_entries": sum(1 for e in self._entries.values() if e[2] <= now),
+            "inflight": len(self._inflight),
+            "oldest_entry_age_seconds": round(max(ages), 1) if ages else None,
+        }
+
+
+_cache = RateCache()
+
+
+def get_rate_cache() -> RateCache:
+    """Get the process-wide exchange rate cache."""
+    return _cache
+
+
+def get_rate_cache_stats() -> Dict[str, Any]:
+    """Get hit ratio, coalesced-waiter and staleness counters for the rate cache."""
+    return _cache.stats()
@@ -0,0 +1,412 @@
+"""Exchange Rate Snapshot Engine.
+
+The Frankfurter API returns every rate against a base currency in a single
+response. Instead of asking the API for each currency pair (or for each
+conversion), the engine fetches one base table per refresh and derives the
+full cross-rate matrix from it, so any pair rate or conversion is answered
+locally.
+
+Snapshots are stored in the shared rate cache, so they expire at the next
+ECB publication and concurrent refreshes are coalesced into one request.
+
+Once a snapshot has expired it is still served (stale-while-revalidate)
+for up to RATE_MAX_STALE seconds after it was fetched (default 7 days)
+while a background task refreshes it, so callers never wait on a slow
+upstream when an older snapshot is available. Upstream requests go through
+the shared circuit breaker and are retried with jittered backoff.
+
+With RATE_SHARED_SNAPSHOT=1, the latest snapshot is read from a file shared
+by all worker processes and kept current by a single leader (see
+``shared_snapshot``), so the API is polled once regardless of the number of
+workers. When the shared snapshot expires, followers keep serving it for
+RATE_SHARED_GRACE seconds (default 300) while the leader, or whichever
+process takes over the lock, refreshes it; only after that do they fetch
+for themselves.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from .http_client import FRANKFURTER_API_URL, get_http_client
+from .rate_cache import RateCache, get_rate_cache, next_ecb_publication
+from .resilience import RETRY_ATTEMPTS, CircuitBreaker, fetch_with_retry, get_upstream_breaker
+from .shared_snapshot import SharedEntry, SharedSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def check_date(value: str) -> str:
+    """
+    Validate a rate date before it becomes part of an API URL.
+
+    Returns:
+        The date in YYYY-MM-DD format
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date {value!r}: dates must be in YYYY-MM-DD format") from None
+
+
+class RateFetchError(Exception):
+    """Raised when a rate snapshot cannot be loaded from the API."""
+
+
+class RateSnapshot:
+    """
+    Cross-rate matrix for all currencies in one base-rate table.
+
+    ``matrix[i, j]`` is the number of units of currency ``j`` that one unit
+    of currency ``i`` buys.
+    """
+
+    def __init__(self, date: str, base: str, rates: Dict[str, float]):
+        self.date = date
+        self.base = base
+
+        base_rates = {base: 1.0, **rates}
+        self.currencies: Tuple[str, ...] = tuple(sorted(base_rates))
+        self.index: Dict[str, int] = {c: i for i, c in enumerate(self.currencies)}
+
+        # Units of each currency per one unit of the base currency
+        self.base_rates = np.array(
+            [base_rates[c] for c in self.currencies], dtype=np.float64
+        )
+        self.matrix = np.outer(1.0 / self.base_rates, self.base_rates)
+
+    def __contains__(self, currency_code: str) -> bool:
+        return currency_code in self.index
+
+    def _position(self, currency_code: str) -> int:
+        """Get the matrix position of a currency code."""
+        try:
+            return self.index[currency_code]
+        except KeyError:
+            raise KeyError(f"Unsupported currency: {currency_code}") from None
+
+    def rate(self, source_currency: str, target_currency: str) -> float:
+        """Get the rate for one pair (1 source = rate target)."""
+        return float(self.matrix[
+            self._position(source_currency), self._position(target_currency)
+        ])
+
+    def convert(
+        self,
+        amount: float,
+        source_currency: str,
+        target_currency: str
+    ) -> float:
+        """Convert an amount between two currencies."""
+        return amount * self.rate(source_currency, target_currency)
+
+    def rates_to(
+        self,
+        source_currency: str,
+        target_currencies: Sequence[str]
+    ) -> np.ndarray:
+        """Get the rates from one currency to many, as a 1-D array."""
+        columns = [self._position(c) for c in target_currencies]
+        return self.matrix[self._position(source_currency), columns]
+
+    def convert_many(
+        self,
+        amounts: Sequence[float],
+        source_currency: str,
+        target_currencies: Sequence[str]
+    ) -> np.ndarray:
+        """
+        Convert many amounts into many currencies in one operation.
+
+        Returns:
+            Array of shape (len(amounts), len(target_currencies))
+        """
+        rates = self.rates_to(source_currency, target_currencies)
+        return np.outer(np.asarray(amounts, dtype=np.float64), rates)
+
+
+class RateEngine:
+    """
+    Loads base-rate tables from the API and serves them as snapshots.
+
+    Args:
+        base: Base currency requested from the API (ECB rates are EUR-based)
+        cache: Cache used to store snapshots (default: shared rate cache)
+        breaker: Circuit breaker for the API (default: shared upstream breaker)
+        max_stale: Seconds after fetching that an expired snapshot may
+            still be served while it is refreshed
+        shared: Cross-process snapshot file to read the latest rates from
+        shared_grace: Seconds an expired shared snapshot is still served
+            while it is refreshed, before followers fetch for themselves
+    """
+
+    # Seconds between leader refresh attempts after a failure, and between
+    # attempts by followers to take over leadership
+    SHARED_RETRY_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        base: str = "EUR",
+        cache: Optional[RateCache] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_stale: float = 7 * 24 * 3600,
+        shared: Optional[SharedSnapshot] = None,
+        shared_grace: float = 300.0
+    ):
+        self.base = base
+        self.cache = cache or get_rate_cache()
+        self.breaker = breaker or get_upstream_breaker()
+        self.max_stale = max_stale
+
+        self._refreshes: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stale_served = 0
+
+        self.shared = shared
+        self.shared_grace = shared_grace
+        self._shared_version = 0
+        self._shared_snapshot: Optional[RateSnapshot] = None
+        # Set to make a follower's refresher try for leadership right away
+        self._takeover: Optional[asyncio.Event] = None
+
+        self._listeners: List[Callable[[RateSnapshot], Awaitable[None]]] = []
+
+    @staticmethod
+    def _key(date: Optional[str]) -> Tuple[str, str]:
+        return ("snapshot", date or "latest")
+
+    async def get_snapshot(self, date: Optional[str] = None) -> RateSnapshot:
+        """
+        Get the latest snapshot, or the snapshot for a historical date.
+
+        If the cached snapshot has expired but is within ``max_stale``, it
+        is returned immediately and refreshed in the background; use
+        ``is_stale()`` to tell the caller.
+
+        Args:
+            date: Date in YYYY-MM-DD format (default: latest rates)
+
+        Returns:
+            The rate snapshot
+
+        Raises:
+            RateFetchError: If the rates could not be loaded
+            ValueError: If date is not a YYYY-MM-DD date
+        """
+        if date is None:
+            shared = self._read_shared()
+            if shared is not None:
+                snapshot, entry = shared
+                if entry.expires_at <= time.time():
+                    self.stale_served += 1
+                return snapshot
+        else:
+            date = check_date(date)
+
+        key = self._key(date)
+
+        if self.cache.is_expired(key):
+            stale = self.cache.peek_stale(key)
+            if stale is not None and self.snapshot_age(date) <= self.max_stale:
+                self._refresh_in_background(date)
+                self.stale_served += 1
+                return stale["snapshot"]
+
+        result = await self.cache.get_or_fetch(key, lambda: self._fetch(date))
+        if result["status"] != "success":
+            raise RateFetchError(result["message"])
+        return result["snapshot"]
+
+    def is_stale(self, date: Optional[str] = None) -> bool:
+        """Check whether the cached snapshot is past its expiry."""
+        if date is None:
+            shared = self._read_shared()
+            if shared is not None:
+                return shared[1].expires_at <= time.time()
+        return self.cache.is_expired(self._key(date))
+
+    def snapshot_age(self, date: Optional[str] = None) -> float:
+        """Seconds since the snapshot was fetched from the API."""
+        if date is None:
+            shared = self._read_shared()
+            if shared is not None:
+                return time.time() - shared[1].fetched_at
+        return self.cache.age(self._key(date)) or 0.0
+
+    def _refresh_in_background(self, date: Optional[str]) -> None:
+        """Start a refresh task for a snapshot unless one is running."""
+        key = self._key(date)
+        task = self._refreshes.get(key)
+        if (task is not None and not task.done()) or self.cache.is_inflight(key):
+            return
+        self._refreshes[key] = asyncio.get_running_loop().create_task(
+            self._refresh(key, date)
+        )
+
+    async def _refresh(self, key: Tuple[str, str], date: Optional[str]) -> None:
+        result = await self.cache.get_or_fetch(key, lambda: self._fetch(date))
+        if result["status"] != "success":
+            logger.warning("Background rate refresh failed: %s", result["message"])
+
+    async def _fetch(self, date: Optional[str]) -> Dict[str, Any]:
+        """Fetch a snapshot through the circuit breaker with retries."""
+        result = await fetch_with_retry(
+            lambda: self._fetch_snapshot(date), self.breaker, RETRY_ATTEMPTS
+        )
+        if date is None and result["status"] == "success":
+            loop = asyncio.get_running_loop()
+            for listener in self._listeners:
+                loop.create_task(listener(result["snapshot"]))
+        return result
+
+    def add_refresh_listener(
+        self,
+        listener: Callable[[RateSnapshot], Awaitable[None]]
+    ) -> None:
+        """
+        Register a coroutine called with each newly fetched latest snapshot.
+
+        Listeners run as separate tasks, so they never delay the caller that
+        triggered the refresh.
+        """
+        self._listeners.append(listener)
+
+    # -------------------------------------------------------------------------
+    # Shared snapshot
+    # -------------------------------------------------------------------------
+
+    def _read_shared(self) -> Optional[Tuple[RateSnapshot, SharedEntry]]:
+        """
+        Get the shared latest snapshot if enabled and still servable.
+
+        An expired snapshot is served for ``shared_grace`` more seconds, so
+        followers don't all go upstream while the leader refreshes it.
+        """
+        if self.shared is None:
+            return None
+        entry = self.shared.read()
+        if entry is None:
+            return None
+        now = time.time()
+        if entry.expires_at <= now:
+            if self._takeover is not None and not self.shared.is_leader:
+                # The leader may be gone; contend for the lock now rather
+                # than at the next retry interval
+                self._takeover.set()
+            if entry.expires_at + self.shared_grace <= now:
+                return None
+
+        # Rebuild the matrix only when the leader published a new version
+        if entry.version != self._shared_version:
+            self._shared_snapshot = RateSnapshot(entry.date, entry.base, entry.rates)
+            self._shared_version = entry.version
+        return self._shared_snapshot, entry
+
+    async def run_shared_refresher(self) -> None:
+        """
+        Keep the shared snapshot current. Runs until cancelled.
+
+        Every process runs this; the one holding the file lock fetches the
+        latest rates and publishes them, then sleeps until they expire. The
+        others retry for leadership periodically, and as soon as they see
+        the shared snapshot expire, so one takes over if the leader exits.
+        """
+        if self.shared is None:
+            return
+
+        self._takeover = asyncio.Event()
+        while True:
+            if not self.shared.try_acquire_leadership():
+                self._takeover.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._takeover.wait(), timeout=self.SHARED_RETRY_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            key = self._key(None)
+            result = await self.cache.get_or_fetch(key, lambda: self._fetch(None))
+            if result["status"] != "success":
+                logger.warning("Shared snapshot refresh failed: %s", result["message"])
+                await asyncio.sleep(self.SHARED_RETRY_INTERVAL)
+                continue
+
+            expires_at = next_ecb_publication().timestamp()
+            self.shared.publish(
+                result["snapshot"], time.time() - (self.cache.age(key) or 0.0), expires_at
+            )
+            await asyncio.sleep(max(expires_at - time.time(), 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return stale-serving, circuit breaker and shared snapshot counters."""
+        return {
+            "stale_served": self.stale_served,
+            "refreshing": sum(1 for t in self._refreshes.values() if not t.done()),
+            "circuit": self.breaker.stats(),
+            "shared": self.shared.stats() if self.shared is not None else None,
+        }
+
+    async def _fetch_snapshot(self, date: Optional[str]) -> Dict[str, Any]:
+        """Fetch one base-rate table from the Frankfurter API."""
+        try:
+            client = await get_http_client()
+            response = await client.get(
+                f"{FRANKFURTER_API_URL}/{date or 'latest'}",
+                params={"from": self.base}
+            )
+
+            if response.status_code != 200:
+                return {
+                    "status": "error",
+                    "message": f"API error: {response.status_code}",
+                    # Client errors (e.g. an invalid date) won't go away on retry
+                    "retryable": response.status_code >= 500 or response.status_code == 429
+                }
+
+            data = response.json()
+            return {
+                "status": "success",
+                "snapshot": RateSnapshot(
+                    data["date"], data.get("base", self.base), data["rates"]
+                )
+            }
+
+        except httpx.TimeoutException:
+            return {
+                "status": "error",
+                "message": "Request timed out. Please try again."
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Failed to fetch rates: {str(e)}"
+            }
+
+
+_engine = RateEngine(
+    max_stale=float(os.environ.get("RATE_MAX_STALE", 7 * 24 * 3600)),
+    shared=SharedSnapshot() if os.environ.get("RATE_SHARED_SNAPSHOT") == "1" else None,
+    shared_grace=float(os.environ.get("RATE_SHARED_GRACE", 300))
+)
+
+
+def get_rate_engine() -> RateEngine:
+    """Get the process-wide rate snapshot engine."""
+    return _engine
+
+
+def start_shared_refresher() -> Optional[asyncio.Task]:
+    """Start the shared snapshot refresher when RATE_SHARED_SNAPSHOT=1."""
+    if _engine.shared is None:
+        return None
+    return asyncio.get_running_loop().create_task(_engine.run_shared_refresher())
@@ -0,0 +1,364 @@
+"""Historical Exchange Rate Store.
+
+A local, on-disk time series of daily base-currency rates, so history
+queries are answered by slicing arrays instead of calling the API again.
+
+Layout (one directory, RATE_HISTORY_DIR, default ``data/rate_history``):
+
+- ``<CODE>.f64``: One memory-mapped float64 column per currency, indexed by
+  calendar day since ``EPOCH``. Each value is units of that currency per
+  one unit of the base currency; 0.0 means "no rate published that day".
+- ``fetched.u1``: One byte per calendar day, set once that day has been
+  loaded from the API (including weekends and holidays with no rates), so
+  backfills only request the date ranges that are still missing.
+
+Several worker processes may share the directory. Files only ever grow
+(under an exclusive ``flock``), so a process never cuts off days that
+another has added and mapped, and each backfill first maps the days and
+currencies added by other processes.
+"""
+
+import asyncio
+import math
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks
+    fcntl = None
+
+import httpx
+import numpy as np
+
+from .http_client import FRANKFURTER_API_URL, get_http_client
+from .rate_engine import RateFetchError
+from .resilience import get_upstream_breaker
+
+# First day of ECB reference rates
+EPOCH = date(1999, 1, 4)
+
+# Largest date range requested from the time-series endpoint at once
+MAX_FETCH_DAYS = 180
+
+# Extra days allocated whenever the columns have to grow
+GROWTH_DAYS = 366
+
+
+class RateHistoryStore:
+    """
+    Columnar, memory-mapped store of daily rates against one base currency.
+
+    Args:
+        directory: Directory holding the column files
+        base: Base currency of the stored rates
+    """
+
+    def __init__(self, directory: Optional[str] = None, base: str = "EUR"):
+        self.directory = directory or os.environ.get(
+            "RATE_HISTORY_DIR", os.path.join("data", "rate_history")
+        )
+        self.base = base
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._columns: Dict[str, np.memmap] = {}
+        self._fetched: Optional[np.memmap] = None
+        self._capacity = 0
+        self._lock = asyncio.Lock()
+        self._open()
+
+    # -------------------------------------------------------------------------
+    # File management
+    # -------------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self) -> None:
+        """Map the existing column files."""
+        size = self._fetched_size()
+        if size:
+            self._map_all(size)
+
+    def _fetched_size(self) -> int:
+        path = self._path("fetched.u1")
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _resize_file(self, name: str, dtype: Any, days: int) -> np.memmap:
+        """
+        Grow (or create) a column file to hold at least `days` entries.
+
+        Never shrinks a file: another process may have grown it further and
+        mapped the extra days, and cutting them off would lose its data and
+        fault its mapping.
+        """
+        path = self._path(name)
+        size = days * np.dtype(dtype).itemsize
+        with open(path, "ab") as handle:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            if os.fstat(handle.fileno()).st_size < size:
+                handle.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+")
+
+    def _map_all(self, capacity: int) -> None:
+        """Map the fetched flags and every column file, grown to `capacity` days."""
+        fetched = self._resize_file("fetched.u1", np.uint8, capacity)
+        # Another process may already have grown the files further
+        capacity = len(fetched)
+        columns = {
+            name[:-4]: self._resize_file(name, np.float64, capacity)
+            for name in sorted(os.listdir(self.directory))
+            if name.endswith(".f64")
+        }
+        # Columns are replaced before the capacity grows, so queries never
+        # see a capacity their columns lack
+        self._columns = columns
+        self._fetched = fetched
+        self._capacity = capacity
+
+    def _refresh(self) -> None:
+        """Map the days and currencies other processes have added."""
+        names = {name[:-4] for name in os.listdir(self.directory) if name.endswith(".f64")}
+        size = self._fetched_size()
+        if size > self._capacity or not names <= set(self._columns):
+            self._map_all(max(size, self._capacity))
+
+    def _ensure_capacity(self, day: int) -> None:
+        """Make sure every column can hold the given day index."""
+        if day >= self._capacity:
+            self._map_all(day + GROWTH_DAYS)
+
+    def _ensure_column(self, code: str) -> np.memmap:
+        """Get the column for a currency, creating it if needed."""
+        column = self._columns.get(code)
+        if column is None:
+            column = self._resize_file(f"{code}.f64", np.float64, self._capacity)
+            # Copied rather than updated in place, as queries may be reading it
+            self._columns = {**self._columns, code: column}
+        return column
+
+    def flush(self) -> None:
+        """Write pending changes to disk."""
+        for column in self._columns.values():
+            column.flush()
+        if self._fetched is not None:
+            self._fetched.flush()
+
+    # -------------------------------------------------------------------------
+    # Indexing
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def day_index(day: date) -> int:
+        """Get the column position of a calendar day."""
+        return (day - EPOCH).days
+
+    @property
+    def currencies(self) -> List[str]:
+        """Currencies with stored history."""
+        return sorted(self._columns)
+
+    def missing_ranges(self, start: date, end: date) -> List[Tuple[date, date]]:
+        """
+        Find the date ranges in [start, end] that have not been fetched yet.
+
+        Returns:
+            List of inclusive (first_day, last_day) ranges
+        """
+        start = max(start, EPOCH)
+        if end < start:
+            return []
+
+        first, last = self.day_index(start), self.day_index(end)
+        covered = np.zeros(last - first + 1, dtype=bool)
+        if self._fetched is not None and first < self._capacity:
+            stored = self._fetched[first:min(last + 1, self._capacity)]
+            covered[:len(stored)] = stored.astype(bool)
+
+        # Edges of runs of uncovered days
+        edges = np.diff(np.concatenate(([1], covered.view(np.int8), [1])))
+        run_starts = np.flatnonzero(edges == -1)
+        run_ends = np.flatnonzero(edges == 1) - 1
+
+        return [
+            (start + timedelta(days=int(a)), start + timedelta(days=int(b)))
+            for a, b in zip(run_starts, run_ends)
+        ]
+
+    # -------------------------------------------------------------------------
+    # Backfill
+    # -------------------------------------------------------------------------
+
+    async def backfill(self, start: date, end: Optional[date] = None) -> int:
+        """
+        Fetch the missing parts of [start, end] from the API.
+
+        Args:
+            start: First day of the range
+            end: Last day of the range (default: today)
+
+        Returns:
+            Number of API requests made
+
+        Raises:
+            RateFetchError: If the API could not be reached
+        """
+        end = min(end or date.today(), date.today())
+        requests = 0
+
+        # Writes to the mapped files may block on disk, so they run in a
+        # worker thread; the lock keeps them one at a time
+        async with self._lock:
+            await asyncio.to_thread(self._refresh)
+            for run_start, run_end in self.missing_ranges(start, end):
+                chunk_start = run_start
+                while chunk_start <= run_end:
+                    chunk_end = min(
+                        chunk_start + timedelta(days=MAX_FETCH_DAYS - 1), run_end
+                    )
+                    rates = await self._fetch_range(chunk_start, chunk_end)
+                    await asyncio.to_thread(self._write, chunk_start, chunk_end, rates)
+                    requests += 1
+                    chunk_start = chunk_end + timedelta(days=1)
+
+            if requests:
+                await asyncio.to_thread(self.flush)
+
+        return requests
+
+    async def _fetch_range(
+        self,
+        start: date,
+        end: date
+    ) -> Dict[str, Dict[str, float]]:
+        """Fetch daily rates for a date range from the time-series endpoint."""
+        breaker = get_upstream_breaker()
+        if not breaker.allow():
+            raise RateFetchError(
+                "Exchange rate service is temporarily unavailable. "
+                f"Retrying in {math.ceil(breaker.retry_after())}s."
+            )
+
+        try:
+            client = await get_http_client()
+            response = await client.get(
+                f"{FRANKFURTER_API_URL}/{start.isoformat()}..{end.isoformat()}",
+                params={"from": self.base}
+            )
+        except httpx.TimeoutException:
+            breaker.record_failure()
+            raise RateFetchError("Request timed out. Please try again.") from None
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            raise RateFetchError(f"Failed to fetch rate history: {str(e)}") from e
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if response.status_code != 200:
+            raise RateFetchError(f"API error: {response.status_code}")
+
+        return response.json().get("rates", {})
+
+    def _write(
+        self,
+        start: date,
+        end: date,
+        rates: Dict[str, Dict[str, float]]
+    ) -> None:
+        """Store fetched rates and mark the range as fetched."""
+        self._ensure_capacity(self.day_index(end))
+        base_column = self._ensure_column(self.base)
+
+        for day_str, day_rates in rates.items():
+            day = self.day_index(date.fromisoformat(day_str))
+            base_column[day] = 1.0
+            for code, rate in day_rates.items():
+                self._ensure_column(code)[day] = rate
+
+        # Today's rates may not be published yet, so leave a weekday today
+        # refetchable until it has data
+        today = date.today()
+        last_final = min(end, today - timedelta(days=1))
+        if last_final >= start:
+            self._fetched[self.day_index(start):self.day_index(last_final) + 1] = 1
+        if end >= today and (
+            today.weekday() >= 5 or base_column[self.day_index(today)] > 0
+        ):
+            self._fetched[self.day_index(today)] = 1
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def series(
+        self,
+        currencies: Sequence[str],
+        start: date,
+        end: date
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Slice stored base rates for several currencies.
+
+        Only days with a published rate for every requested currency are
+        returned.
+
+        Args:
+            currencies: Currency codes (one column each in the result)
+            start: First day of the range
+            end: Last day of the range
+
+        Returns:
+            Tuple of (dates as datetime64[D], rates of shape (days, currencies))
+
+        Raises:
+            KeyError: If a currency has no stored history
+        """
+        first = max(self.day_index(start), 0)
+        last = min(self.day_index(end), self._capacity - 1)
+        if last < first:
+            return np.array([], dtype="datetime64[D]"), np.empty((0, len(currencies)))
+
+        missing = [c for c in currencies if c not in self._columns]
+        if missing:
+            raise KeyError(f"No rate history for: {', '.join(missing)}")
+
+        rates = np.column_stack(
+            [self._columns[c][first:last + 1] for c in currencies]
+        )
+        published = np.all(rates > 0, axis=1)
+
+        days = np.arange(first, last + 1)[published]
+        dates = np.datetime64(EPOCH, "D") + days
+        return dates, rates[published]
+
+    def pair_series(
+        self,
+        source_currency: str,
+        target_currency: str,
+        start: date,
+        end: date
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the daily rate series for one pair (1 source = rate target).
+
+        Returns:
+            Tuple of (dates as datetime64[D], 1-D array of rates)
+        """
+        dates, rates = self.series([source_currency, target_currency], start, end)
+        return dates, rates[:, 1] / rates[:, 0]
+
+
+_store: Optional[RateHistoryStore] = None
+
+
+def get_rate_history_store() -> RateHistoryStore:
+    """Get the process-wide rate history store, opening it on first use."""
+    global _store
+    if _store is None:
+        _store = RateHistoryStore()
+    return _store
@@ -0,0 +1,163 @@
+"""Upstream Resilience.
+
+Protects the agents from a slow or failing Frankfurter API:
+
+- ``CircuitBreaker``: After RATE_BREAKER_FAILURES consecutive failures
+  (default 5) the circuit opens and requests fail immediately instead of
+  waiting for the HTTP timeout. After RATE_BREAKER_RESET seconds (default
+  30) a single probe request is let through; if it succeeds the circuit
+  closes again, otherwise it stays open for another period.
+- ``fetch_with_retry()``: Retries failed fetches with exponential backoff
+  and full jitter (RATE_RETRY_ATTEMPTS attempts, default 3), so clients
+  recovering from an incident don't retry in lockstep.
+
+Fetch functions follow the tool convention of returning a dict with
+``status``. Error dicts may set ``retryable: False`` for failures that a
+retry can't fix (e.g. an invalid date); those don't count against the
+circuit.
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with half-open probing.
+
+    Args:
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a probe
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """
+        Check whether a request may be sent upstream.
+
+        While open, returns False until the reset timeout has passed, then
+        admits exactly one probe request.
+        """
+        if self.state == self.CLOSED:
+            return True
+
+        # A probe that never reported back (e.g. cancelled) doesn't block
+        # the circuit: another one is admitted after the next timeout
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful request."""
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit at the threshold."""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when closed)."""
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the circuit state and counters."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected_requests": self.rejected,
+            "retry_after_seconds": round(self.retry_after(), 1),
+        }
+
+
+def backoff_delay(attempt: int, base_delay: float = 0.25, max_delay: float = 2.0) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+async def fetch_with_retry(
+    fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    breaker: Optional["CircuitBreaker"] = None,
+    attempts: int = 3
+) -> Dict[str, Any]:
+    """
+    Call an upstream fetch through the circuit breaker, retrying failures.
+
+    Args:
+        fetch: Coroutine factory returning a tool-style result dict
+        breaker: Circuit breaker to consult (default: shared upstream breaker)
+        attempts: Maximum number of attempts
+
+    Returns:
+        The first successful result, or the last error
+    """
+    breaker = breaker or get_upstream_breaker()
+    result: Dict[str, Any] = {}
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            return {
+                "status": "error",
+                "message": (
+                    "Exchange rate service is temporarily unavailable. "
+                    f"Retrying in {math.ceil(breaker.retry_after())}s."
+                ),
+                "retryable": False
+            }
+
+        result = await fetch()
+        if result.get("status") == "success":
+            breaker.record_success()
+            return result
+        if result.get("retryable") is False:
+            return result
+
+        breaker.record_failure()
+        if attempt < attempts - 1:
+            await asyncio.sleep(backoff_delay(attempt))
+
+    return result
+
+
+_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("RATE_BREAKER_FAILURES", 5)),
+    reset_timeout=float(os.environ.get("RATE_BREAKER_RESET", 30))
+)
+
+RETRY_ATTEMPTS = int(os.environ.get("RATE_RETRY_ATTEMPTS", 3))
+
+
+def get_upstream_breaker() -> CircuitBreaker:
+    """Get the circuit breaker shared by all Frankfurter API calls."""
+    return _breaker
@@ -0,0 +1,208 @@
+"""Best-Path Conversion Routing.
+
+Finds the cheapest way to convert between two currencies when every
+conversion (corridor) charges a percentage fee, possibly through one or
+more intermediate currencies.
+
+Converting along an edge i -> j turns one unit of i into
+``rate[i, j] * (1 - fee[i, j])`` units of j, so with edge weights
+``-log(rate * (1 - fee))`` the route that yields the most money is the
+shortest path. All-pairs shortest paths are computed once per snapshot with
+a vectorized Floyd-Warshall (one NumPy pass per intermediate currency),
+keeping a next-hop matrix so any route is read back in O(path length).
+
+Fees come from a fee schedule: a default percentage plus per-corridor
+overrides, loaded from CONVERSION_FEES_FILE (JSON) if it exists:
+
+    {"default_pct": 0.5, "corridors": {"USD->EUR": 0.1, "EUR->JPY": 0.2}}
+
+Without a file, CONVERSION_FEE_PCT (default 0) applies to every corridor.
+
+Fees are non-negative, so there are no negative cycles (cross rates from
+one base table multiply to 1 around any cycle).
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .rate_engine import RateSnapshot
+
+# Paths whose weight improves by less than this are treated as ties, so
+# the direct route is kept instead of an equivalent detour
+TOLERANCE = 1e-12
+
+
+class FeeSchedule:
+    """
+    Percentage fees per conversion corridor.
+
+    Args:
+        default_pct: Fee for corridors without an override (e.g. 0.5 = 0.5%)
+        corridors: Overrides keyed by (source, target)
+    """
+
+    def __init__(
+        self,
+        default_pct: float = 0.0,
+        corridors: Optional[Dict[Tuple[str, str], float]] = None
+    ):
+        self.default_pct = default_pct
+        self.corridors = dict(corridors or {})
+
+        for pct in [default_pct, *self.corridors.values()]:
+            if not 0 <= pct < 100:
+                raise ValueError(f"Fee percentages must be in [0, 100): {pct}")
+
+    @classmethod
+    def from_file(cls, path: str) -> "FeeSchedule":
+        """Load a schedule from JSON with default_pct and 'SRC->DST' corridors."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        corridors = {}
+        for corridor, pct in data.get("corridors", {}).items():
+            source, target = corridor.upper().split("->")
+            corridors[(source.strip(), target.strip())] = float(pct)
+        return cls(float(data.get("default_pct", 0.0)), corridors)
+
+    def fee_pct(self, source_currency: str, target_currency: str) -> float:
+        """Get the fee percentage for one corridor."""
+        return self.corridors.get((source_currency, target_currency), self.default_pct)
+
+    def matrix(self, currencies: Tuple[str, ...]) -> np.ndarray:
+        """Get the fee fractions for every corridor between the currencies."""
+        index = {c: i for i, c in enumerate(currencies)}
+        fees = np.full((len(currencies), len(currencies)), self.default_pct / 100.0)
+        for (source, target), pct in self.corridors.items():
+            if source in index and target in index:
+                fees[index[source], index[target]] = pct / 100.0
+        np.fill_diagonal(fees, 0.0)
+        return fees
+
+
+class RoutingTable:
+    """
+    All-pairs best conversion routes for one snapshot and fee schedule.
+
+    Args:
+        snapshot: Rate snapshot
+        fees: Fee schedule
+    """
+
+    def __init__(self, snapshot: RateSnapshot, fees: FeeSchedule):
+        self.snapshot = snapshot
+        self.fees = fees
+        self.fee_matrix = fees.matrix(snapshot.currencies)
+
+        # Net units of j received per unit of i on the direct corridor
+        self.edge_yield = snapshot.matrix * (1.0 - self.fee_matrix)
+        self.distance, self.next_hop = self._floyd_warshall(-np.log(self.edge_yield))
+
+    @staticmethod
+    def _floyd_warshall(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized Floyd-Warshall with next-hop tracking.
+
+        Returns:
+            Tuple of (shortest distances, next_hop) where next_hop[i, j] is
+            the first currency after i on the best route to j
+        """
+        n = weights.shape[0]
+        distance = weights.copy()
+        np.fill_diagonal(distance, 0.0)
+        next_hop = np.tile(np.arange(n), (n, 1))
+
+        for k in range(n):
+            via = distance[:, k:k + 1] + distance[k:k + 1, :]
+            better = via < distance - TOLERANCE
+            distance = np.where(better, via, distance)
+            next_hop = np.where(better, next_hop[:, k:k + 1], next_hop)
+
+        return distance, next_hop
+
+    def route(self, source_currency: str, target_currency: str) -> List[str]:
+        """
+        Get the best route between two currencies.
+
+        Returns:
+            Currency codes from source to target, inclusive
+
+        Raises:
+            KeyError: If either currency is not in the snapshot
+        """
+        i = self.snapshot.index[source_currency]
+        j = self.snapshot.index[target_currency]
+        path = [i]
+        while i != j:
+            i = int(self.next_hop[i, j])
+            path.append(i)
+        return [self.snapshot.currencies[p] for p in path]
+
+    def best_yield(self, source_currency: str, target_currency: str) -> float:
+        """Net units of target received per unit of source on the best route."""
+        i = self.snapshot.index[source_currency]
+        j = self.snapshot.index[target_currency]
+        return float(np.exp(-self.distance[i, j]))
+
+    def legs(self, path: List[str], amount: float) -> List[Dict[str, Any]]:
+        """Break a route into legs with the rate, fee and amounts of each."""
+        legs = []
+        for source, target in zip(path, path[1:]):
+            rate = self.snapshot.rate(source, target)
+            fee_pct = self.fees.fee_pct(source, target)
+            gross = amount * rate
+            received = gross * (1.0 - fee_pct / 100.0)
+            legs.append({
+                "from": source,
+                "to": target,
+                "rate": round(rate, 6),
+                "fee_pct": fee_pct,
+                "amount_in": amount,
+                "fee": gross - received,
+                "amount_out": received,
+            })
+            amount = received
+        return legs
+
+
+def load_fee_schedule() -> FeeSchedule:
+    """Load the fee schedule from CONVERSION_FEES_FILE, or use no fees."""
+    path = os.environ.get("CONVERSION_FEES_FILE", os.path.join("data", "conversion_fees.json"))
+    if os.path.isfile(path):
+        return FeeSchedule.from_file(path)
+    return FeeSchedule(float(os.environ.get("CONVERSION_FEE_PCT", 0.0)))
+
+
+class RoutePlanner:
+    """Builds and caches the routing table for the current snapshot."""
+
+    def __init__(self, fees: Optional[FeeSchedule] = None):
+        self._fees = fees
+        self._table: Optional[RoutingTable] = None
+
+    @property
+    def fees(self) -> FeeSchedule:
+        if self._fees is None:
+            self._fees = load_fee_schedule()
+        return self._fees
+
+    def set_fees(self, fees: FeeSchedule) -> None:
+        """Replace the fee schedule (routes are recomputed on next use)."""
+        self._fees = fees
+        self._table = None
+
+    def table(self, snapshot: RateSnapshot) -> RoutingTable:
+        """Get the routing table for a snapshot, computing it once per snapshot."""
+        if self._table is None or self._table.snapshot is not snapshot:
+            self._table = RoutingTable(snapshot, self.fees)
+        return self._table
+
+
+_planner = RoutePlanner()
+
+
+def get_route_planner() -> RoutePlanner:
+    """Get the process-wide route planner."""
+    return _planner
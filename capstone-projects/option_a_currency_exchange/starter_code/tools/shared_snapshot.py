@@ -0,0 +1,247 @@
+"""Shared Rate Snapshot.
+
+Lets several worker processes share one rate snapshot instead of each
+polling the API. One process (the leader) refreshes the latest rates and
+publishes them into a small memory-mapped file; every process reads the
+file through its own mapping.
+
+Enable with RATE_SHARED_SNAPSHOT=1. The file is RATE_SNAPSHOT_FILE
+(default ``data/rate_snapshot.bin``). Leadership is an exclusive lock on
+``<file>.lock``, so if the leader exits another process takes over on its
+next attempt. The refresher can also run as a sidecar:
+
+    python -m tools.shared_snapshot
+
+File layout (fixed size, little-endian):
+
+- Header: magic, version, currency count, fetched_at, expires_at, date
+  and base currency
+- Up to ``MAX_CURRENCIES`` 4-byte currency codes
+- The same number of float64 base rates
+
+The version is a sequence lock: the writer makes it odd before changing
+the file and even again afterwards. Readers never take a lock. They read
+the version, copy the data and re-read the version, retrying if it moved.
+A reader whose version matches the last one it decoded reuses its cached
+snapshot, so the common case is a single 8-byte read.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, every process refreshes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RATESNP1"
+MAX_CURRENCIES = 256
+
+HEADER = struct.Struct("<8sQIdd16s8s")
+VERSION = struct.Struct("<Q")
+VERSION_OFFSET = 8
+CODES_OFFSET = 64
+RATES_OFFSET = CODES_OFFSET + MAX_CURRENCIES * 4
+FILE_SIZE = RATES_OFFSET + MAX_CURRENCIES * 8
+
+# Reads retried while a publish is in progress before giving up
+MAX_READ_ATTEMPTS = 100
+
+
+class SharedEntry(NamedTuple):
+    """A base-rate table read from the shared file."""
+    version: int
+    date: str
+    base: str
+    rates: Dict[str, float]
+    fetched_at: float
+    expires_at: float
+
+
+class SharedSnapshot:
+    """
+    Reader and (for the leader) writer of the shared snapshot file.
+
+    Args:
+        path: Snapshot file path
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(
+            "RATE_SNAPSHOT_FILE", os.path.join("data", "rate_snapshot.bin")
+        )
+        self._map: Optional[mmap.mmap] = None
+        self._lock_file = None
+
+        self._version = 0
+        self._entry: Optional[SharedEntry] = None
+
+        self.decodes = 0
+        self.publishes = 0
+
+    # -------------------------------------------------------------------------
+    # Mapping
+    # -------------------------------------------------------------------------
+
+    def _open(self) -> None:
+        """Map the file, creating it at full size if needed."""
+        if self._map is not None:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < FILE_SIZE:
+                os.ftruncate(fd, FILE_SIZE)
+            self._map = mmap.mmap(fd, FILE_SIZE)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """Unmap the file and give up leadership."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def read(self) -> Optional[SharedEntry]:
+        """
+        Get the published snapshot.
+
+        Returns:
+            The latest published entry, or None if nothing was published yet
+        """
+        self._open()
+        mm = self._map
+
+        for _ in range(MAX_READ_ATTEMPTS):
+            version = VERSION.unpack_from(mm, VERSION_OFFSET)[0]
+            if version == self._version:
+                return self._entry
+            if version & 1:
+                # Publish in progress
+                time.sleep(0)
+                continue
+
+            magic, _, count, fetched_at, expires_at, date, base = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                return None
+            codes = bytes(mm[CODES_OFFSET:CODES_OFFSET + count * 4])
+            rates = struct.unpack_from(f"<{count}d", mm, RATES_OFFSET)
+
+            if VERSION.unpack_from(mm, VERSION_OFFSET)[0] != version:
+                continue
+
+            base_code = base.rstrip(b"\0").decode()
+            table = {
+                codes[i * 4:i * 4 + 4].rstrip(b"\0").decode(): rates[i]
+                for i in range(count)
+            }
+            table.pop(base_code, None)
+
+            self._entry = SharedEntry(
+                version, date.rstrip(b"\0").decode(), base_code, table,
+                fetched_at, expires_at
+            )
+            self._version = version
+            self.decodes += 1
+            return self._entry
+
+        return None
+
+    # -------------------------------------------------------------------------
+    # Writing (leader only)
+    # -------------------------------------------------------------------------
+
+    def try_acquire_leadership(self) -> bool:
+        """Try to become the refreshing process. Never blocks."""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            return True
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path + ".lock", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None or fcntl is None
+
+    def publish(self, snapshot: Any, fetched_at: float, expires_at: float) -> None:
+        """
+        Write a snapshot to the shared file.
+
+        Args:
+            snapshot: RateSnapshot to publish
+            fetched_at: Epoch seconds when the rates were fetched
+            expires_at: Epoch seconds when the rates expire
+
+        Raises:
+            ValueError: If the snapshot has more than MAX_CURRENCIES currencies
+        """
+        count = len(snapshot.currencies)
+        if count > MAX_CURRENCIES:
+            raise ValueError(f"Snapshot has {count} currencies (max {MAX_CURRENCIES})")
+
+        self._open()
+        mm = self._map
+        version = VERSION.unpack_from(mm, VERSION_OFFSET)[0]
+        # Recover from a writer that died mid-publish
+        version += version & 1
+
+        VERSION.pack_into(mm, VERSION_OFFSET, version + 1)
+        mm[CODES_OFFSET:CODES_OFFSET + count * 4] = b"".join(
+            code.encode().ljust(4, b"\0") for code in snapshot.currencies
+        )
+        struct.pack_into(f"<{count}d", mm, RATES_OFFSET, *snapshot.base_rates.tolist())
+        HEADER.pack_into(
+            mm, 0, MAGIC, version + 1, count, fetched_at, expires_at,
+            snapshot.date.encode(), snapshot.base.encode()
+        )
+        VERSION.pack_into(mm, VERSION_OFFSET, version + 2)
+        self.publishes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return leadership and publish/decode counters."""
+        entry = self.read()
+        return {
+            "path": self.path,
+            "leader": self.is_leader,
+            "version": self._version,
+            "rate_date": entry.date if entry else None,
+            "age_seconds": round(time.time() - entry.fetched_at, 1) if entry else None,
+            "decodes": self.decodes,
+            "publishes": self.publishes,
+        }
+
+
+if __name__ == "__main__":
+    # Sidecar mode: keep the shared file current without serving any agents
+    import asyncio
+
+    logging.basicConfig(level=logging.INFO)
+    os.environ["RATE_SHARED_SNAPSHOT"] = "1"
+
+    from .rate_engine import get_rate_engine
+
+    asyncio.run(get_rate_engine().run_shared_refresher())
@@ -0,0 +1,101 @@
+"""SQLite Store Base.
+
+Scaffolding shared by the SQLite-backed stores (conversion history and
+rate alerts):
+
+- One connection per store in WAL mode, so several worker processes can
+  use the same database file. A thread lock serializes the connection, so
+  store methods can be called from worker threads.
+- Write transactions start with ``BEGIN IMMEDIATE``, taking the database
+  write lock up front instead of failing on upgrade when another process
+  writes at the same time.
+- ``data_version()`` changes whenever another connection commits, so a
+  process can tell that its in-memory view of the data is out of date.
+- ``LazyStore`` holds the process-wide instance, opened on first use.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Generic, Iterator, Optional, TypeVar
+
+StoreT = TypeVar("StoreT")
+
+
+class SQLiteStore:
+    """
+    Base class for a store kept in one SQLite database.
+
+    Subclasses set ``SCHEMA``, which is applied when the store is opened.
+
+    Args:
+        path: Database file path
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: transactions are managed explicitly
+        self._conn = sqlite3.connect(
+            self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Cursor]:
+        """Run a write transaction: committed on success, rolled back on error."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def data_version(self) -> int:
+        """
+        Get a number that changes when another connection commits.
+
+        Commits made through this store do not change it.
+        """
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+class LazyStore(Generic[StoreT]):
+    """
+    A process-wide store, opened on first use.
+
+    Args:
+        factory: Opens the store
+    """
+
+    def __init__(self, factory: Callable[[], StoreT]):
+        self._factory = factory
+        self._store: Optional[StoreT] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> StoreT:
+        """Get the store, opening it if needed."""
+        with self._lock:
+            if self._store is None:
+                self._store = self._factory()
+            return self._store
@@ -1,5 +1,13 @@
 """Customer Service Agents Package."""
 
+import os
+import sys
+
+# capstone-projects/, home of the shared capstone_common package
+_CAPSTONES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if _CAPSTONES_DIR not in sys.path:
+    sys.path.append(_CAPSTONES_DIR)
+
 from .triage_agent import create_triage_agent
 from .product_agent import create_product_agent
 from .order_agent import create_order_agent
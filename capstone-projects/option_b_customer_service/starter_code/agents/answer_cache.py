@@ -0,0 +1,319 @@
+"""Semantic Answer Cache.
+
+Customers ask the same general questions over and over ("what is your
+return policy?", "how long does shipping take?"). Once the agent has
+answered one from the FAQ, the cache serves the same answer to later
+askers in about a millisecond, with no model calls or agent transfers.
+
+A question matches a cached one when its normalized text is identical or,
+failing that, when its embedding in the FAQ index's space (see
+``tools.faq_index``) is at least ANSWER_CACHE_SIMILARITY (default 0.9)
+cosine-similar, so "How long does delivery take?" finds "how long does
+shipping take". Entries expire after ANSWER_CACHE_TTL seconds (default
+3600) and the least recently used are evicted beyond ANSWER_CACHE_SIZE
+entries (default 1000). The whole cache is dropped when the FAQ changes.
+
+Only general questions are cached, and the rules are strict:
+
+- A message that mentions orders, accounts, tickets, contact details or
+  the customer's own refund or delivery, or contains an email address or
+  a number of three or more digits, is never looked up or stored: it
+  always goes to the agent.
+- A message with fewer than two content words ("what about that one?")
+  likely depends on the conversation, so it is not cached either.
+- An answer is stored only if the agent's turn used the FAQ search and no
+  other tool, so nothing read from orders, customers or tickets (or from
+  the product catalog, which changes independently of the FAQ) is ever
+  served to another user.
+- A reply can also draw on earlier turns, so a session becomes private
+  once the agent has used any other tool or agent in it (or the customer
+  has mentioned personal details). A private session's messages are never
+  looked up or stored, until the session is closed.
+
+Cached turns are not added to the agent's session.
+
+Set ANSWER_CACHE=0 to send every message to the agent.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+import numpy as np
+
+from tools.faq_index import DIMENSIONS, content_words
+
+from .product_agent import get_faq_index
+
+# Tools whose results may be cached: the answer depends only on the FAQ
+CACHEABLE_TOOLS = frozenset({"search_faq"})
+
+# Agents that may run in a session whose answers are cached (the triage
+# agent and the product agent, which answers from the FAQ)
+CACHEABLE_AGENTS = frozenset({"customer_service_triage", "product_agent"})
+
+# Questions with fewer content words are not cached
+MIN_CONTENT_WORDS = 2
+
+# Messages about a particular customer's data are never cached
+PERSONAL_PATTERN = re.compile(
+    r"\b(orders?|ordered|tracking|track|account|login|password|address|"
+    r"invoices?|receipt|tickets?|escalat\w*|manager|complaint|email|phone|"
+    r"name|cancel\w*|modify|change)\b"
+    r"|\bmy (refund|return|delivery|package|parcel|shipment|purchase)"
+    r"|\bwhere('s| is| are) my\b|\S+@\S+|\d{3,}",
+    re.IGNORECASE
+)
+
+
+def normalize_question(text: str) -> str:
+    """Lower-case a question and collapse punctuation and whitespace."""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+@dataclass
+class CachedAnswer:
+    """An agent reply cached for a question."""
+    question: str
+    reply: str
+    slot: int
+    stored_at: float
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    Serves repeated general questions from earlier agent answers.
+
+    Args:
+        max_entries: Maximum cached answers; the least recently used are
+            evicted first
+        ttl_seconds: How long an answer stays valid
+        similarity: Minimum cosine similarity of a non-identical question
+        enabled: Whether to use the cache at all
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600.0,
+        similarity: float = 0.9,
+        enabled: bool = True
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.enabled = enabled
+
+        # Normalized question -> answer, least recently used first
+        self._answers: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        # One embedding row per slot; free slots are all zeros
+        self._vectors = np.zeros((max_entries, DIMENSIONS), dtype=np.float32)
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._fingerprint: Optional[str] = None
+        # Sessions whose replies may depend on personal context
+        self._private_sessions: Set[Hashable] = set()
+
+        self.lookups = 0
+        self.hits = {"exact": 0, "similar": 0}
+        self.bypassed = 0
+        self.stored = 0
+        self.not_cacheable = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._hit_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    @staticmethod
+    def is_cacheable_question(text: str) -> bool:
+        """Whether a message is general enough to be answered from the cache."""
+        if PERSONAL_PATTERN.search(text):
+            return False
+        return len(content_words(text)) >= MIN_CONTENT_WORDS
+
+    def lookup(self, text: str, session: Optional[Hashable] = None) -> Optional[str]:
+        """
+        Find a cached answer for a message.
+
+        Args:
+            text: The user's message
+            session: The conversation it belongs to
+
+        Returns:
+            The cached reply, or None if the message should go to the agent
+        """
+        if not self.enabled:
+            return None
+        if session in self._private_sessions or not self.is_cacheable_question(text):
+            self.bypassed += 1
+            return None
+
+        self.lookups += 1
+        started = time.perf_counter()
+        self._check_faq()
+
+        key = normalize_question(text)
+        answer = self._answers.get(key)
+        kind = "exact"
+        if answer is None and self._answers:
+            scores = self._vectors @ get_faq_index().embed([text])[0]
+            slot = int(np.argmax(scores))
+            if scores[slot] >= self.similarity and self._slot_keys[slot] is not None:
+                answer = self._answers[self._slot_keys[slot]]
+                kind = "similar"
+        if answer is None:
+            return None
+
+        key = self._slot_keys[answer.slot]
+        if time.monotonic() - answer.stored_at > self.ttl_seconds:
+            self._remove(key)
+            self.expirations += 1
+            return None
+
+        self._answers.move_to_end(key)
+        answer.hits += 1
+        self.hits[kind] += 1
+        self._hit_seconds += time.perf_counter() - started
+        return answer.reply
+
+    def note_turn(
+        self,
+        session: Hashable,
+        text: str,
+        tools_used: Iterable[str],
+        agents: Iterable[str]
+    ) -> None:
+        """
+        Record what the agent did for a message, making the session private
+        if it used anything but the FAQ.
+
+        Args:
+            session: The conversation
+            text: The user's message
+            tools_used: Names of the tools the agent called (agent
+                transfers excluded)
+            agents: Names of the agents that ran
+        """
+        if (
+            PERSONAL_PATTERN.search(text)
+            or not set(tools_used) <= CACHEABLE_TOOLS
+            or not set(agents) <= CACHEABLE_AGENTS
+        ):
+            self._private_sessions.add(session)
+
+    def end_session(self, session: Hashable) -> None:
+        """Forget a closed session."""
+        self._private_sessions.discard(session)
+
+    def store(
+        self,
+        text: str,
+        reply: str,
+        tools_used: Iterable[str],
+        session: Optional[Hashable] = None
+    ) -> bool:
+        """
+        Cache the agent's reply to a message, if it is safe to share.
+
+        Args:
+            text: The user's message
+            reply: The agent's full reply
+            tools_used: Names of the tools the agent called for the turn
+                (agent transfers excluded)
+            session: The conversation, after ``note_turn`` for this turn
+
+        Returns:
+            True if the reply was cached
+        """
+        if not self.enabled or not reply.strip() or not self.is_cacheable_question(text):
+            return False
+
+        tools_used = set(tools_used)
+        if (
+            session in self._private_sessions
+            or not tools_used
+            or not tools_used <= CACHEABLE_TOOLS
+        ):
+            self.not_cacheable += 1
+            return False
+
+        self._check_faq()
+        key = normalize_question(text)
+        if key in self._answers:
+            self._remove(key)
+        while len(self._answers) >= self.max_entries:
+            oldest = next(iter(self._answers))
+            self._remove(oldest)
+            self.evictions += 1
+
+        slot = self._free.pop()
+        self._vectors[slot] = get_faq_index().embed([text])[0]
+        self._slot_keys[slot] = key
+        self._answers[key] = CachedAnswer(
+            question=text, reply=reply, slot=slot, stored_at=time.monotonic()
+        )
+        self.stored += 1
+        return True
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        for key in list(self._answers):
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        answer = self._answers.pop(key)
+        self._vectors[answer.slot] = 0.0
+        self._slot_keys[answer.slot] = None
+        self._free.append(answer.slot)
+
+    def _check_faq(self) -> None:
+        """Drop the cache if the FAQ has changed since answers were cached."""
+        fingerprint = get_faq_index().fingerprint
+        if fingerprint != self._fingerprint:
+            if self._answers:
+                self.invalidations += 1
+                self.clear()
+            self._fingerprint = fingerprint
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache hit metrics."""
+        hits = sum(self.hits.values())
+        return {
+            "entries": len(self._answers),
+            "lookups": self.lookups,
+            "hits": hits,
+            "exact_hits": self.hits["exact"],
+            "similar_hits": self.hits["similar"],
+            "bypassed": self.bypassed,
+            "stored": self.stored,
+            "not_cacheable": self.not_cacheable,
+            "private_sessions": len(self._private_sessions),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "avg_hit_ms": round(self._hit_seconds / hits * 1000, 2) if hits else 0.0,
+        }
+
+
+def create_answer_cache() -> AnswerCache:
+    """
+    Create the answer cache (ANSWER_CACHE, ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL and ANSWER_CACHE_SIMILARITY).
+    """
+    return AnswerCache(
+        max_entries=int(os.environ.get("ANSWER_CACHE_SIZE", 1000)),
+        ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL", 3600)),
+        similarity=float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.9)),
+        enabled=os.environ.get("ANSWER_CACHE", "1") != "0"
+    )
@@ -11,6 +11,8 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import random
 
+from .models import get_model
+
 
 # Simulated ticket storage
 _tickets: Dict[str, Dict[str, Any]] = {}
@@ -142,7 +144,7 @@ def create_escalation_agent() -> Agent:
     
     return Agent(
         name="escalation_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Escalation specialist. Handles complex issues requiring human support.
         Creates tickets, tracks issues, and ensures proper handoff.
@@ -11,6 +11,8 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import random
 
+from .models import get_model
+
 
 # Simulated order database
 ORDERS = {
@@ -150,7 +152,7 @@ def create_order_agent() -> Agent:
     
     return Agent(
         name="order_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Order management specialist. Handles order status inquiries, tracking,
         and order modifications. Delegate order-related questions here.
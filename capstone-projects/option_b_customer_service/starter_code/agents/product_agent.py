@@ -9,6 +9,14 @@ from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 from typing import Dict, Any, List, Optional
 import json
+import os
+import threading
+
+from tools.catalog_store import CatalogStore
+from tools.faq_index import FaqIndex
+from tools.product_search import InvalidCursor, ProductSearchIndex
+
+from .models import get_model
 
 
 # Simulated knowledge base (replace with MCP connection in production)
@@ -47,36 +55,172 @@ FAQ = [
 ]
 
 
+# Catalog file written by tools/catalog_store.py; when set, products are
+# read from it instead of PRODUCTS
+CATALOG_PATH = os.environ.get("PRODUCT_CATALOG")
+
+_catalog_store: Optional[CatalogStore] = None
+_store_lock = threading.Lock()
+
+# Search index over the catalog. The server builds it in a background
+# thread at startup (a large catalog takes a while); otherwise it is built
+# on first use
+_product_index: Optional[ProductSearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_catalog_store() -> Optional[CatalogStore]:
+    """Get the memory-mapped catalog, or None when PRODUCTS is used."""
+    global _catalog_store
+    with _store_lock:
+        if _catalog_store is None and CATALOG_PATH:
+            _catalog_store = CatalogStore(CATALOG_PATH)
+        return _catalog_store
+
+
+def get_product_index() -> ProductSearchIndex:
+    """Get the product search index, building it (or waiting for it) if needed."""
+    global _product_index
+    with _index_lock:
+        if _product_index is None:
+            store = get_catalog_store()
+            _product_index = ProductSearchIndex(PRODUCTS if store is None else store)
+        return _product_index
+
+
+def product_index_loading() -> bool:
+    """Check whether the search index is being built in another thread."""
+    return _product_index is None and _index_lock.locked()
+
+
+def close_product_catalog() -> None:
+    """Drop the search index and unmap the catalog file. Call on shutdown."""
+    global _catalog_store, _product_index
+    _product_index = None
+    if _catalog_store is not None:
+        _catalog_store.close()
+        _catalog_store = None
+
+
+# FAQ matches below this cosine similarity are not returned
+MIN_FAQ_SCORE = 0.2
+
+# Knowledge bases larger than this use the int8 FAQ index
+FAQ_QUANTIZE_ABOVE = 50_000
+
+# Embedding index over FAQ, built on first use
+_faq_index: Optional[FaqIndex] = None
+
+
+def get_faq_index() -> FaqIndex:
+    """Get the FAQ index, building it on first use."""
+    global _faq_index
+    if _faq_index is None:
+        _faq_index = FaqIndex(FAQ, quantized=len(FAQ) > FAQ_QUANTIZE_ABOVE)
+    return _faq_index
+
+
+def update_faq(entries: List[Dict[str, Any]]) -> None:
+    """
+    Replace the FAQ and re-index it.
+    
+    Args:
+        entries: FAQ entries with question, answer and category
+    """
+    global _faq_index
+    FAQ[:] = entries
+    _faq_index = None
+
+
+def upsert_product(product: Dict[str, Any]) -> None:
+    """
+    Add a product to the catalog, or replace the one with the same id.
+    
+    Args:
+        product: Product with id, name, category, price and description
+    """
+    if not CATALOG_PATH:
+        for i, existing in enumerate(PRODUCTS):
+            if existing["id"] == product["id"]:
+                PRODUCTS[i] = product
+                break
+        else:
+            PRODUCTS.append(product)
+    get_product_index().upsert(product)
+
+
+def remove_product(product_id: str) -> bool:
+    """
+    Remove a product from the catalog.
+    
+    Args:
+        product_id: The product ID
+    
+    Returns:
+        True if the product existed
+    """
+    if not CATALOG_PATH:
+        PRODUCTS[:] = [product for product in PRODUCTS if product["id"] != product_id]
+    return get_product_index().remove(product_id)
+
+
 def search_products(
     query: str,
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Search the product catalog.
     
+    Matches every word of the query (partial words match as prefixes) and
+    ranks the results by relevance. Results are paginated: pass the
+    returned next_cursor to get the next page.
+    
     Args:
-        query: Search terms
+        query: Search terms, e.g. "i7 laptop" (empty to browse)
         category: Filter by category (Laptops, Phones, etc.)
+        min_price: Minimum price
+        max_price: Maximum price
+        limit: Results per page (1-50, default 10)
+        cursor: next_cursor from the previous page of the same search
     
     Returns:
-        Matching products
+        One page of matching products, most relevant first, with the total
+        number of matches and match counts by category and price range
+        (estimates when approximate is true)
     """
-    results = []
-    query_lower = query.lower()
+    limit = min(max(1, limit), 50)
     
-    for product in PRODUCTS:
-        if category and product["category"].lower() != category.lower():
-            continue
-        
-        if (query_lower in product["name"].lower() or 
-            query_lower in product["description"].lower() or
-            query_lower in product["category"].lower()):
-            results.append(product)
+    if product_index_loading():
+        return {
+            "status": "error",
+            "message": "The product catalog is still loading; please try again in a moment"
+        }
+    
+    try:
+        page = get_product_index().search_page(
+            query, category, min_price, max_price, limit, cursor
+        )
+    except InvalidCursor as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
     
     return {
         "status": "success",
-        "count": len(results),
-        "products": results
+        "count": len(page.results),
+        "total": page.total,
+        "has_more": page.next_cursor is not None,
+        "next_cursor": page.next_cursor,
+        "products": [
+            {**product, "relevance": round(score, 3)} for product, score in page.results
+        ],
+        "facets": page.facets,
+        "approximate": page.approximate
     }
 
 
@@ -90,12 +234,16 @@ def get_product_details(product_id: str) -> Dict[str, Any]:
     Returns:
         Product details
     """
-    for product in PRODUCTS:
-        if product["id"] == product_id:
-            return {
-                "status": "success",
-                "product": product
-            }
+    if _product_index is None and CATALOG_PATH:
+        # A lookup by id only needs the catalog's hash index
+        product = get_catalog_store().get(product_id)
+    else:
+        product = get_product_index().get(product_id)
+    if product is not None:
+        return {
+            "status": "success",
+            "product": product
+        }
     
     return {
         "status": "error",
@@ -103,29 +251,26 @@ def get_product_details(product_id: str) -> Dict[str, Any]:
     }
 
 
-def search_faq(query: str) -> Dict[str, Any]:
+def search_faq(query: str, limit: int = 3) -> Dict[str, Any]:
     """
     Search the FAQ database.
     
+    Matches by meaning, so the customer's own wording works ("can I send
+    it back?" finds the return policy).
+    
     Args:
-        query: Search terms
+        query: The customer's question or search terms
+        limit: Maximum number of entries to return (default 3)
     
     Returns:
-        Relevant FAQ entries
+        Relevant FAQ entries, most relevant first
     """
-    results = []
-    query_lower = query.lower()
-    
-    for faq in FAQ:
-        if (query_lower in faq["question"].lower() or 
-            query_lower in faq["answer"].lower() or
-            query_lower in faq["category"].lower()):
-            results.append(faq)
+    matches = get_faq_index().search(query, min(max(1, limit), 10), MIN_FAQ_SCORE)
     
     return {
         "status": "success",
-        "count": len(results),
-        "faqs": results
+        "count": len(matches),
+        "faqs": [{**faq, "relevance": round(score, 3)} for faq, score in matches]
     }
 
 
@@ -134,7 +279,7 @@ def create_product_agent() -> Agent:
     
     return Agent(
         name="product_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Product specialist agent. Handles questions about products, specifications,
         pricing, and general FAQ. Delegate product and information queries here.
@@ -144,7 +289,9 @@ def create_product_agent() -> Agent:
         find answers to common questions.
         
         ## Your Capabilities
-        - Search products by name, description, or category
+        - Search products by name, description, specs, or category
+          (multi-word queries like "i7 laptop" and partial words work)
+        - Filter searches by price range (min_price / max_price)
         - Provide detailed product specifications
         - Answer frequently asked questions
         - Compare products when asked
@@ -155,6 +302,9 @@ def create_product_agent() -> Agent:
         3. Be honest if a product isn't available
         4. Provide helpful comparisons when relevant
         5. Include prices when discussing products
+        6. For broad searches, use the facet counts (by category and price
+           range) to narrow the search instead of paging through results;
+           only fetch more pages with next_cursor when the customer asks
         """,
         tools=[
             FunctionTool(search_products),
@@ -7,6 +7,7 @@ from google.adk.agents import Agent
 from .product_agent import create_product_agent
 from .order_agent import create_order_agent
 from .escalation_agent import create_escalation_agent
+from .models import get_model
 
 
 def create_triage_agent() -> Agent:
@@ -25,7 +26,7 @@ def create_triage_agent() -> Agent:
     # Create triage agent with sub-agents
     triage_agent = Agent(
         name="customer_service_triage",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="Customer service triage agent that routes requests to specialists.",
         instruction="""
         You are a customer service triage specialist. Your job is to understand
@@ -9,11 +9,17 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-if not os.environ.get("GOOGLE_API_KEY"):
-    raise ValueError("Please set GOOGLE_API_KEY environment variable")
+from agents.models import requires_api_key
 
-from agents import create_triage_agent
-from google.adk.runners import InMemoryRunner
+# Verify API key is set (not needed when replaying a model cassette)
+if requires_api_key() and not os.environ.get("GOOGLE_API_KEY"):
+    raise ValueError(
+        "Please set GOOGLE_API_KEY environment variable "
+        "(or AGENT_MODEL_MODE=replay to run offline)"
+    )
+
+from capstone_common.console import read_input
+from server import create_server
 
 
 async def main():
@@ -24,17 +30,24 @@ async def main():
     print("=" * 60)
     print("\nInitializing agents...")
     
-    triage_agent = create_triage_agent()
+    # The REPL is one client of the multi-session server (see server.py)
+    server = create_server()
+    triage_agent = server.agent
     
     print(f"✅ Triage Agent '{triage_agent.name}' ready!")
     print(f"   Sub-agents: {[a.name for a in triage_agent.sub_agents]}")
     
-    runner = InMemoryRunner(agent=triage_agent)
+    await server.start()
     
-    session = await runner.session_service.create_session(
-        app_name=triage_agent.name,
-        user_id="customer_123"
-    )
+    user_id = os.environ.get("AGENT_USER_ID", "customer_123")
+    session_id = await server.open_session(user_id)
+    
+    # Per-turn latency footer (toggle with 'timing')
+    show_timing = os.environ.get("SHOW_TIMING", "0") == "1"
+    
+    async def show_event(event):
+        if event["event"] == "text":
+            print(event["text"], end="", flush=True)
     
     print("\n" + "=" * 60)
     print("Customer Service Chat - Type 'quit' to exit")
@@ -44,39 +57,49 @@ async def main():
     print("  - Where is my order #12345?")
     print("  - I want to return a defective item")
     print("  - What's your return policy?")
+    print("  (type 'stats' for server metrics, 'timing' to toggle the")
+    print("   per-turn latency footer)")
     print()
     
-    while True:
-        try:
-            user_input = input("Customer: ").strip()
-            
-            if user_input.lower() in ['quit', 'exit', 'q']:
-                print("\nThank you for contacting us! Goodbye! 👋")
+    try:
+        while True:
+            try:
+                user_input = (await read_input("Customer: ")).strip()
+                
+                if user_input.lower() in ['quit', 'exit', 'q']:
+                    print("\nThank you for contacting us! Goodbye! 👋")
+                    break
+                
+                if not user_input:
+                    continue
+                
+                if user_input.lower() == 'stats':
+                    print(f"\nServer: {server.stats()}\n")
+                    continue
+                
+                if user_input.lower() == 'timing':
+                    show_timing = not show_timing
+                    print(f"\nTiming footer {'on' if show_timing else 'off'}\n")
+                    continue
+                
+                print("\nAgent: ", end="")
+                metrics = await server.run_turn(user_id, session_id, user_input, show_event)
+                print()
+                if show_timing:
+                    print(f"   ⏱  {metrics.summary()}")
+                print()
+                
+            except (KeyboardInterrupt, EOFError):
+                print("\n\nThank you for contacting us! Goodbye! 👋")
                 break
-            
-            if not user_input:
-                continue
-            
-            response = await runner.run(
-                user_id="customer_123",
-                session_id=session.id,
-                new_message=user_input
-            )
-            
-            print("\nAgent: ", end="")
-            async for event in response:
-                if hasattr(event, 'content') and event.content:
-                    for part in event.content.parts:
-                        if hasattr(part, 'text'):
-                            print(part.text, end="")
-            print("\n")
-            
-        except KeyboardInterrupt:
-            print("\n\nThank you for contacting us! Goodbye! 👋")
-            break
-        except Exception as e:
-            print(f"\n❌ Error: {e}\n")
+            except Exception as e:
+                print(f"\n❌ Error: {e}\n")
+    finally:
+        await server.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
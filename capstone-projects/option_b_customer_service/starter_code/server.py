@@ -0,0 +1,97 @@
+"""Customer Service Multi-Session Server.
+
+The customer service agents served over the shared multi-session server
+(see ``capstone_common.agent_server`` for the protocol). Run it with
+``python server.py``; ``main.py`` runs the same server in-process.
+
+General questions the agent has already answered from the FAQ are served
+from a semantic answer cache (see ``agents.answer_cache``) without running
+the agent, except in sessions that have used other tools or agents;
+ANSWER_CACHE=0 turns it off.
+
+The product search index is built in a background thread at startup;
+product searches report that the catalog is loading until it is ready.
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from google.adk.agents import BaseAgent
+
+from agents import create_triage_agent
+from agents.answer_cache import AnswerCache, create_answer_cache
+from agents.product_agent import close_product_catalog, get_product_index
+from capstone_common.agent_server import AgentServer, AgentTurn, run_server, server_options
+
+
+class CustomerServiceServer(AgentServer):
+    """
+    Agent server for the customer service agents.
+
+    Args:
+        agent: Root agent shared by every session
+        answer_cache: Cache of general answers checked before the agent runs
+        **options: AgentServer options
+    """
+
+    SHORTCUT = "cached answer"
+
+    def __init__(
+        self,
+        agent: BaseAgent,
+        answer_cache: Optional[AnswerCache] = None,
+        **options: Any
+    ):
+        super().__init__(agent, **options)
+        self.answer_cache = answer_cache
+
+    async def start(self) -> None:
+        """Build the product search index in a background thread."""
+        # Searches report that the catalog is loading until it is built,
+        # rather than blocking the event loop
+        self._background.append(
+            asyncio.get_running_loop().create_task(asyncio.to_thread(get_product_index))
+        )
+
+    async def close(self) -> None:
+        """Close every session and release the product catalog."""
+        await super().close()
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+        close_product_catalog()
+
+    async def answer_directly(self, user_id: str, session_id: str, text: str) -> Optional[str]:
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.lookup(text, (user_id, session_id))
+
+    def turn_completed(self, turn: AgentTurn) -> None:
+        if self.answer_cache is None:
+            return
+        # A session that has used anything but the FAQ is never cached
+        session = (turn.user_id, turn.session_id)
+        self.answer_cache.note_turn(session, turn.text, turn.tools, turn.agents)
+        if turn.completed:
+            self.answer_cache.store(turn.text, turn.reply, turn.tools, session)
+
+    def session_closed(self, user_id: str, session_id: str) -> None:
+        if self.answer_cache is not None:
+            self.answer_cache.end_session((user_id, session_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return server counters and answer cache metrics."""
+        stats = super().stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.stats()
+        return stats
+
+
+def create_server() -> CustomerServiceServer:
+    """Create the server (AGENT_MAX_CONCURRENCY, AGENT_STREAMING and ANSWER_CACHE*)."""
+    return CustomerServiceServer(
+        create_triage_agent(), answer_cache=create_answer_cache(), **server_options()
+    )
+
+
+if __name__ == "__main__":
+    run_server(create_server)
@@ -0,0 +1,83 @@
+"""Tests for the memory-mapped catalog file (tools/catalog_store.py).
+
+Run from starter_code/ with ``python -m pytest tests``.
+"""
+
+import numpy as np
+import pytest
+
+from tools.catalog_store import CatalogStore, _hash_id, _hash_ids, write_catalog
+
+
+def make_products(ids):
+    return [
+        {"id": product_id, "name": f"Product {i}", "category": f"C{i % 7}", "price": float(i)}
+        for i, product_id in enumerate(ids)
+    ]
+
+
+@pytest.fixture
+def open_catalog(tmp_path):
+    stores = []
+
+    def open_catalog(products):
+        path = str(tmp_path / f"catalog{len(stores)}.pcat")
+        write_catalog(path, products)
+        stores.append(CatalogStore(path))
+        return stores[-1]
+
+    yield open_catalog
+    for store in stores:
+        store.close()
+
+
+def test_numpy_and_python_hashes_agree():
+    ids = np.array([b"a", b"P-001", "café".encode(), b""], dtype="S8")
+
+    expected = [_hash_id(key.ljust(8, b"\0")) for key in ids.tolist()]
+
+    assert _hash_ids(ids).tolist() == expected
+
+
+def test_row_of_finds_every_id(open_catalog):
+    # Ids of different widths, so most are padded, and enough rows for
+    # many probe collisions
+    ids = [f"P{i}" for i in range(5000)] + ["café", "x" * 40]
+    store = open_catalog(make_products(ids))
+
+    for row, product_id in enumerate(ids):
+        assert store.row_of(product_id) == row
+
+
+def test_row_of_misses(open_catalog):
+    store = open_catalog(make_products([f"P{i}" for i in range(100)]))
+
+    assert store.row_of("P100") is None
+    # A prefix of stored ids, which differs from them only in padding
+    assert store.row_of("P") is None
+    assert store.row_of("") is None
+    # Longer than the id column
+    assert store.row_of("P" * 100) is None
+
+
+def test_slot_table_is_at_most_half_full(open_catalog):
+    store = open_catalog(make_products([f"P{i}" for i in range(1000)]))
+
+    slots = store._slots
+    assert len(slots) & (len(slots) - 1) == 0
+    assert np.count_nonzero(slots) == 1000
+    assert len(slots) >= 2000
+    assert sorted(slots[slots > 0] - 1) == list(range(1000))
+
+
+def test_get_builds_the_product(open_catalog):
+    products = make_products(["A", "B"])
+    products[1].update(price=None, specs={"color": "red"})
+    store = open_catalog(products)
+
+    assert store.get("B") == {
+        "id": "B", "name": "Product 1", "category": "C1", "price": None,
+        "specs": {"color": "red"},
+    }
+    assert store.get("missing") is None
+    assert [product["id"] for product in store] == ["A", "B"]
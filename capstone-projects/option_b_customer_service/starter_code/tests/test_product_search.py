@@ -0,0 +1,215 @@
+"""Tests for the product search index (tools/product_search.py).
+
+Run from starter_code/ with ``python -m pytest tests``.
+"""
+
+import threading
+
+import pytest
+
+from tools import product_search
+from tools.catalog_store import CatalogStore, write_catalog
+from tools.product_search import InvalidCursor, ProductSearchIndex
+
+# Category -> product noun
+CATEGORIES = {"Laptops": "Laptop", "Audio": "Speaker", "Accessories": "Cable"}
+
+
+def make_products(count=60):
+    products = []
+    for i in range(count):
+        category = list(CATEGORIES)[i % len(CATEGORIES)]
+        color = "silver" if i % 2 else "black"
+        products.append({
+            "id": f"P{i:03d}",
+            "name": f"{color.title()} {CATEGORIES[category]} {i}",
+            "category": category,
+            "price": 20.0 + 15 * i,
+            "description": f"A {color} product for work and travel",
+        })
+    return products
+
+
+def ids(results):
+    return [product["id"] for product, _ in results]
+
+
+def all_pages(index, query, limit, **filters):
+    """Follow next_cursor to the end, returning every page's results."""
+    results, cursor = [], None
+    while True:
+        page = index.search_page(query, limit=limit, cursor=cursor, **filters)
+        results.extend(page.results)
+        cursor = page.next_cursor
+        if cursor is None:
+            return results
+
+
+@pytest.fixture
+def index():
+    return ProductSearchIndex(make_products())
+
+
+# -----------------------------------------------------------------------------
+# Matching
+# -----------------------------------------------------------------------------
+
+def test_every_term_must_match(index):
+    results = index.search("silver laptop", limit=100)
+
+    assert results
+    for product, _ in results:
+        assert product["category"] == "Laptops"
+        assert "silver" in product["description"]
+
+
+def test_falls_back_to_any_term(index):
+    # No product matches "zebra": laptops are ranked instead
+    results = index.search("laptop zebra", limit=100)
+    assert set(ids(results)) == set(ids(index.search("laptop", limit=100)))
+
+    # No product is both black and number 1 (odd products are silver)
+    results = index.search("black 1", limit=100)
+    assert results
+    assert "P001" in ids(results)
+    assert any("black" in product["description"] for product, _ in results)
+
+
+def test_search_page_falls_back_to_any_term(index):
+    page = index.search_page("black 1", limit=100)
+
+    assert ids(page.results) == ids(index.search("black 1", limit=100))
+    assert page.total == len(page.results)
+
+
+def test_prefix_matching(index):
+    prefix = index.search("lapt", limit=100)
+
+    assert len(prefix) == 20
+    assert set(ids(prefix)) == set(ids(index.search("laptop", limit=100)))
+
+
+def test_plurals_are_folded(index):
+    assert ids(index.search("laptops", limit=100)) == ids(index.search("laptop", limit=100))
+
+
+def test_category_filter(index):
+    results = index.search("silver", category="audio", limit=100)
+
+    assert results
+    assert {product["category"] for product, _ in results} == {"Audio"}
+
+
+# -----------------------------------------------------------------------------
+# Pagination
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize("query", ["silver", "silver laptop", "black 1", "acc", ""])
+def test_cursor_pages_match_one_page(index, query):
+    everything = index.search_page(query, limit=1000)
+
+    paged = all_pages(index, query, limit=7)
+
+    assert ids(paged) == ids(everything.results)
+    assert len(set(ids(paged))) == len(paged)
+
+
+def test_cursor_pages_with_filters(index):
+    filters = {"category": "laptops", "min_price": 100, "max_price": 700}
+    everything = index.search_page("silver", limit=1000, **filters)
+
+    paged = all_pages(index, "silver", limit=2, **filters)
+
+    assert ids(paged) == ids(everything.results)
+    assert all(100 <= product["price"] <= 700 for product, _ in paged)
+
+
+def test_cursor_rejected_after_upsert(index):
+    page = index.search_page("silver", limit=5)
+    index.upsert({**make_products()[1], "name": "Renamed"})
+
+    with pytest.raises(InvalidCursor):
+        index.search_page("silver", limit=5, cursor=page.next_cursor)
+
+
+def test_cursor_rejected_for_another_search(index):
+    page = index.search_page("silver", limit=5)
+
+    with pytest.raises(InvalidCursor):
+        index.search_page("black", limit=5, cursor=page.next_cursor)
+    with pytest.raises(InvalidCursor):
+        index.search_page("silver", limit=5, cursor="not-a-cursor")
+
+
+def test_cursor_survives_failed_remove(index):
+    page = index.search_page("silver", limit=5)
+    assert index.remove("missing") is False
+
+    assert index.search_page("silver", limit=5, cursor=page.next_cursor).results
+
+
+# -----------------------------------------------------------------------------
+# Changes and merges
+# -----------------------------------------------------------------------------
+
+def test_upsert_and_remove(index):
+    index.upsert({"id": "NEW", "name": "Zebra Headphones", "category": "Audio", "price": 99})
+    assert ids(index.search("zebra")) == ["NEW"]
+
+    index.upsert({"id": "NEW", "name": "Quagga Headphones", "category": "Audio", "price": 99})
+    assert index.search("zebra") == []
+    assert ids(index.search("quagga")) == ["NEW"]
+
+    assert index.remove("NEW") is True
+    assert index.search("quagga") == []
+    assert index.get("NEW") is None
+
+
+def test_merge_replays_changes_made_during_merge(index, monkeypatch):
+    monkeypatch.setattr(product_search, "MIN_MERGE_DOCS", 1)
+    index.merge_ratio = 0.0
+    release = threading.Event()
+    merged = index._merged
+
+    def slow_merge(catalog, products):
+        release.wait(10)
+        return merged(catalog, products)
+
+    monkeypatch.setattr(index, "_merged", slow_merge)
+
+    # Starts a background merge, which waits for the release
+    index.upsert({"id": "A1", "name": "Zebra Speaker", "category": "Audio", "price": 10})
+    assert index.stats()["merging"]
+
+    # Made while the merge runs: replayed onto the merged segment
+    index.upsert({"id": "A2", "name": "Quagga Speaker", "category": "Audio", "price": 10})
+    index.upsert({"id": "P000", "name": "Okapi Laptop", "category": "Laptops", "price": 10})
+    assert index.remove("P003") is True
+
+    release.set()
+    index.merge()
+
+    assert index.merges >= 1
+    assert not index.stats()["merging"]
+    assert ids(index.search("zebra")) == ["A1"]
+    assert ids(index.search("quagga")) == ["A2"]
+    assert ids(index.search("okapi")) == ["P000"]
+    assert index.get("P003") is None
+    assert len(index) == 61
+
+
+def test_merge_with_catalog_store(tmp_path):
+    path = str(tmp_path / "catalog.pcat")
+    write_catalog(path, make_products())
+    index = ProductSearchIndex(CatalogStore(path))
+
+    index.upsert({"id": "A1", "name": "Zebra Speaker", "category": "Audio", "price": 10})
+    index.remove("P000")
+    index.merge()
+
+    assert index.stats()["delta_segment"] == 0
+    assert ids(index.search("zebra")) == ["A1"]
+    assert index.get("P000") is None
+    assert index.get("P001")["name"] == "Silver Speaker 1"
+    # The merged catalog file is unlinked once mapped
+    assert [p.name for p in tmp_path.iterdir()] == ["catalog.pcat"]
@@ -0,0 +1,4 @@
+"""Customer Service Tools Package.
+
+This package contains shared tools used by the customer service agents.
+"""
@@ -0,0 +1,338 @@
+"""Product Catalog Store.
+
+A compact, memory-mapped file format for large product catalogs.
+
+Loading millions of products as Python dicts takes gigabytes and a slow
+startup. A catalog file instead keeps each field in a column:
+
+    ids         fixed-width UTF-8 product ids
+    prices      float64
+    categories  uint16 codes into the category table
+    blob_start  byte offset of each product's record in the blob
+    blob_size   byte length of each record
+    blob        JSON records with the remaining fields (name, description,
+                specs, ...)
+    slots       open-addressing hash table mapping an id to its row
+
+Opening a catalog only maps the file and reads a small JSON header, so it
+is near-instant, and the operating system pages in only the parts that
+are read. A full product dict is built from a row only when it is asked
+for (``catalog[row]`` or ``catalog.get(product_id)``).
+
+File layout: 8 magic bytes, the header length (uint64), the JSON header
+(column dtypes and offsets, category table), then the columns and the
+blob, each aligned to 64 bytes.
+
+Build a catalog from a JSON array or JSON Lines file of products::
+
+    python -m tools.catalog_store products.jsonl data/catalog.pcat
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"PCATv1\0\0"
+ALIGNMENT = 64
+
+# 64-bit FNV-1a, computed the same way in NumPy (build) and Python (lookup)
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+HASH_MASK = (1 << 64) - 1
+
+# Fields stored in their own column rather than in the blob
+COLUMN_FIELDS = ("id", "price", "category")
+
+
+def _hash_id(key: bytes) -> int:
+    """Hash a padded product id (see ``_hash_ids``)."""
+    value = FNV_OFFSET
+    for byte in key:
+        value = ((value ^ byte) * FNV_PRIME) & HASH_MASK
+    return value
+
+
+def _hash_ids(ids: np.ndarray) -> np.ndarray:
+    """Hash a column of fixed-width ids, padding bytes included."""
+    width = ids.dtype.itemsize
+    matrix = ids.view(np.uint8).reshape(len(ids), width)
+    hashes = np.full(len(ids), FNV_OFFSET, dtype=np.uint64)
+    prime = np.uint64(FNV_PRIME)
+    for column in range(width):
+        hashes ^= matrix[:, column]
+        hashes *= prime
+    return hashes
+
+
+def _build_slots(ids: np.ndarray) -> np.ndarray:
+    """
+    Build the linear-probing hash table for an id column.
+
+    Returns:
+        Slot array (a power of two, at most half full) holding row + 1, or
+        0 for an empty slot
+    """
+    size = 8
+    while size < 2 * len(ids):
+        size *= 2
+    mask = np.uint64(size - 1)
+    slots = np.zeros(size, dtype=np.uint32)
+
+    positions = (_hash_ids(ids) & mask).astype(np.int64)
+    pending = np.arange(len(ids), dtype=np.int64)
+    # Each round, the first pending row aimed at each free slot takes it
+    # and the others probe the next slot
+    while len(pending):
+        wanted = positions[pending]
+        free = slots[wanted] == 0
+        taken, first = np.unique(wanted[free], return_index=True)
+        winners = pending[free][first]
+        slots[taken] = winners + 1
+
+        placed = np.zeros(len(ids), dtype=bool)
+        placed[winners] = True
+        pending = pending[~placed[pending]]
+        positions[pending] = (positions[pending] + 1) & (size - 1)
+    return slots
+
+
+def _data_start(header_size: int) -> int:
+    """Get the file offset of the first column."""
+    return -(-(len(MAGIC) + 8 + header_size) // ALIGNMENT) * ALIGNMENT
+
+
+def _read_products(path: str) -> Iterator[Dict[str, Any]]:
+    """Read products from a JSON array or JSON Lines file."""
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_catalog(path: str, products: Iterable[Dict[str, Any]]) -> int:
+    """
+    Write products to a catalog file.
+
+    A later product with the same id replaces an earlier one. The file is
+    written next to ``path`` and moved into place when complete.
+
+    Args:
+        path: Catalog file to create or replace
+        products: Products with id, price and category, plus any other
+            JSON-serializable fields
+
+    Returns:
+        Number of products written
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    row_of: Dict[str, int] = {}
+    ids: List[bytes] = []
+    prices = array("d")
+    codes = array("H")
+    blob_start = array("Q")
+    blob_size = array("I")
+    categories: Dict[str, int] = {}
+
+    # Records are streamed to a scratch file so only the columns are kept
+    # in memory; a replaced product's old record is left unreferenced
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        offset = 0
+        for product in products:
+            key = str(product["id"]).encode("utf-8")
+            category = product.get("category") or ""
+            code = categories.setdefault(category, len(categories))
+            if code > 0xFFFF:
+                raise ValueError("A catalog holds at most 65536 categories")
+            price = product.get("price")
+            record = json.dumps(
+                {k: v for k, v in product.items() if k not in COLUMN_FIELDS},
+                ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+            blob.write(record)
+
+            row = row_of.get(product["id"])
+            if row is None:
+                row = row_of[product["id"]] = len(ids)
+                ids.append(key)
+                prices.append(0.0)
+                codes.append(0)
+                blob_start.append(0)
+                blob_size.append(0)
+            prices[row] = float("nan") if price is None else float(price)
+            codes[row] = code
+            blob_start[row] = offset
+            blob_size[row] = len(record)
+            offset += len(record)
+
+        width = max((len(key) for key in ids), default=1)
+        id_column = np.array(ids, dtype=f"S{width}")
+        columns = {
+            "ids": id_column,
+            "prices": np.frombuffer(prices, dtype=np.float64),
+            "categories": np.frombuffer(codes, dtype=np.uint16),
+            "blob_start": np.frombuffer(blob_start, dtype=np.uint64),
+            "blob_size": np.frombuffer(blob_size, dtype=np.uint32),
+            "slots": _build_slots(id_column),
+        }
+
+        # Lay out the columns, then the blob; offsets are relative to the
+        # end of the header
+        sections: Dict[str, Dict[str, Any]] = {}
+        position = 0
+        for name, column in columns.items():
+            sections[name] = {
+                "offset": position, "dtype": column.dtype.str, "count": len(column),
+            }
+            position += -(-column.nbytes // ALIGNMENT) * ALIGNMENT
+        sections["blob"] = {"offset": position, "dtype": "|u1", "count": offset}
+
+        header = json.dumps({
+            "rows": len(ids),
+            "categories": sorted(categories, key=categories.get),
+            "sections": sections,
+        }).encode("utf-8")
+        base = _data_start(len(header))
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, column in columns.items():
+                f.seek(base + sections[name]["offset"])
+                f.write(column.tobytes())
+            f.seek(base + sections["blob"]["offset"])
+            blob.seek(0)
+            while True:
+                chunk = blob.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(temp_path, path)
+
+    return len(ids)
+
+
+class CatalogStore:
+    """
+    Read-only, memory-mapped product catalog.
+
+    Behaves as a sequence of product dicts, built on access.
+
+    Args:
+        path: Catalog file written by ``write_catalog``
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a product catalog: {path}")
+        (header_size,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._map[start:start + header_size])
+        base = _data_start(header_size)
+
+        self.categories: List[str] = header["categories"]
+        self._rows = header["rows"]
+        sections = header["sections"]
+
+        def column(name: str) -> np.ndarray:
+            section = sections[name]
+            return np.frombuffer(
+                self._map, dtype=np.dtype(section["dtype"]),
+                count=section["count"], offset=base + section["offset"]
+            )
+
+        self.ids = column("ids")
+        self.prices = column("prices")
+        self.category_codes = column("categories")
+        self._blob_start = column("blob_start")
+        self._blob_size = column("blob_size")
+        self._slots = column("slots")
+        self._blob_offset = base + sections["blob"]["offset"]
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if not 0 <= row < self._rows:
+            raise IndexError(f"Catalog row out of range: {row}")
+        start = self._blob_offset + int(self._blob_start[row])
+        record = json.loads(self._map[start:start + int(self._blob_size[row])])
+        price = float(self.prices[row])
+        return {
+            "id": self.ids[row].decode("utf-8"),
+            "name": record.pop("name", ""),
+            "category": self.categories[self.category_codes[row]],
+            "price": None if price != price else price,
+            **record,
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self._rows):
+            yield self[row]
+
+    def row_of(self, product_id: str) -> Optional[int]:
+        """
+        Find a product's row through the id hash table.
+
+        Returns:
+            The row, or None if the id is not in the catalog
+        """
+        key = product_id.encode("utf-8")
+        width = self.ids.dtype.itemsize
+        if len(key) > width:
+            return None
+
+        mask = len(self._slots) - 1
+        slot = _hash_id(key.ljust(width, b"\0")) & mask
+        while True:
+            row = int(self._slots[slot])
+            if row == 0:
+                return None
+            # NumPy strips the padding from fixed-width values
+            if self.ids[row - 1] == key:
+                return row - 1
+            slot = (slot + 1) & mask
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Get a product by id, or None."""
+        row = self.row_of(product_id)
+        return None if row is None else self[row]
+
+    def category(self, row: int) -> str:
+        """Get a row's category without reading its record."""
+        return self.categories[self.category_codes[row]]
+
+    def close(self) -> None:
+        """Unmap the file; columns must no longer be used."""
+        self.ids = self.prices = self.category_codes = None
+        self._blob_start = self._blob_size = self._slots = None
+        self._map.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m tools.catalog_store PRODUCTS.json[l] CATALOG")
+        sys.exit(2)
+    count = write_catalog(sys.argv[2], _read_products(sys.argv[1]))
+    print(f"Wrote {count} products to {sys.argv[2]}")
@@ -0,0 +1,1355 @@
+"""Product Search Index.
+
+Ranked full-text search over the product catalog, built once at load time.
+
+Each product's name, category, description and spec values are tokenized
+into an inverted index that maps every term to the documents containing it
+(in document order) and a precomputed BM25 term weight. Fields are weighted,
+so a match in the name counts more than one in the description. A query is
+scored with BM25:
+
+    score(doc) = sum over query terms of idf(term) * weight(term, doc)
+
+Postings are NumPy arrays. A multi-term query intersects them with
+``searchsorted``, starting from the rarest term. A single-term query reads
+the term's postings in best-first order and stops once it has enough
+results. Query terms missing from the vocabulary are matched as prefixes
+("lapt" matches "laptop"), and plurals are folded ("laptops" -> "laptop").
+Results must match every query term; if no product does, products matching
+any term are ranked instead.
+
+Every category has a bitmap (one flag per document), so the category filter
+is a single lookup per candidate.
+
+``search_page`` adds price ranges, cursor pagination and facet counts. A
+price range is found by bisecting the documents sorted by price. Only the
+page is ranked, best-first where the query allows it; the total and the
+counts by category and price bucket come from the matching documents
+without scoring them. When the rarest term matches more than
+FACET_SAMPLE_SIZE documents, they are estimated from an evenly spaced
+sample of its documents (the page says so). On a million products a page
+of a broad query takes a few milliseconds; prefix queries, partial
+matches, and queries whose terms rarely occur together cannot be ranked
+best-first and score every match (tens of milliseconds).
+
+The catalog can be a list of product dicts or a memory-mapped
+``CatalogStore``; with a store, products are built from their rows only
+when a search returns them.
+
+Changes are incremental. An added or updated product goes into a small
+in-memory delta segment, and its old version is cleared in the live bitmap;
+queries search both segments. Once the delta grows past ``merge_ratio`` of
+the main segment, a background thread re-indexes the live products into a
+new main segment; with a store, it first writes them to a new catalog file
+(in the store's directory, unlinked once mapped). The index switches to the
+merged segment on its next use, replaying the changes made meanwhile, so
+neither the merge nor the rebuild runs on the caller's thread.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .catalog_store import CatalogStore, write_catalog
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Weight of a term occurrence in each field
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0, "specs": 1.0}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Vocabulary terms a prefix may expand to (the most frequent are kept)
+MAX_PREFIX_TERMS = 32
+MIN_PREFIX_LENGTH = 2
+
+# Postings read per term before the threshold algorithm first checks for
+# a result (grows 4x per round)
+THRESHOLD_MIN_DEPTH = 256
+
+# AND queries whose rarest term is in at least 1/DENSE_RATIO of the catalog
+# are intersected with per-document flags rather than binary search
+DENSE_RATIO = 16
+
+# The delta segment is merged once it holds this many documents, or
+# MERGE_RATIO of the main segment if that is more
+MIN_MERGE_DOCS = 1000
+MERGE_RATIO = 0.05
+
+# Queries whose rarest term matches more documents than this count their
+# total and facets on an evenly spaced sample of about this many
+FACET_SAMPLE_SIZE = 20_000
+
+# Upper bounds of the price facet's buckets; the last bucket is open-ended
+PRICE_BUCKETS = (25, 50, 100, 250, 500, 1000, 2500)
+
+SearchResult = Tuple[Dict[str, Any], float]
+
+
+class InvalidCursor(ValueError):
+    """Raised for a pagination cursor from another search or an older catalog."""
+
+
+@dataclass
+class SearchPage:
+    """
+    One page of a faceted search.
+
+    Attributes:
+        results: (product, score) pairs, best first
+        total: Number of products matching the query and filters
+        next_cursor: Cursor for the next page, or None on the last page
+        facets: Match counts by category and by price bucket
+        approximate: True if the total and facets were estimated from a
+            sample of the matches
+    """
+
+    results: List[SearchResult]
+    total: int
+    next_cursor: Optional[str]
+    facets: Dict[str, Any]
+    approximate: bool = False
+
+
+class _ProductList:
+    """
+    In-memory catalog with the lookup interface of ``CatalogStore``.
+
+    A later product with the same id replaces an earlier one.
+    """
+
+    def __init__(self, products: Iterable[Dict[str, Any]]):
+        by_id = {product["id"]: product for product in products}
+        self._products = list(by_id.values())
+        self._rows = {product_id: row for row, product_id in enumerate(by_id)}
+
+        codes: Dict[str, int] = {}
+        self.category_codes = np.array(
+            [codes.setdefault(p.get("category") or "", len(codes)) for p in self._products],
+            dtype=np.int32
+        )
+        self.categories = list(codes)
+        self.prices = np.array(
+            [_price(product) for product in self._products], dtype=np.float64
+        )
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self._products[row]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._products)
+
+    def row_of(self, product_id: str) -> Optional[int]:
+        return self._rows.get(product_id)
+
+
+def _price(product: Dict[str, Any]) -> float:
+    """Get a product's price, NaN if it has none."""
+    price = product.get("price")
+    return float("nan") if price is None else float(price)
+
+
+def _price_bucket(prices: np.ndarray) -> np.ndarray:
+    """Get the price facet bucket of each price (one past the last if NaN)."""
+    buckets = np.searchsorted(PRICE_BUCKETS, prices, side="right").astype(np.int8)
+    buckets[np.isnan(prices)] = len(PRICE_BUCKETS) + 1
+    return buckets
+
+
+def _ranked_after(docs: np.ndarray, scores: np.ndarray, after: Tuple[float, int]) -> np.ndarray:
+    """Flag the documents ranked after a (score, document) page position."""
+    score, doc = after
+    return (scores < score) | ((scores == score) & (docs > doc))
+
+
+def _fold(token: str) -> str:
+    """Fold simple plurals so "laptops" and "laptop" index the same."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-case, plural-folded terms."""
+    return [_fold(token) for token in TOKEN_PATTERN.findall(text.lower())]
+
+
+def category_key(category: str) -> str:
+    """Normalize a category name for filtering ("Laptops" -> "laptop")."""
+    return " ".join(tokenize(category))
+
+
+def _weighted_terms(product: Dict[str, Any]) -> Tuple[Dict[str, float], float]:
+    """
+    Get a product's field-weighted term frequencies.
+
+    Returns:
+        Tuple of (term -> weighted frequency, weighted document length)
+    """
+    specs = product.get("specs") or {}
+    fields = {
+        "name": product.get("name", ""),
+        "category": product.get("category", ""),
+        "description": product.get("description", ""),
+        "specs": " ".join(str(value) for value in specs.values()),
+    }
+
+    frequencies: Dict[str, float] = {}
+    length = 0.0
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            frequencies[token] = frequencies.get(token, 0.0) + weight
+            length += weight
+    return frequencies, length
+
+
+def _bm25_weight(frequency, length, average_length: float):
+    """BM25 term-frequency weight (works on scalars and arrays)."""
+    norm = K1 * (1.0 - B + B * length / average_length)
+    return frequency * (K1 + 1.0) / (frequency + norm)
+
+
+class _Segment:
+    """
+    Immutable inverted index over a contiguous range of documents.
+
+    Args:
+        terms: Sorted vocabulary
+        offsets: Postings of term i are [offsets[i], offsets[i + 1])
+        docs: Document numbers of each posting, ascending within a term
+        weights: BM25 term weight of each posting
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        weights: np.ndarray
+    ):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.df = np.diff(offsets)
+        self._best_first: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def build(cls, products: List[Dict[str, Any]]) -> Tuple["_Segment", float]:
+        """
+        Index products as documents 0..len(products) - 1.
+
+        Returns:
+            Tuple of (segment, average weighted document length)
+        """
+        term_ids: Dict[str, int] = {}
+        posting_terms = array("i")
+        posting_docs = array("i")
+        frequencies = array("f")
+        lengths = np.empty(len(products), dtype=np.float32)
+
+        for doc, product in enumerate(products):
+            terms, lengths[doc] = _weighted_terms(product)
+            for term, frequency in terms.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(doc)
+                frequencies.append(frequency)
+
+        average_length = float(lengths.mean()) if len(products) and lengths.mean() > 0 else 1.0
+
+        # Renumber terms alphabetically so prefixes are contiguous ranges
+        terms = sorted(term_ids)
+        renumber = np.empty(len(terms), dtype=np.int32)
+        renumber[[term_ids[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+
+        term_column = renumber[np.frombuffer(posting_terms, dtype=np.int32)]
+        doc_column = np.frombuffer(posting_docs, dtype=np.int32)
+        frequency_column = np.frombuffer(frequencies, dtype=np.float32)
+
+        # Postings were appended in document order, so a stable sort by
+        # term keeps each term's documents ascending
+        order = np.argsort(term_column, kind="stable")
+        docs = doc_column[order]
+        weights = _bm25_weight(
+            frequency_column[order], lengths[docs], average_length
+        ).astype(np.float32)
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(terms)), out=offsets[1:])
+        return cls(terms, offsets, docs, weights), average_length
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.docs[start:end], self.weights[start:end]
+
+    def best_first(self, term_id: int) -> np.ndarray:
+        """Positions in a term's postings by descending weight (cached)."""
+        order = self._best_first.get(term_id)
+        if order is None:
+            _, weights = self.postings(term_id)
+            order = np.argsort(-weights, kind="stable")
+            self._best_first[term_id] = order
+        return order
+
+    def prefix_terms(self, prefix: str) -> List[int]:
+        """Get the ids of the most frequent terms starting with a prefix."""
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + "\uffff", start)
+        if end - start <= MAX_PREFIX_TERMS:
+            return list(range(start, end))
+        frequent = np.argsort(-self.df[start:end], kind="stable")[:MAX_PREFIX_TERMS]
+        return [start + int(i) for i in frequent]
+
+
+class ProductSearchIndex:
+    """
+    Inverted index with BM25 ranking, category bitmaps and prefix matching.
+
+    Args:
+        products: Products to index, with id, name, category, description
+            and optional specs
+        merge_ratio: Delta size, relative to the main segment, that
+            triggers a merge
+    """
+
+    def __init__(
+        self,
+        products: Iterable[Dict[str, Any]] = (),
+        merge_ratio: float = MERGE_RATIO
+    ):
+        self.merge_ratio = merge_ratio
+        self.merges = 0
+        # Background merge in progress, and the upserts (products) and
+        # removals (ids) made since it took its snapshot
+        self._merging: Optional[Future] = None
+        self._changes: List[Any] = []
+        # Bumped by every change to the index; pagination cursors from an
+        # older version would skip or repeat products
+        self._version = 0
+        self.build(products)
+
+    # -------------------------------------------------------------------------
+    # Building
+    # -------------------------------------------------------------------------
+
+    def build(self, products: Iterable[Dict[str, Any]]) -> None:
+        """
+        Index a whole catalog, replacing the current index.
+
+        Args:
+            products: Product dicts, or a ``CatalogStore``; a store's rows
+                are read while indexing but not kept in memory
+        """
+        started = time.perf_counter()
+        self._version += 1
+        # A merge of the previous catalog is discarded
+        self._merging, self._changes = None, []
+
+        if isinstance(products, CatalogStore):
+            self._catalog = products
+        else:
+            self._catalog = _ProductList(products)
+
+        self._main, self._average_length = _Segment.build(self._catalog)
+        self._main_size = len(self._catalog)
+        self._delta: Dict[str, Dict[int, float]] = {}
+        self._delta_terms: List[str] = []
+        # Products added since the build, and the current document of every
+        # id changed since the build (None once removed)
+        self._added: List[Optional[Dict[str, Any]]] = []
+        self._moved: Dict[str, Optional[int]] = {}
+
+        self._size = self._main_size
+        self._live = np.ones(self._size, dtype=bool)
+        self._live_count = self._size
+
+        # Categories by normalized name: a bitmap for filtering, and each
+        # document's category id for facet counts
+        self._categories: Dict[str, np.ndarray] = {}
+        self._category_ids: Dict[str, int] = {}
+        self._category_names: List[str] = []
+        ids = np.array(
+            [self._category_id(name) for name in self._catalog.categories], dtype=np.int32
+        )
+        self._doc_categories = ids[np.asarray(self._catalog.category_codes, dtype=np.int64)]
+        for key, category_id in self._category_ids.items():
+            self._categories[key] = self._doc_categories == category_id
+
+        # Prices, and the main segment's documents sorted by price
+        self._prices = np.array(self._catalog.prices, dtype=np.float64)
+        self._price_buckets = _price_bucket(self._prices)
+        self._price_order = np.argsort(self._prices, kind="stable").astype(np.int32)
+        self._sorted_prices = self._prices[self._price_order]
+
+        self.build_ms = (time.perf_counter() - started) * 1000
+
+    def _category_id(self, category: str) -> int:
+        """Get a category's id, adding the category if it is new."""
+        key = category_key(category)
+        category_id = self._category_ids.get(key)
+        if category_id is None:
+            category_id = self._category_ids[key] = len(self._category_names)
+            self._category_names.append(category)
+            self._categories[key] = np.zeros(len(self._live), dtype=bool)
+        return category_id
+
+    def _ensure_capacity(self, size: int) -> None:
+        """Grow the per-document arrays to hold ``size`` documents."""
+        capacity = len(self._live)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 64)
+        self._live = np.resize(self._live, capacity)
+        self._live[self._size:] = False
+        self._doc_categories = np.resize(self._doc_categories, capacity)
+        self._prices = np.resize(self._prices, capacity)
+        self._price_buckets = np.resize(self._price_buckets, capacity)
+        for key, bitmap in self._categories.items():
+            grown = np.zeros(capacity, dtype=bool)
+            grown[:len(bitmap)] = bitmap
+            self._categories[key] = grown
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        """Add a product, or replace the product with the same id."""
+        self._adopt_merge()
+        if self._merging is not None:
+            self._changes.append(product)
+        self._delete(product["id"])
+        self._version += 1
+
+        doc = self._size
+        self._ensure_capacity(doc + 1)
+        self._size += 1
+        self._added.append(product)
+        self._moved[product["id"]] = doc
+        self._live[doc] = True
+        self._live_count += 1
+        category = product.get("category") or ""
+        self._doc_categories[doc] = self._category_id(category)
+        self._categories[category_key(category)][doc] = True
+        self._prices[doc] = _price(product)
+        self._price_buckets[doc] = _price_bucket(self._prices[doc:doc + 1])[0]
+
+        frequencies, length = _weighted_terms(product)
+        for term, frequency in frequencies.items():
+            postings = self._delta.get(term)
+            if postings is None:
+                postings = self._delta[term] = {}
+                self._delta_terms.insert(bisect_left(self._delta_terms, term), term)
+            postings[doc] = float(_bm25_weight(frequency, length, self._average_length))
+
+        if self._merging is None and self.delta_size >= max(
+            MIN_MERGE_DOCS, self.merge_ratio * self._main_size
+        ):
+            self._start_merge()
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product.
+
+        Returns:
+            True if the product was indexed
+        """
+        self._adopt_merge()
+        if self._merging is not None:
+            self._changes.append(product_id)
+        return self._delete(product_id)
+
+    def _delete(self, product_id: str) -> bool:
+        doc = self._doc_of(product_id)
+        if doc is None:
+            return False
+        self._version += 1
+        self._live[doc] = False
+        self._moved[product_id] = None
+        if doc >= self._main_size:
+            self._added[doc - self._main_size] = None
+        self._live_count -= 1
+        return True
+
+    def merge(self) -> None:
+        """
+        Re-index the live products into a single main segment, waiting for
+        the merge (``upsert`` merges in the background instead).
+        """
+        if self._merging is not None:
+            self._merging.exception()
+            self._adopt_merge()
+        self._start_merge()
+        future = self._merging
+        future.exception()
+        self._adopt_merge()
+        future.result()
+
+    def _start_merge(self) -> None:
+        """Merge a snapshot of the live products in a background thread."""
+        catalog, main_size = self._catalog, self._main_size
+        added = list(self._added)
+        live = np.flatnonzero(self._live[:self._size])
+        future = self._merging = Future()
+        self._changes = []
+
+        def products() -> Iterator[Dict[str, Any]]:
+            for doc in live:
+                yield catalog[doc] if doc < main_size else added[doc - main_size]
+
+        def merge() -> None:
+            try:
+                future.set_result(self._merged(catalog, products()))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=merge, name="product-index-merge", daemon=True).start()
+
+    def _merged(
+        self,
+        catalog: Any,
+        products: Iterator[Dict[str, Any]]
+    ) -> "ProductSearchIndex":
+        """Index the merged products (runs in the merge thread)."""
+        if not isinstance(catalog, CatalogStore):
+            return ProductSearchIndex(products, self.merge_ratio)
+
+        # Products are streamed into the new file; the file is unlinked
+        # once mapped, so it goes away with the index
+        handle, path = tempfile.mkstemp(
+            prefix=os.path.basename(catalog.path) + ".", suffix=".merged",
+            dir=os.path.dirname(catalog.path) or "."
+        )
+        os.close(handle)
+        try:
+            write_catalog(path, products)
+            store = CatalogStore(path)
+        finally:
+            os.unlink(path)
+        return ProductSearchIndex(store, self.merge_ratio)
+
+    def _adopt_merge(self) -> None:
+        """Switch to the merged segment once the background merge is done."""
+        merging = self._merging
+        if merging is None or not merging.done():
+            return
+        changes = self._changes
+        self._merging, self._changes = None, []
+        if merging.exception() is not None:
+            # The delta keeps serving; the next upsert retries
+            logger.error("Product index merge failed", exc_info=merging.exception())
+            return
+
+        merged = merging.result()
+        for change in changes:
+            if isinstance(change, dict):
+                merged.upsert(change)
+            else:
+                merged.remove(change)
+
+        # Document numbers change, so cursors from before are invalid
+        version, merges = self._version, self.merges
+        vars(self).update(vars(merged))
+        self._version = version + 1
+        self.merges = merges + 1
+
+    @property
+    def delta_size(self) -> int:
+        return self._size - self._main_size
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def _doc_of(self, product_id: str) -> Optional[int]:
+        if product_id in self._moved:
+            return self._moved[product_id]
+        return self._catalog.row_of(product_id)
+
+    def _product(self, doc: int) -> Dict[str, Any]:
+        """Get a document's product, built on demand for a catalog store."""
+        if doc < self._main_size:
+            return self._catalog[doc]
+        return self._added[doc - self._main_size]
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Get a product by id."""
+        self._adopt_merge()
+        doc = self._doc_of(product_id)
+        return None if doc is None else self._product(doc)
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    def categories(self) -> List[str]:
+        """Get the normalized names of categories with live products."""
+        return sorted(
+            key for key, bitmap in self._categories.items()
+            if np.any(bitmap[:self._size] & self._live[:self._size])
+        )
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+
+    def _idf(self, df: int) -> float:
+        n = max(self._live_count, 1)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_df(self, term: str) -> int:
+        term_id = self._main.term_ids.get(term)
+        main_df = int(self._main.df[term_id]) if term_id is not None else 0
+        return main_df + len(self._delta.get(term, ()))
+
+    def _expand(self, token: str) -> List[str]:
+        """Get the vocabulary terms a query token matches."""
+        if token in self._main.term_ids or token in self._delta:
+            return [token]
+        if len(token) < MIN_PREFIX_LENGTH:
+            return []
+
+        terms = [self._main.terms[i] for i in self._main.prefix_terms(token)]
+        start = bisect_left(self._delta_terms, token)
+        for term in self._delta_terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            if term not in self._main.term_ids:
+                terms.append(term)
+        return terms
+
+    def _main_group(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Get the main segment's documents matching any of the terms.
+
+        Returns:
+            Tuple of (ascending documents, weight of each, idf); a document's
+            score is weight * idf
+        """
+        parts = []
+        for term in terms:
+            term_id = self._main.term_ids.get(term)
+            if term_id is not None:
+                docs, weights = self._main.postings(term_id)
+                parts.append((docs, weights, self._idf(self._term_df(term))))
+
+        if not parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), 1.0
+        if len(parts) == 1:
+            return parts[0]
+
+        # A prefix can match several terms of one document: keep the best
+        docs = np.concatenate([docs for docs, _, _ in parts])
+        scores = np.concatenate([weights * np.float32(idf) for _, weights, idf in parts])
+        order = np.lexsort((-scores, docs))
+        docs, scores = docs[order], scores[order]
+        first = np.ones(len(docs), dtype=bool)
+        first[1:] = docs[1:] != docs[:-1]
+        return docs[first], scores[first], 1.0
+
+    def _delta_group(self, terms: List[str]) -> Dict[int, float]:
+        """Score the delta segment's documents matching any of the terms."""
+        scores: Dict[int, float] = {}
+        for term in terms:
+            postings = self._delta.get(term)
+            if not postings:
+                continue
+            idf = self._idf(self._term_df(term))
+            for doc, weight in postings.items():
+                score = weight * idf
+                if score > scores.get(doc, 0.0):
+                    scores[doc] = score
+        return scores
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: int = 10
+    ) -> List[SearchResult]:
+        """
+        Find the products best matching a query.
+
+        Args:
+            query: Search terms (an empty query lists the category)
+            category: Only return products in this category
+            limit: Maximum results
+
+        Returns:
+            (product, score) pairs, best first
+        """
+        if limit <= 0:
+            return []
+        self._adopt_merge()
+
+        allowed = self._live[:self._size]
+        if category:
+            bitmap = self._categories.get(category_key(category))
+            if bitmap is None:
+                return []
+            allowed = allowed & bitmap[:self._size]
+
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            docs = np.flatnonzero(allowed)[:limit]
+            return [(self._product(doc), 0.0) for doc in docs]
+
+        groups = [self._expand(token) for token in tokens]
+        if len(groups) == 1 and len(groups[0]) == 1:
+            candidates = self._search_term(groups[0][0], allowed, limit)
+        else:
+            candidates = self._search_all(groups, allowed, limit)
+            if not candidates:
+                candidates = self._search_any(groups, allowed, limit)
+
+        candidates.sort(key=lambda item: (-item[1], item[0]))
+        return [(self._product(doc), score) for doc, score in candidates[:limit]]
+
+    def _search_term(
+        self,
+        term: str,
+        allowed: np.ndarray,
+        limit: int
+    ) -> List[Tuple[int, float]]:
+        """Top documents for one term, reading its postings best-first."""
+        results: List[Tuple[int, float]] = []
+        idf = self._idf(self._term_df(term))
+
+        term_id = self._main.term_ids.get(term)
+        if term_id is not None:
+            docs, weights = self._main.postings(term_id)
+            order = self._main.best_first(term_id)
+            start, step = 0, max(limit * 4, 64)
+            while start < len(order) and len(results) < limit:
+                positions = order[start:start + step]
+                keep = positions[allowed[docs[positions]]]
+                results.extend(
+                    (int(doc), float(weight) * idf)
+                    for doc, weight in zip(docs[keep], weights[keep])
+                )
+                start += step
+                step *= 4
+
+        for doc, weight in self._delta.get(term, {}).items():
+            if allowed[doc]:
+                results.append((doc, weight * idf))
+        return results
+
+    def _search_all(
+        self,
+        groups: List[List[str]],
+        allowed: np.ndarray,
+        limit: int
+    ) -> List[Tuple[int, float]]:
+        """Top documents matching every group, rarest group first."""
+        if any(not terms for terms in groups):
+            return []
+
+        results = None
+        term_ids = [
+            self._main.term_ids.get(terms[0]) if len(terms) == 1 else None
+            for terms in groups
+        ]
+        if all(term_id is not None for term_id in term_ids):
+            results = self._threshold_top(term_ids, allowed, limit)
+
+        if results is None:
+            results = self._top(*self._match_all(groups, allowed), allowed, limit)
+
+        results.extend(
+            (doc, score) for doc, score in self._delta_all(groups).items() if allowed[doc]
+        )
+        return results
+
+    def _search_any(
+        self,
+        groups: List[List[str]],
+        allowed: np.ndarray,
+        limit: int
+    ) -> List[Tuple[int, float]]:
+        """Top documents matching at least one group."""
+        results = self._top(*self._match_any(groups), allowed, limit)
+        results.extend(
+            (doc, score) for doc, score in self._delta_any(groups).items() if allowed[doc]
+        )
+        return results
+
+    def _match_all(
+        self,
+        groups: List[List[str]],
+        allowed: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score the main segment's documents matching every group.
+
+        Returns:
+            Tuple of (documents, scores); documents that are not allowed
+            may be included
+        """
+        main = sorted((self._main_group(terms) for terms in groups), key=lambda g: len(g[0]))
+        candidates, weights, idf = main[0]
+        scores = weights * idf
+        if len(candidates) * DENSE_RATIO >= len(allowed):
+            # Common terms: flag and score every document instead of
+            # searching one long list for each entry of another
+            matched = allowed.copy()
+            dense = np.zeros(len(allowed), dtype=np.float32)
+            for docs, weights, idf in main:
+                hits = np.zeros(len(allowed), dtype=bool)
+                hits[docs] = True
+                matched &= hits
+                dense[docs] += weights * idf
+            candidates = np.flatnonzero(matched)
+            return candidates, dense[candidates]
+
+        for docs, weights, idf in main[1:]:
+            if not len(candidates) or not len(docs):
+                return candidates[:0], scores[:0]
+            positions = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+            found = docs[positions] == candidates
+            candidates = candidates[found]
+            scores = scores[found] + weights[positions[found]] * idf
+        return candidates, scores
+
+    def _match_any(self, groups: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Score the main segment's documents matching at least one group."""
+        main = [self._main_group(terms) for terms in groups if terms]
+        if not main:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        docs, inverse = np.unique(np.concatenate([g[0] for g in main]), return_inverse=True)
+        scores = np.bincount(
+            inverse, weights=np.concatenate([weights * idf for _, weights, idf in main])
+        )
+        return docs, scores
+
+    def _delta_all(self, groups: List[List[str]]) -> Dict[int, float]:
+        """Score the delta segment's documents matching every group."""
+        delta = [self._delta_group(terms) for terms in groups]
+        return {
+            doc: sum(group[doc] for group in delta)
+            for doc in set(delta[0]).intersection(*delta[1:])
+        }
+
+    def _delta_any(self, groups: List[List[str]]) -> Dict[int, float]:
+        """Score the delta segment's documents matching at least one group."""
+        totals: Dict[int, float] = {}
+        for terms in groups:
+            for doc, score in self._delta_group(terms).items():
+                totals[doc] = totals.get(doc, 0.0) + score
+        return totals
+
+    def _threshold_top(
+        self,
+        term_ids: List[int],
+        allowed: np.ndarray,
+        limit: int
+    ) -> Optional[List[Tuple[int, float]]]:
+        """
+        Top main-segment documents containing every term, without a full
+        intersection (see ``_threshold_candidates``).
+
+        Returns:
+            The top documents, or None if the terms are too rare for this
+            to beat a plain intersection
+        """
+        found = self._threshold_candidates(term_ids, allowed, limit)
+        return None if found is None else self._top(*found, allowed, limit)
+
+    def _threshold_candidates(
+        self,
+        term_ids: List[int],
+        allowed: np.ndarray,
+        limit: int,
+        after: Optional[Tuple[float, int]] = None,
+        ordered: bool = False
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Candidates for the top main-segment documents containing every
+        term (Fagin's threshold algorithm).
+
+        Reads the top ``depth`` postings of each term best-first and scores
+        those documents exactly. A document not among them scores at most
+        the sum of the weights at ``depth``, so once the current top results
+        all beat that bound they are final. Otherwise the depth grows.
+
+        Args:
+            term_ids: Main-segment term of each query group
+            allowed: Flags of the documents that may be returned
+            limit: Number of top documents wanted
+            after: Only return documents ranked after this (score, document)
+            ordered: Require the top results to strictly beat the bound, so
+                that ties are also broken by document exactly (as pages are)
+
+        Returns:
+            Tuple of (documents, scores) that includes the top ``limit``
+            (all of them if there are fewer), or None if the terms are too
+            rare for this to beat a plain intersection
+        """
+        lists = []
+        for term_id in term_ids:
+            docs, weights = self._main.postings(term_id)
+            idf = self._idf(self._term_df(self._main.terms[term_id]))
+            lists.append((docs, weights, idf, self._main.best_first(term_id)))
+        # Sum in the order _match_all does, so scores (and cursors) agree
+        lists.sort(key=lambda entry: len(entry[0]))
+        shortest = len(lists[0][0])
+
+        depth = max(limit * 16, THRESHOLD_MIN_DEPTH)
+        # Past a sixteenth of the shortest list, intersecting everything is
+        # cheaper than reading deeper
+        while depth * 16 <= shortest:
+            found_docs, found_scores = [], []
+            for seed_docs, _, _, seed_order in lists:
+                candidates = seed_docs[seed_order[:depth]]
+                # Sorted lookups walk the postings in order, which is faster
+                candidates = np.sort(candidates[allowed[candidates]])
+                scores = np.zeros(len(candidates), dtype=np.float32)
+                for docs, weights, idf, _ in lists:
+                    positions = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                    found = docs[positions] == candidates
+                    candidates, scores = candidates[found], scores[found]
+                    scores += weights[positions[found]] * idf
+                found_docs.append(candidates)
+                found_scores.append(scores)
+            # Only documents matching every term are left, so this is small
+            candidates, first = np.unique(np.concatenate(found_docs), return_index=True)
+            scores = np.concatenate(found_scores)[first]
+            if after is not None:
+                keep = _ranked_after(candidates, scores, after)
+                candidates, scores = candidates[keep], scores[keep]
+
+            bound = sum(weights[order[depth]] * idf for _, weights, idf, order in lists)
+            if len(candidates) >= limit:
+                kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+                if kth > bound or (kth == bound and not ordered):
+                    return candidates, scores
+            depth *= 4
+        return None
+
+    @staticmethod
+    def _top(
+        docs: np.ndarray,
+        scores: np.ndarray,
+        allowed: np.ndarray,
+        limit: int
+    ) -> List[Tuple[int, float]]:
+        """The ``limit`` best allowed documents, in no particular order."""
+        keep = allowed[docs]
+        docs, scores = docs[keep], scores[keep]
+        if len(docs) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            docs, scores = docs[best], scores[best]
+        return [(int(doc), float(score)) for doc, score in zip(docs, scores)]
+
+    # -------------------------------------------------------------------------
+    # Faceted pages
+    # -------------------------------------------------------------------------
+
+    def search_page(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = 10,
+        cursor: Optional[str] = None
+    ) -> SearchPage:
+        """
+        Get one page of products matching a query, with facet counts.
+
+        Results are ordered by score, then document, so a cursor resumes
+        exactly after the last result of the previous page. Only the page
+        is ranked; the total and the facet counts come from the matching
+        documents without scoring them, and are estimated from a sample
+        when the rarest query term has more than FACET_SAMPLE_SIZE matches.
+        Category counts ignore the category filter and price counts ignore
+        the price range, so they show how each filter would change the
+        results.
+
+        Args:
+            query: Search terms (an empty query lists everything)
+            category: Only return products in this category
+            min_price: Only return products costing at least this much
+            max_price: Only return products costing at most this much
+            limit: Maximum results on the page
+            cursor: ``next_cursor`` of the previous page
+
+        Returns:
+            The page
+
+        Raises:
+            InvalidCursor: If the cursor is from a different search, or a
+                product has been added, changed or removed since
+        """
+        limit = max(limit, 1)
+        self._adopt_merge()
+        fingerprint = hashlib.sha1(json.dumps([
+            tokenize(query), category_key(category) if category else None, min_price, max_price,
+        ]).encode()).hexdigest()[:12]
+        position = self._decode_cursor(cursor, fingerprint) if cursor else None
+
+        live = self._live[:self._size]
+        if category:
+            bitmap = self._categories.get(category_key(category))
+            in_category = bitmap[:self._size] if bitmap is not None else np.zeros_like(live)
+        else:
+            in_category = None
+        in_price = self._price_range(min_price, max_price)
+
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            after = None if position is None else position[1:]
+            return self._browse_page(fingerprint, live, in_category, in_price, limit, after)
+
+        allowed = live
+        if in_category is not None:
+            allowed = allowed & in_category
+        if in_price is not None:
+            allowed = allowed & in_price
+
+        # One extra result tells whether there is a next page
+        groups = [self._expand(token) for token in tokens]
+        if position is None:
+            every, after = True, None
+            page = self._top_page(groups, allowed, every, limit + 1, after)
+            if not page:
+                # Nothing selected matches every term: rank partial matches
+                every = False
+                page = self._top_page(groups, allowed, every, limit + 1, after)
+        else:
+            every, after = position[0], position[1:]
+            page = self._top_page(groups, allowed, every, limit + 1, after)
+
+        docs, scale = self._match_sample(groups, live, every)
+        facets = self._facets(
+            docs[in_price[docs]] if in_price is not None else docs,
+            docs[in_category[docs]] if in_category is not None else docs,
+            scale
+        )
+        selected = docs[allowed[docs]]
+        total = len(selected) if scale == 1.0 else int(round(
+            self._sample_weights(selected, scale).sum()
+        ))
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            doc, score = page[-1]
+            next_cursor = self._encode_cursor(fingerprint, every, score, doc)
+        return SearchPage(
+            results=[(self._product(doc), score) for doc, score in page],
+            total=max(total, len(page)),
+            next_cursor=next_cursor,
+            facets=facets,
+            approximate=scale != 1.0
+        )
+
+    def _browse_page(
+        self,
+        fingerprint: str,
+        live: np.ndarray,
+        in_category: Optional[np.ndarray],
+        in_price: Optional[np.ndarray],
+        limit: int,
+        after: Optional[Tuple[float, int]]
+    ) -> SearchPage:
+        """Page through the filtered catalog in document order (empty query)."""
+        category_docs = live if in_price is None else live & in_price
+        price_docs = live if in_category is None else live & in_category
+        facets = self._facets(category_docs, price_docs)
+
+        docs = np.flatnonzero(category_docs if in_category is None else category_docs & in_category)
+        start = 0 if after is None else int(np.searchsorted(docs, after[1], side="right"))
+        page = docs[start:start + limit]
+
+        next_cursor = None
+        if len(page) and start + len(page) < len(docs):
+            next_cursor = self._encode_cursor(fingerprint, True, 0.0, int(page[-1]))
+        return SearchPage(
+            results=[(self._product(int(doc)), 0.0) for doc in page],
+            total=len(docs),
+            next_cursor=next_cursor,
+            facets=facets
+        )
+
+    def _top_page(
+        self,
+        groups: List[List[str]],
+        allowed: np.ndarray,
+        every: bool,
+        limit: int,
+        after: Optional[Tuple[float, int]]
+    ) -> List[Tuple[int, float]]:
+        """
+        Get the best allowed matches ranked after a page position.
+
+        Queries of whole terms that must all match read the postings
+        best-first (see ``_threshold_candidates``); other queries, and
+        pages too deep for that, score every match.
+
+        Returns:
+            Up to ``limit`` (document, score) pairs, by score then document
+        """
+        main = None
+        if every:
+            term_ids = [
+                self._main.term_ids.get(terms[0]) if len(terms) == 1 else None
+                for terms in groups
+            ]
+            if all(term_id is not None for term_id in term_ids):
+                main = self._threshold_candidates(term_ids, allowed, limit, after, ordered=True)
+
+        docs, scores = self._matches(groups, allowed, every, main)
+        if after is not None:
+            keep = _ranked_after(docs, scores, after)
+            docs, scores = docs[keep], scores[keep]
+
+        if len(docs) > limit:
+            # Only the top scores (with ties) need a full sort
+            kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            top = scores >= kth
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))[:limit]
+        return [(int(docs[i]), float(scores[i])) for i in order]
+
+    def _matches(
+        self,
+        groups: List[List[str]],
+        allowed: np.ndarray,
+        every: bool,
+        main: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score all allowed documents matching every group (or any group).
+
+        Args:
+            main: The main segment's scored matches, if already found
+
+        Returns:
+            Tuple of (documents, scores)
+        """
+        if every:
+            if any(not terms for terms in groups):
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            docs, scores = main if main is not None else self._match_all(groups, allowed)
+            delta = self._delta_all(groups)
+        else:
+            docs, scores = main if main is not None else self._match_any(groups)
+            delta = self._delta_any(groups)
+
+        docs = np.concatenate([docs, np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))])
+        scores = np.concatenate([
+            np.asarray(scores, dtype=np.float64),
+            np.fromiter(delta.values(), dtype=np.float64, count=len(delta)),
+        ])
+        keep = allowed[docs]
+        return docs[keep], scores[keep]
+
+    def _match_sample(
+        self,
+        groups: List[List[str]],
+        live: np.ndarray,
+        every: bool
+    ) -> Tuple[np.ndarray, float]:
+        """
+        Find the live documents matching every group (or any group),
+        without scoring them.
+
+        To match every group, the main segment's candidates are the
+        rarest group's documents, looked up in the other groups' postings.
+        Past FACET_SAMPLE_SIZE candidates only an evenly spaced sample of
+        them is looked up, and each match found stands for ``scale``
+        matches. Delta documents are always all found.
+
+        Returns:
+            Tuple of (documents, scale)
+        """
+        scale = 1.0
+        if every:
+            if any(not terms for terms in groups):
+                return np.empty(0, dtype=np.int64), scale
+            postings = sorted(
+                (self._group_postings(terms) for terms in groups),
+                key=lambda lists: sum(len(docs) for docs in lists)
+            )
+            candidates = self._union(postings[0])
+            if len(candidates) > FACET_SAMPLE_SIZE:
+                sample = candidates[::-(-len(candidates) // FACET_SAMPLE_SIZE)]
+                scale = len(candidates) / len(sample)
+                candidates = sample
+            for lists in postings[1:]:
+                found = np.zeros(len(candidates), dtype=bool)
+                for docs in lists:
+                    positions = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                    found |= docs[positions] == candidates
+                candidates = candidates[found]
+            delta = self._delta_all(groups)
+        else:
+            candidates = self._union(
+                [docs for terms in groups for docs in self._group_postings(terms)]
+            )
+            delta = self._delta_any(groups)
+
+        docs = np.concatenate([
+            candidates.astype(np.int64), np.fromiter(delta, dtype=np.int64, count=len(delta)),
+        ])
+        return docs[live[docs]], scale
+
+    def _group_postings(self, terms: List[str]) -> List[np.ndarray]:
+        """Get the main segment's (non-empty) document lists of the terms."""
+        lists = []
+        for term in terms:
+            term_id = self._main.term_ids.get(term)
+            if term_id is not None and self._main.df[term_id]:
+                lists.append(self._main.postings(term_id)[0])
+        return lists
+
+    def _union(self, lists: List[np.ndarray]) -> np.ndarray:
+        """Get the ascending documents in any of the main-segment lists."""
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        flags = np.zeros(self._main_size, dtype=bool)
+        for docs in lists:
+            flags[docs] = True
+        return np.flatnonzero(flags)
+
+    def _sample_weights(self, docs: np.ndarray, scale: float) -> np.ndarray:
+        """Get the number of matches each found document stands for."""
+        return np.where(docs < self._main_size, scale, 1.0)
+
+    def _price_range(
+        self,
+        min_price: Optional[float],
+        max_price: Optional[float]
+    ) -> Optional[np.ndarray]:
+        """
+        Flag the documents priced within a range.
+
+        The main segment's documents are found by bisecting its sorted
+        prices; the few delta documents are compared directly.
+
+        Returns:
+            Flags per document, or None if the range is unbounded
+        """
+        if min_price is None and max_price is None:
+            return None
+        low = -math.inf if min_price is None else float(min_price)
+        high = math.inf if max_price is None else float(max_price)
+
+        in_range = np.zeros(self._size, dtype=bool)
+        # Products without a price sort last, after +inf, and never match
+        start = np.searchsorted(self._sorted_prices, low, side="left")
+        end = np.searchsorted(self._sorted_prices, high, side="right")
+        in_range[self._price_order[start:end]] = True
+
+        delta_prices = self._prices[self._main_size:self._size]
+        in_range[self._main_size:] = (delta_prices >= low) & (delta_prices <= high)
+        return in_range
+
+    def _facets(
+        self,
+        category_docs: np.ndarray,
+        price_docs: np.ndarray,
+        scale: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Count matches by category and by price bucket.
+
+        Args:
+            category_docs: Matches to count by category (documents, or
+                flags per document)
+            price_docs: Matches to count by price
+            scale: Matches each main-segment document stands for, when
+                the documents are a sample
+        """
+        counts = self._count_by(
+            self._doc_categories, category_docs, len(self._category_names), scale
+        )
+        categories = {
+            self._category_names[i]: int(counts[i])
+            for i in np.argsort(-counts, kind="stable") if counts[i]
+        }
+
+        # The extra bucket counts products without a price
+        buckets = self._count_by(
+            self._price_buckets, price_docs, len(PRICE_BUCKETS) + 2, scale
+        )[:len(PRICE_BUCKETS) + 1]
+        bounds = (0,) + PRICE_BUCKETS + (None,)
+        price_ranges = [
+            {"min": bounds[i], "max": bounds[i + 1], "count": int(count)}
+            for i, count in enumerate(buckets) if count
+        ]
+        return {"categories": categories, "price_ranges": price_ranges}
+
+    def _count_by(
+        self,
+        values: np.ndarray,
+        docs: np.ndarray,
+        size: int,
+        scale: float
+    ) -> np.ndarray:
+        """Count documents by a per-document value in 0..size - 1."""
+        values = values[:self._size][docs]
+        if scale == 1.0:
+            return np.bincount(values, minlength=size)
+        weights = self._sample_weights(docs, scale)
+        return np.rint(np.bincount(values, weights=weights, minlength=size)).astype(np.int64)
+
+    def _encode_cursor(self, fingerprint: str, every: bool, score: float, doc: int) -> str:
+        data = json.dumps([fingerprint, self._version, every, score, doc])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _decode_cursor(self, cursor: str, fingerprint: str) -> Tuple[bool, float, int]:
+        """
+        Get the (match every group, score, document) a page starts after.
+
+        Raises:
+            InvalidCursor: If the cursor does not belong to this search
+        """
+        try:
+            cursor_fingerprint, version, every, score, doc = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+        except (ValueError, TypeError):
+            raise InvalidCursor("Malformed cursor")
+        if cursor_fingerprint != fingerprint:
+            raise InvalidCursor("Cursor belongs to a different search")
+        if version != self._version:
+            raise InvalidCursor("Catalog has changed; repeat the search without a cursor")
+        return bool(every), float(score), int(doc)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size and segment counters."""
+        return {
+            "products": self._live_count,
+            "main_segment": self._main_size,
+            "delta_segment": self.delta_size,
+            "deleted": self._size - self._live_count,
+            "terms": len(self._main.terms) + sum(
+                1 for term in self._delta if term not in self._main.term_ids
+            ),
+            "categories": len(self._categories),
+            "merges": self.merges,
+            "merging": self._merging is not None,
+            "build_ms": round(self.build_ms, 1),
+        }
@@ -1,5 +1,13 @@
 """Research Assistant Agents Package."""
 
+import os
+import sys
+
+# capstone-projects/, home of the shared capstone_common package
+_CAPSTONES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if _CAPSTONES_DIR not in sys.path:
+    sys.path.append(_CAPSTONES_DIR)
+
 from .orchestrator import create_research_orchestrator
 from .search_agent import create_search_agent
 from .summarizer_agent import create_summarizer_agent
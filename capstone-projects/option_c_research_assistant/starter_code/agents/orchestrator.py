@@ -7,6 +7,7 @@ from google.adk.agents import Agent
 from .search_agent import create_search_agent
 from .summarizer_agent import create_summarizer_agent
 from .report_agent import create_report_agent
+from .models import get_model
 
 
 def create_research_orchestrator() -> Agent:
@@ -22,7 +23,7 @@ def create_research_orchestrator() -> Agent:
     # Create orchestrator
     orchestrator = Agent(
         name="research_orchestrator",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="Research orchestrator that coordinates the research workflow.",
         instruction="""
         You are a research orchestrator. You coordinate a team of specialist agents
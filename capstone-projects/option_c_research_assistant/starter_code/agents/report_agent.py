@@ -8,6 +8,8 @@ from google.adk.tools import FunctionTool
 from typing import Dict, Any, List
 from datetime import datetime
 
+from .models import get_model
+
 
 def format_citation(
     title: str,
@@ -95,7 +97,7 @@ def create_report_agent() -> Agent:
     
     return Agent(
         name="report_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Report generation specialist. Creates structured research reports.
         Delegate report writing and formatting tasks here.
@@ -10,6 +10,8 @@ from google.adk.tools import FunctionTool
 from typing import Dict, Any, List
 import random
 
+from .models import get_model
+
 
 # Simulated search results (replace with real API in production)
 MOCK_SEARCH_RESULTS = {
@@ -121,7 +123,7 @@ def create_search_agent() -> Agent:
     
     return Agent(
         name="search_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Search specialist agent. Handles web searches and document retrieval.
         Delegate search and information gathering tasks here.
@@ -7,6 +7,8 @@ from google.adk.agents import Agent
 from google.adk.tools import FunctionTool
 from typing import Dict, Any, List
 
+from .models import get_model
+
 
 def summarize_text(
     text: str,
@@ -58,7 +60,7 @@ def create_summarizer_agent() -> Agent:
     
     return Agent(
         name="summarizer_agent",
-        model="gemini-2.0-flash",
+        model=get_model(),
         description="""
         Summarization specialist. Condenses documents and extracts key insights.
         Delegate summarization and analysis tasks here.
@@ -9,11 +9,17 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-if not os.environ.get("GOOGLE_API_KEY"):
-    raise ValueError("Please set GOOGLE_API_KEY environment variable")
+from agents.models import requires_api_key
 
-from agents import create_research_orchestrator
-from google.adk.runners import InMemoryRunner
+# Verify API key is set (not needed when replaying a model cassette)
+if requires_api_key() and not os.environ.get("GOOGLE_API_KEY"):
+    raise ValueError(
+        "Please set GOOGLE_API_KEY environment variable "
+        "(or AGENT_MODEL_MODE=replay to run offline)"
+    )
+
+from capstone_common.console import read_input
+from server import create_server
 
 
 async def main():
@@ -24,17 +30,24 @@ async def main():
     print("=" * 60)
     print("\nInitializing agents...")
     
-    orchestrator = create_research_orchestrator()
+    # The REPL is one client of the multi-session server (see server.py)
+    server = create_server()
+    orchestrator = server.agent
     
     print(f"✅ Orchestrator '{orchestrator.name}' ready!")
     print(f"   Sub-agents: {[a.name for a in orchestrator.sub_agents]}")
     
-    runner = InMemoryRunner(agent=orchestrator)
+    await server.start()
     
-    session = await runner.session_service.create_session(
-        app_name=orchestrator.name,
-        user_id="researcher_001"
-    )
+    user_id = os.environ.get("AGENT_USER_ID", "researcher_001")
+    session_id = await server.open_session(user_id)
+    
+    # Per-turn latency footer (toggle with 'timing')
+    show_timing = os.environ.get("SHOW_TIMING", "0") == "1"
+    
+    async def show_event(event):
+        if event["event"] == "text":
+            print(event["text"], end="", flush=True)
     
     print("\n" + "=" * 60)
     print("Research Assistant - Type 'quit' to exit")
@@ -44,41 +57,51 @@ async def main():
     print("  - Find information about renewable energy trends")
     print("  - Summarize recent developments in quantum computing")
     print("  - Generate a report on climate change solutions")
+    print("  (type 'stats' for server metrics, 'timing' to toggle the")
+    print("   per-turn latency footer)")
     print()
     
-    while True:
-        try:
-            user_input = input("You: ").strip()
-            
-            if user_input.lower() in ['quit', 'exit', 'q']:
-                print("\nResearch session ended. Goodbye! 📚")
+    try:
+        while True:
+            try:
+                user_input = (await read_input("You: ")).strip()
+                
+                if user_input.lower() in ['quit', 'exit', 'q']:
+                    print("\nResearch session ended. Goodbye! 📚")
+                    break
+                
+                if not user_input:
+                    continue
+                
+                if user_input.lower() == 'stats':
+                    print(f"\nServer: {server.stats()}\n")
+                    continue
+                
+                if user_input.lower() == 'timing':
+                    show_timing = not show_timing
+                    print(f"\nTiming footer {'on' if show_timing else 'off'}\n")
+                    continue
+                
+                print("\n🔍 Researching... (this may take a moment)\n")
+                
+                print("Assistant: ", end="")
+                metrics = await server.run_turn(user_id, session_id, user_input, show_event)
+                print()
+                if show_timing:
+                    print(f"   ⏱  {metrics.summary()}")
+                print()
+                
+            except (KeyboardInterrupt, EOFError):
+                print("\n\nResearch session ended. Goodbye! 📚")
                 break
-            
-            if not user_input:
-                continue
-            
-            print("\n🔍 Researching... (this may take a moment)\n")
-            
-            response = await runner.run(
-                user_id="researcher_001",
-                session_id=session.id,
-                new_message=user_input
-            )
-            
-            print("Assistant: ", end="")
-            async for event in response:
-                if hasattr(event, 'content') and event.content:
-                    for part in event.content.parts:
-                        if hasattr(part, 'text'):
-                            print(part.text, end="")
-            print("\n")
-            
-        except KeyboardInterrupt:
-            print("\n\nResearch session ended. Goodbye! 📚")
-            break
-        except Exception as e:
-            print(f"\n❌ Error: {e}\n")
+            except Exception as e:
+                print(f"\n❌ Error: {e}\n")
+    finally:
+        await server.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
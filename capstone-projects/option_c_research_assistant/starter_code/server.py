@@ -0,0 +1,18 @@
+"""Research Assistant Multi-Session Server.
+
+The research agents served over the shared multi-session server (see
+``capstone_common.agent_server`` for the protocol). Run it with
+``python server.py``; ``main.py`` runs the same server in-process.
+"""
+
+from agents import create_research_orchestrator
+from capstone_common.agent_server import AgentServer, run_server, server_options
+
+
+def create_server() -> AgentServer:
+    """Create the server (AGENT_MAX_CONCURRENCY and AGENT_STREAMING)."""
+    return AgentServer(create_research_orchestrator(), **server_options())
+
+
+if __name__ == "__main__":
+    run_server(create_server)